@@ -1,3 +1,32 @@
 from django.contrib import admin
+from django.db import transaction
+from . import plan
+from .models import MLMLevel, BetLossSplit
 
-# Register your models here.
+
+class CommissionPlanAdmin(admin.ModelAdmin):
+    """Recompile the commission plan in every worker after an edit"""
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        transaction.on_commit(plan.bump_version)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        transaction.on_commit(plan.bump_version)
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        transaction.on_commit(plan.bump_version)
+
+
+@admin.register(MLMLevel)
+class MLMLevelAdmin(CommissionPlanAdmin):
+    list_display = ('level', 'name', 'price', 'commission_percent')
+    ordering = ('level',)
+
+
+@admin.register(BetLossSplit)
+class BetLossSplitAdmin(CommissionPlanAdmin):
+    list_display = ('recipient', 'generation', 'percent')
+    ordering = ('recipient', 'generation')
@@ -0,0 +1,84 @@
+"""
+Management command to benchmark the vectorized commission replay
+Usage: python manage.py bench_commission_simulation [--events 10000000] [--check 2000] [--seed 1]
+
+Loads the referral forest from the current database, replays --events
+synthetic bet losses (uniformly spread over users, log-normal amounts)
+through mlm.simulation, and compares it with an ORM replay of --check of
+those events through CommissionService.get_uplines and bet_loss_credits:
+totals must agree to the cent, and the ORM rate is extrapolated to the full
+event count. Nothing is written to the database. Requires numpy.
+"""
+import time
+from collections import defaultdict
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from mlm.plan import get_plan
+from wallet.services import CommissionService
+
+
+class Command(BaseCommand):
+    help = 'Measure the vectorized commission replay against an ORM replay'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=10000000, help='Synthetic bet losses to replay (default: 10000000)')
+        parser.add_argument('--check', type=int, default=2000, help='Events also replayed through the ORM (default: 2000)')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed (default: 1)')
+
+    def handle(self, *args, **options):
+        try:
+            from mlm import simulation
+        except ImportError:
+            raise CommandError('numpy is required: pip install numpy')
+        import numpy as np
+
+        started = time.perf_counter()
+        forest = simulation.Forest.load()
+        self.stdout.write(f'Loaded {forest.size:,} users in {time.perf_counter() - started:.2f}s')
+        if not forest.size:
+            raise CommandError('No users; populate the database first, e.g. with generate_referral_forest')
+
+        rng = np.random.default_rng(options['seed'])
+        events = options['events']
+        positions = rng.integers(0, forest.size, events)
+        amounts = np.round(rng.lognormal(2, 1, events), 2)
+        plan = get_plan()
+        scenario = simulation.scenario_from_plan(plan)
+
+        started = time.perf_counter()
+        flows, total = forest.flows(positions, amounts)
+        result = simulation.replay(flows, total, scenario)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'Vectorized: {events:,} events in {elapsed:.2f}s ({events / elapsed:,.0f} events/s)')
+
+        check = min(options['check'], events)
+        sample_positions, sample_amounts = positions[:check], amounts[:check]
+        sample_ids = forest.ids[sample_positions].tolist()
+        system_users = {'salary_fund': 'salary_fund', 'reserve_fund': 'reserve_fund'}
+
+        started = time.perf_counter()
+        uplines = CommissionService.get_uplines(set(sample_ids))
+        expected = defaultdict(Decimal)
+        for user_id, amount in zip(sample_ids, sample_amounts.tolist()):
+            amount = Decimal(str(amount))
+            for recipient, credit, _ in CommissionService.bet_loss_credits('', amount, uplines.get(user_id, []), system_users, plan):
+                expected[recipient] += credit
+        orm_elapsed = time.perf_counter() - started
+
+        sample_flows, sample_total = forest.flows(sample_positions, sample_amounts)
+        sample = simulation.replay(sample_flows, sample_total, scenario)
+        earning = np.flatnonzero(sample.earnings)
+        actual = dict(zip(forest.ids[earning].tolist(), sample.earnings[earning].tolist()))
+        actual.update(salary_fund=sample.salary_fund, reserve_fund=sample.reserve_fund)
+        worst = max(abs(float(expected.get(key, 0)) - actual.get(key, 0)) for key in expected.keys() | actual.keys())
+        if worst >= 0.005:
+            raise CommandError(f'Vectorized and ORM replays differ by up to {worst:.6f}')
+
+        orm_rate = check / orm_elapsed
+        self.stdout.write(
+            f'ORM replay: {check:,} events in {orm_elapsed:.2f}s ({orm_rate:,.0f} events/s), '
+            f'{events / orm_rate / 3600:.1f}h for {events:,}; largest difference {worst:.2e}'
+        )
+        self.stdout.write(f'Upline {result.generation_totals.sum():,.2f}, Salary Fund {result.salary_fund:,.2f}, '
+                          f'Reserve Fund {result.reserve_fund:,.2f} of {total:,.2f}')
+        self.stdout.write(self.style.SUCCESS(f'Vectorized replay is {events / elapsed / orm_rate:,.0f}x faster'))
@@ -0,0 +1,64 @@
+"""
+Management command to measure the per-request overhead of MetricsMiddleware
+Usage: python manage.py bench_metrics [--requests 2000] [--rounds 5]
+
+Calls the dashboard and a transaction list through the full middleware stack
+with and without MetricsMiddleware, alternating rounds so drift affects both
+sides equally, and reports the median latency difference.
+"""
+import statistics
+import time
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+from mlm_backend import metrics
+
+User = get_user_model()
+
+MIDDLEWARE_PATH = 'mlm_backend.metrics.MetricsMiddleware'
+URLS = ('/api/mlm/stats/dashboard/', '/api/wallet/transactions/')
+
+
+class Command(BaseCommand):
+    help = 'Benchmark request latency with and without the metrics middleware'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per round and setup (default: 2000)')
+        parser.add_argument('--rounds', type=int, default=5, help='Alternating rounds (default: 5)')
+
+    def run(self, middleware, user, count):
+        with override_settings(MIDDLEWARE=middleware):
+            # A new client builds its handler, and so its middleware chain, from the current settings
+            client = APIClient()
+            client.force_authenticate(user)
+            client.get(URLS[0])
+            started = time.perf_counter()
+            for i in range(count):
+                client.get(URLS[i % len(URLS)])
+            return (time.perf_counter() - started) / count
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(is_active=True, wallet__isnull=False).order_by('id').first()
+        if user is None:
+            raise CommandError('Needs at least one active user with a wallet')
+
+        with_metrics = list(settings.MIDDLEWARE)
+        if MIDDLEWARE_PATH not in with_metrics:
+            with_metrics.insert(0, MIDDLEWARE_PATH)
+        without_metrics = [path for path in with_metrics if path != MIDDLEWARE_PATH]
+
+        baseline, instrumented = [], []
+        for _ in range(options['rounds']):
+            baseline.append(self.run(without_metrics, user, options['requests']))
+            instrumented.append(self.run(with_metrics, user, options['requests']))
+        metrics.registry.reset()
+
+        base = statistics.median(baseline) * 1000
+        inst = statistics.median(instrumented) * 1000
+        self.stdout.write(f'without metrics: {base:.3f}ms per request')
+        self.stdout.write(f'with metrics:    {inst:.3f}ms per request')
+        self.stdout.write(self.style.SUCCESS(
+            f'Overhead: {(inst - base) * 1000:.1f}us per request ({(inst - base) / base:+.1%})'
+        ))
@@ -0,0 +1,188 @@
+"""
+Management command to benchmark the hot MLM paths against the current database
+Usage: python manage.py bench_mlm [--iterations 200] [--output baseline.json] [--compare baseline.json] [--tolerance 0.25]
+
+Times CommissionService.process_bet_loss and the upgrade, dashboard and tree
+endpoints, recording latency percentiles and query counts. Populate the
+database first, e.g. with generate_referral_forest and init_mlm. All writes
+happen inside a transaction that is rolled back at the end.
+
+--output writes the results as a JSON baseline; --compare checks them against
+an earlier baseline and exits with an error if p50/p99 latency grew by more
+than --tolerance or any path issues more queries.
+"""
+import json
+import platform
+import random
+import statistics
+import time
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from mlm_backend.bench import Rollback, percentile
+from mlm.models import MLMLevel
+from users.models import ReferralPath, DownlineStats
+from wallet.models import Wallet
+from wallet.services import CommissionService
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Benchmark bet-loss commissions, upgrade, dashboard and tree; save or compare a JSON baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200, help='Timed calls per path (default: 200)')
+        parser.add_argument('--warmup', type=int, default=10, help='Untimed calls per path first (default: 10)')
+        parser.add_argument('--tree-depth', type=int, default=3, help='Depth requested from the tree endpoint (default: 3)')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed for picking users (default: 1)')
+        parser.add_argument('--output', help='Write results to this JSON file')
+        parser.add_argument('--compare', help='Compare results with this JSON baseline')
+        parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed latency growth over the baseline (default: 0.25)')
+
+    def measure(self, name, calls, warmup):
+        """Run each callable once, returning latency and query count percentiles"""
+        for call in calls[:warmup]:
+            call()
+
+        latencies = []
+        queries = []
+        errors = 0
+        for call in calls[warmup:]:
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                ok = call()
+                latencies.append((time.perf_counter() - started) * 1000)
+            queries.append(len(captured))
+            errors += ok is False
+
+        latencies.sort()
+        result = {
+            'calls': len(latencies),
+            'errors': errors,
+            'p50_ms': round(percentile(latencies, 0.50), 3),
+            'p90_ms': round(percentile(latencies, 0.90), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+            'max_ms': round(latencies[-1], 3),
+            'mean_ms': round(statistics.fmean(latencies), 3),
+            'queries_median': statistics.median(queries),
+            'queries_max': max(queries),
+        }
+        self.stdout.write(
+            f"{name:<16} p50 {result['p50_ms']:>8.2f}ms  p90 {result['p90_ms']:>8.2f}ms  "
+            f"p99 {result['p99_ms']:>8.2f}ms  queries {result['queries_median']:g} (max {result['queries_max']})"
+            + (f'  errors {errors}' if errors else '')
+        )
+        return result
+
+    def sample(self, values, count, rng):
+        values = list(values)
+        if not values:
+            return []
+        return [rng.choice(values) for _ in range(count)]
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        iterations = options['iterations']
+        warmup = options['warmup']
+        total = iterations + warmup
+
+        # Bettors with a full five-level upline, and the users with the biggest networks
+        bettor_ids = ReferralPath.objects.filter(depth=5).values_list('descendant_id', flat=True)[:50000]
+        user_ids = User.objects.filter(is_active=True).values_list('id', flat=True)[:50000]
+        leader_ids = DownlineStats.objects.order_by('-total').values_list('user_id', flat=True)[:100]
+        bettors = self.sample(bettor_ids, total, rng)
+        users = self.sample(user_ids, total, rng)
+        leaders = self.sample(leader_ids, total, rng)
+        levels = list(MLMLevel.objects.values_list('level', flat=True))
+        if not users:
+            raise CommandError('No users to benchmark; run generate_referral_forest first')
+
+        client = APIClient()
+        results = {}
+
+        def bet_loss(user):
+            return lambda: CommissionService.process_bet_loss(user, Decimal('10.00'))
+
+        def request(user, method, url, data=None):
+            def call():
+                client.force_authenticate(user)
+                response = getattr(client, method)(url, data, format='json')
+                return response.status_code == 200
+            return call
+
+        try:
+            with transaction.atomic():
+                # Enough balance for every upgrade, undone with everything else
+                Wallet.objects.filter(user_id__in=set(users)).update(balance=Decimal('1000000'))
+                by_id = User.objects.in_bulk(set(bettors) | set(users) | set(leaders))
+
+                if bettors:
+                    results['process_bet_loss'] = self.measure(
+                        'process_bet_loss', [bet_loss(by_id[user_id]) for user_id in bettors], warmup)
+                else:
+                    self.stderr.write(self.style.WARNING('No user has a five-level upline; skipping process_bet_loss'))
+
+                if levels:
+                    results['upgrade'] = self.measure('upgrade', [
+                        request(by_id[user_id], 'post', '/api/mlm/program/upgrade/', {'level_id': rng.choice(levels)})
+                        for user_id in users
+                    ], warmup)
+                else:
+                    self.stderr.write(self.style.WARNING('No MLM levels (run init_mlm); skipping upgrade'))
+
+                results['dashboard'] = self.measure('dashboard', [
+                    request(by_id[user_id], 'get', '/api/mlm/stats/dashboard/') for user_id in users
+                ], warmup)
+                results['tree'] = self.measure('tree', [
+                    request(by_id[user_id], 'get', '/api/mlm/stats/tree/', {'depth': options['tree_depth']})
+                    for user_id in leaders
+                ], warmup)
+
+                raise Rollback
+        except Rollback:
+            pass
+
+        report = {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'vendor': connection.vendor,
+                'python': platform.python_version(),
+                'users': User.objects.count(),
+                'referral_paths': ReferralPath.objects.count(),
+                'iterations': iterations,
+                'tree_depth': options['tree_depth'],
+            },
+            'results': results,
+        }
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['output']}"))
+
+        if options['compare']:
+            self.compare(report, options['compare'], options['tolerance'])
+
+    def compare(self, report, path, tolerance):
+        with open(path) as f:
+            baseline = json.load(f)
+
+        regressions = []
+        for name, result in report['results'].items():
+            base = baseline['results'].get(name)
+            if not base:
+                continue
+            for key in ('p50_ms', 'p99_ms'):
+                if result[key] > base[key] * (1 + tolerance):
+                    regressions.append(f'{name}: {key} {base[key]:.2f} -> {result[key]:.2f}')
+            if result['queries_max'] > base['queries_max']:
+                regressions.append(f"{name}: queries {base['queries_max']} -> {result['queries_max']}")
+
+        if regressions:
+            raise CommandError('Regressions against baseline:\n  ' + '\n  '.join(regressions))
+        self.stdout.write(self.style.SUCCESS(f'No regressions against {path} (tolerance {tolerance:.0%})'))
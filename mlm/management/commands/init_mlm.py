@@ -1,8 +1,10 @@
 from django.core.management.base import BaseCommand
-from mlm.models import MLMLevel
+from django.db import transaction
+from mlm import plan
+from mlm.models import MLMLevel, BetLossSplit
 
 class Command(BaseCommand):
-    help = 'Initialize MLM Levels'
+    help = 'Initialize MLM Levels and the bet loss split'
 
     def handle(self, *args, **kwargs):
         levels = [
@@ -16,3 +18,9 @@ class Command(BaseCommand):
         for data in levels:
             MLMLevel.objects.update_or_create(level=data['level'], defaults=data)
             self.stdout.write(self.style.SUCCESS(f"Level {data['level']} initialized"))
+
+        with transaction.atomic():
+            for (recipient, generation), percent in plan.DEFAULT_BET_LOSS_SPLIT.items():
+                BetLossSplit.objects.get_or_create(recipient=recipient, generation=generation, defaults={'percent': percent})
+            transaction.on_commit(plan.bump_version)
+        self.stdout.write(self.style.SUCCESS('Bet loss split initialized'))
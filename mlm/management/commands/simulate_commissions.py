@@ -0,0 +1,104 @@
+"""
+Management command to replay past bet losses under alternative commission splits
+Usage: python manage.py simulate_commissions --split NAME=G1,G2,G3,G4,G5,SALARY,RESERVE [--split ...]
+       [--start 2025-07-01] [--end 2025-09-30] [--output totals.csv] [--top 10]
+
+Replays the completed bet losses between --start and --end through the
+5-generation split of CommissionService.process_bet_loss, once with the
+current commission plan and once per --split (percentages of the lost
+amount, adding up to 100), and reports per-fund and per-generation totals
+and the users whose earnings change most. --output writes every user's
+earnings per scenario as CSV.
+
+The replay is vectorized with NumPy over the referral forest as it is now
+(see mlm.simulation) and never writes to the database. Requires numpy.
+"""
+import time
+from django.core.management.base import BaseCommand, CommandError
+from mlm.plan import GENERATIONS, get_plan
+from wallet import export
+
+
+class Command(BaseCommand):
+    help = 'Replay bet loss commissions under alternative rate tables and report per-user and per-fund totals'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--split', action='append', default=[], metavar='NAME=G1,G2,G3,G4,G5,SALARY,RESERVE',
+                            help='Alternative split in percent; may be repeated')
+        parser.add_argument('--start', help='Earliest loss, ISO date or datetime (inclusive)')
+        parser.add_argument('--end', help='Latest loss, ISO date or datetime (a bare date includes that day)')
+        parser.add_argument('--output', help='Write per-user earnings for every scenario to this CSV file')
+        parser.add_argument('--top', type=int, default=10, help='Users with the largest change to list per split (default: 10)')
+
+    def handle(self, *args, **options):
+        try:
+            from mlm import simulation
+        except ImportError:
+            raise CommandError('numpy is required: pip install numpy')
+        import numpy as np
+
+        try:
+            start = export.parse_bound(options['start']) if options['start'] else None
+            end = export.parse_bound(options['end'], end=True) if options['end'] else None
+            scenarios = [simulation.scenario_from_plan(get_plan())]
+            scenarios += [simulation.parse_scenario(text) for text in options['split']]
+        except ValueError as e:
+            raise CommandError(str(e))
+        names = [scenario.name for scenario in scenarios]
+        if len(set(names)) < len(names):
+            raise CommandError('Scenario names must be unique (and not "current")')
+
+        started = time.perf_counter()
+        forest = simulation.Forest.load()
+        self.stderr.write(f'Loaded {forest.size:,} users in {time.perf_counter() - started:.2f}s')
+
+        started = time.perf_counter()
+        positions, amounts = simulation.load_losses(forest, start, end)
+        self.stderr.write(f'Loaded losses of {len(amounts):,} users in {time.perf_counter() - started:.2f}s')
+
+        started = time.perf_counter()
+        flows, total = forest.flows(positions, amounts)
+        results = [simulation.replay(flows, total, scenario) for scenario in scenarios]
+        self.stderr.write(f'Replayed {len(results)} scenarios in {time.perf_counter() - started:.2f}s')
+
+        current = results[0]
+        self.stdout.write(f'Total lost: {total:,.2f}')
+        self.stdout.write(f"{'':<14}" + ''.join(f'{name:>18}' for name in names))
+        rows = [(f'Generation {generation + 1}', [result.generation_totals[generation] for result in results])
+                for generation in range(GENERATIONS)]
+        rows += [
+            ('Upline total', [result.generation_totals.sum() for result in results]),
+            ('Salary Fund', [result.salary_fund for result in results]),
+            ('Reserve Fund', [result.reserve_fund for result in results]),
+        ]
+        for label, values in rows:
+            self.stdout.write(f'{label:<14}' + ''.join(f'{value:>18,.2f}' for value in values))
+
+        for result in results[1:]:
+            change = result.earnings - current.earnings
+            self.stdout.write(
+                f'{result.scenario.name}: {np.count_nonzero(change > 0.005):,} users earn more, '
+                f'{np.count_nonzero(change < -0.005):,} earn less'
+            )
+            for position in np.argsort(-np.abs(change))[:options['top']]:
+                if abs(change[position]) < 0.005:
+                    break
+                self.stdout.write(
+                    f'  user {forest.ids[position]}: {current.earnings[position]:,.2f} -> '
+                    f'{result.earnings[position]:,.2f} ({change[position]:+,.2f})'
+                )
+
+        if options['output']:
+            earnings = np.column_stack([result.earnings for result in results])
+            earning = earnings.any(axis=1)
+            np.savetxt(
+                options['output'],
+                np.column_stack([forest.ids[earning], earnings[earning]]),
+                fmt=['%d'] + ['%.8f'] * len(results),
+                delimiter=',',
+                header=','.join(['user_id'] + names),
+                comments='',
+            )
+            self.stderr.write(f"Wrote {np.count_nonzero(earning):,} users to {options['output']}")
+
+        self.stdout.write(self.style.SUCCESS(f'Simulated {len(results) - 1} alternative splits'))
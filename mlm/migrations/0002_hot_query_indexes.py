@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mlm', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='commission',
+            index=models.Index(fields=['user', 'amount'], name='commission_user_amount_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mlm', '0002_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BetLossSplit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipient', models.CharField(choices=[('GENERATION', 'Upline generation'), ('SALARY_FUND', 'Salary Fund'), ('RESERVE_FUND', 'Reserve Fund')], max_length=20)),
+                ('generation', models.PositiveSmallIntegerField(default=0, help_text='Upline generation (1-5) for GENERATION, 0 for the funds')),
+                ('percent', models.DecimalField(decimal_places=3, help_text='Percentage of the lost amount (e.g., 11 for 11%)', max_digits=6)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('recipient', 'generation'), name='unique_bet_loss_split')],
+            },
+        ),
+    ]
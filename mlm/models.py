@@ -10,6 +10,28 @@ class MLMLevel(models.Model):
     def __str__(self):
         return f"Level {self.level} - {self.name}"
 
+class BetLossSplit(models.Model):
+    """Share of a lost bet paid to an upline generation or a system fund; shares must add up to 100"""
+    RECIPIENT_CHOICES = (
+        ('GENERATION', 'Upline generation'),
+        ('SALARY_FUND', 'Salary Fund'),
+        ('RESERVE_FUND', 'Reserve Fund'),
+    )
+
+    recipient = models.CharField(max_length=20, choices=RECIPIENT_CHOICES)
+    generation = models.PositiveSmallIntegerField(default=0, help_text="Upline generation (1-5) for GENERATION, 0 for the funds")
+    percent = models.DecimalField(max_digits=6, decimal_places=3, help_text="Percentage of the lost amount (e.g., 11 for 11%)")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['recipient', 'generation'], name='unique_bet_loss_split'),
+        ]
+
+    def __str__(self):
+        if self.recipient == 'GENERATION':
+            return f"Generation {self.generation}: {self.percent}%"
+        return f"{self.get_recipient_display()}: {self.percent}%"
+
 class UserLevel(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='mlm_level')
     current_level = models.ForeignKey(MLMLevel, on_delete=models.SET_NULL, null=True, blank=True)
@@ -25,5 +47,11 @@ class Commission(models.Model):
     level = models.IntegerField(help_text="Generation level (1-5)")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Covers SUM(amount) per user without touching the table
+            models.Index(fields=['user', 'amount'], name='commission_user_amount_idx'),
+        ]
+
     def __str__(self):
         return f"{self.amount} to {self.user.username} from {self.source_user.username} (L{self.level})"
@@ -0,0 +1,83 @@
+"""
+Compiled commission plan.
+
+MLMLevel rows (upgrade prices, and the upgrade commission paid to generation
+N as level N's commission_percent) and the BetLossSplit table are loaded with
+two queries into one immutable Plan per process. Every rate is precomputed as
+a Decimal fraction, so commission code only multiplies: no lookups and no
+conversions per bet or upgrade.
+
+The Plan is held in a VersionedCache: admin edits and init_mlm bump its
+version once their transaction commits, so every worker sharing the cache
+recompiles within VERSION_CHECK_INTERVAL seconds. With the default
+local-memory cache other workers recompile after MAX_AGE seconds.
+"""
+import logging
+from collections import namedtuple
+from decimal import Decimal
+from mlm_backend.versioned_cache import VersionedCache
+from .models import MLMLevel, BetLossSplit
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'commission_plan:version'
+VERSION_CHECK_INTERVAL = 1
+MAX_AGE = 60
+GENERATIONS = 5
+
+# Upgrade commission percent per generation, used where no MLMLevel with that number exists
+DEFAULT_UPGRADE_PERCENTS = {1: Decimal('10'), 2: Decimal('8'), 3: Decimal('5'), 4: Decimal('3'), 5: Decimal('2')}
+
+# Used while BetLossSplit is empty, or if its rows are incomplete or do not add up to 100%
+DEFAULT_BET_LOSS_SPLIT = {
+    ('GENERATION', 1): Decimal('11'),
+    ('GENERATION', 2): Decimal('9'),
+    ('GENERATION', 3): Decimal('2'),
+    ('GENERATION', 4): Decimal('1.5'),
+    ('GENERATION', 5): Decimal('1.5'),
+    ('SALARY_FUND', 0): Decimal('10'),
+    ('RESERVE_FUND', 0): Decimal('65'),
+}
+
+Level = namedtuple('Level', 'id level name price')
+
+
+class Plan:
+    """Levels and commission rates as of one version; rates are fractions of the amount"""
+
+    def __init__(self, levels, split, version):
+        hundred = Decimal('100')
+        self.version = version
+        self.levels = {level.level: Level(level.id, level.level, level.name, level.price) for level in levels}
+        percents = dict(DEFAULT_UPGRADE_PERCENTS)
+        percents.update((level.level, level.commission_percent) for level in levels)
+        # upgrade_rates[n] is paid to generation n + 1
+        self.upgrade_rates = tuple(percents[generation] / hundred for generation in range(1, GENERATIONS + 1))
+        self.bet_loss_rates = tuple(split['GENERATION', generation] / hundred for generation in range(1, GENERATIONS + 1))
+        self.salary_rate = split['SALARY_FUND', 0] / hundred
+        # reserve_rates[n]: Reserve Fund share when the loser has n upline members;
+        # the shares of the missing generations roll over into it
+        reserve_rate = split['RESERVE_FUND', 0] / hundred
+        self.reserve_rates = tuple(reserve_rate + sum(self.bet_loss_rates[n:], Decimal('0')) for n in range(GENERATIONS + 1))
+
+
+def compile_plan(version):
+    split = {(recipient, generation): percent for recipient, generation, percent
+             in BetLossSplit.objects.values_list('recipient', 'generation', 'percent')}
+    if not split:
+        split = DEFAULT_BET_LOSS_SPLIT
+    elif split.keys() != DEFAULT_BET_LOSS_SPLIT.keys() or sum(split.values()) != 100:
+        logger.error('Bet loss split is incomplete or does not add up to 100%%, using the default split: %s', split)
+        split = DEFAULT_BET_LOSS_SPLIT
+    return Plan(list(MLMLevel.objects.order_by('level')), split, version)
+
+
+_cache = VersionedCache(VERSION_KEY, compile_plan, MAX_AGE, VERSION_CHECK_INTERVAL)
+get_version = _cache.get_version
+bump_version = _cache.bump_version
+invalidate = _cache.invalidate
+
+
+def get_plan():
+    """Return the current Plan, recompiling it if it was invalidated, is outdated or older than MAX_AGE"""
+    return _cache.get()
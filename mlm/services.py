@@ -0,0 +1,105 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, Window
+from django.db.models.functions import RowNumber
+from users.models import ReferralPath
+
+User = get_user_model()
+
+class ReferralTreeService:
+    DEFAULT_DEPTH = 3
+    MAX_DEPTH = 10
+    DEFAULT_PAGE_SIZE = 20
+    MAX_PAGE_SIZE = 100
+
+    @staticmethod
+    def is_in_subtree(root, user_id):
+        """True if `user_id` is `root` itself or one of its descendants"""
+        return user_id == root.id or ReferralPath.objects.filter(ancestor=root, descendant_id=user_id).exists()
+
+    @staticmethod
+    def make_node(user_id, username, level, investment, active):
+        return {
+            'id': user_id,
+            'username': username,
+            'level': level or 0,
+            'investment': investment or 0,
+            'active': active,
+            'childrenCount': 0,
+            'children': []
+        }
+
+    @staticmethod
+    def build(root_id, depth=DEFAULT_DEPTH, page_size=DEFAULT_PAGE_SIZE, offset=0, root_username=None):
+        """
+        Build the referral tree below `root_id`, one query per generation.
+
+        Each node lists at most `page_size` children (ordered by id); the root's
+        children start after `offset`. `childrenCount` always holds the real number
+        of direct referrals so clients can request further pages per node.
+        """
+        root = User.objects.filter(pk=root_id).values(
+            'id', 'username', 'is_active',
+            'mlm_level__current_level__level', 'mlm_level__current_level__price'
+        ).first()
+        if root is None:
+            return None
+
+        root_node = ReferralTreeService.make_node(
+            root['id'],
+            root_username or root['username'],
+            root['mlm_level__current_level__level'],
+            root['mlm_level__current_level__price'],
+            root['is_active']
+        )
+        nodes = {root['id']: root_node}
+        frontier = [root['id']]
+
+        for generation in range(1, depth + 1):
+            start = offset if generation == 1 else 0
+            rows = (
+                User.objects.filter(referrer_id__in=frontier)
+                .annotate(
+                    position=Window(RowNumber(), partition_by=F('referrer_id'), order_by=F('id').asc()),
+                    siblings=Window(Count('id'), partition_by=F('referrer_id'))
+                )
+                .filter(position__gt=start, position__lte=start + page_size)
+                .order_by('referrer_id', 'id')
+                .values(
+                    'id', 'username', 'is_active', 'referrer_id', 'siblings',
+                    'mlm_level__current_level__level', 'mlm_level__current_level__price'
+                )
+            )
+
+            frontier = []
+            for row in rows:
+                node = ReferralTreeService.make_node(
+                    row['id'],
+                    row['username'],
+                    row['mlm_level__current_level__level'],
+                    row['mlm_level__current_level__price'],
+                    row['is_active']
+                )
+                parent = nodes[row['referrer_id']]
+                parent['children'].append(node)
+                parent['childrenCount'] = row['siblings']
+                nodes[row['id']] = node
+                frontier.append(row['id'])
+
+            if not frontier:
+                break
+        else:
+            # Nodes on the last generation: report how many children lie beyond the requested depth
+            counts = (
+                User.objects.filter(referrer_id__in=frontier)
+                .values('referrer_id')
+                .annotate(total=Count('id'))
+                .order_by()
+            )
+            for row in counts:
+                nodes[row['referrer_id']]['childrenCount'] = row['total']
+
+        if offset and depth and not root_node['children']:
+            # The root's page starts past its last child, so no row carried the count
+            root_node['childrenCount'] = User.objects.filter(referrer_id=root_id).count()
+
+        return root_node
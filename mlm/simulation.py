@@ -0,0 +1,163 @@
+"""
+Vectorized what-if replay of the bet loss commission split.
+
+The referral forest is loaded once as an integer parent array (users are
+addressed by their position in the sorted id array, with one extra sentinel
+position standing for "no referrer"), and the ancestors of every user for
+generations 1-5 are found by indexing the parent array five times.
+
+Because the split is linear in the lost amount, the replay never loops over
+events: losses are summed per user with one bincount, then pushed up one
+generation per bincount. The resulting flows do not depend on the rates, so
+each scenario only costs a few vector multiply-adds. Whatever lands on the
+sentinel is the share of a missing upline member, which rolls over into the
+Reserve Fund exactly as CommissionService.bet_loss_credits does.
+
+Amounts are float64 here, so totals can differ from a Decimal replay by
+fractions of a cent; the ledger stays the source of truth.
+"""
+from collections import namedtuple
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Sum, Value
+from django.db.models.functions import Coalesce
+from wallet.models import Transaction
+from .plan import GENERATIONS
+
+User = get_user_model()
+
+FETCH_SIZE = 100000
+
+Scenario = namedtuple('Scenario', 'name generation_rates salary_rate reserve_rate')
+Result = namedtuple('Result', 'scenario earnings generation_totals salary_fund reserve_fund')
+
+
+def scenario_from_plan(plan, name='current'):
+    """Scenario for a compiled mlm.plan.Plan"""
+    return Scenario(
+        name,
+        np.array([float(rate) for rate in plan.bet_loss_rates]),
+        float(plan.salary_rate),
+        float(plan.reserve_rates[len(plan.bet_loss_rates)]),
+    )
+
+
+def parse_scenario(text):
+    """
+    Parse NAME=G1,G2,G3,G4,G5,SALARY,RESERVE (percentages adding up to 100).
+    Raises ValueError if malformed.
+    """
+    name, sep, percents = text.partition('=')
+    if not sep or not name:
+        raise ValueError(f'Expected NAME=G1,...,G{GENERATIONS},SALARY,RESERVE, got {text!r}')
+    try:
+        values = [float(value) for value in percents.split(',')]
+    except ValueError:
+        raise ValueError(f'Invalid percentage in {text!r}')
+    if len(values) != GENERATIONS + 2:
+        raise ValueError(f'{name}: expected {GENERATIONS + 2} percentages, got {len(values)}')
+    if min(values) < 0 or abs(sum(values) - 100) > 1e-9:
+        raise ValueError(f'{name}: percentages must be non-negative and add up to 100')
+    rates = np.array(values) / 100
+    return Scenario(name, rates[:GENERATIONS], rates[GENERATIONS], rates[GENERATIONS + 1])
+
+
+def fetch_array(queryset, columns, dtype, fetch_size=FETCH_SIZE):
+    """
+    Run a values_list() queryset on a raw cursor and return its rows as a
+    (rows, columns) array, skipping Django's per-row conversions.
+    """
+    sql, params = queryset.query.sql_with_params()
+    chunks = []
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            chunks.append(np.array(rows, dtype=dtype))
+    if not chunks:
+        return np.empty((0, columns), dtype=dtype)
+    return np.concatenate(chunks)
+
+
+class Forest:
+    """Referral forest as parent and ancestor index arrays"""
+
+    def __init__(self, ids, referrer_ids):
+        """`ids` sorted ascending; `referrer_ids` aligned with it, 0 for none"""
+        self.ids = ids
+        self.size = len(ids)
+        index_type = np.int32 if self.size < np.iinfo(np.int32).max else np.int64
+
+        # Position `size` is the sentinel: the parent of roots and of itself
+        parent = np.full(self.size + 1, self.size, dtype=index_type)
+        parent[:self.size] = self.index(referrer_ids)
+
+        # ancestors[g][i]: position of the generation g + 1 referrer of user i
+        self.ancestors = np.empty((GENERATIONS, self.size + 1), dtype=index_type)
+        current = np.arange(self.size + 1, dtype=index_type)
+        for generation in range(GENERATIONS):
+            current = parent[current]
+            self.ancestors[generation] = current
+
+    @classmethod
+    def load(cls):
+        """Load every user's id and referrer id with one query"""
+        rows = fetch_array(
+            User.objects.order_by('pk').values_list('pk', Coalesce('referrer_id', Value(0))), 2, np.int64
+        )
+        return cls(rows[:, 0], rows[:, 1])
+
+    def index(self, user_ids):
+        """Positions of `user_ids`; unknown ids (and 0) map to the sentinel"""
+        positions = np.searchsorted(self.ids, user_ids)
+        found = positions < self.size
+        found[found] = self.ids[positions[found]] == user_ids[found]
+        positions[~found] = self.size
+        return positions
+
+    def flows(self, positions, amounts):
+        """
+        Lost amounts reaching each generation: flows[g][i] is the total lost by
+        the generation g + 1 downline of user i, and flows[g][size] the part
+        with no such upline member. Returns (flows, total lost).
+        """
+        losses = np.bincount(positions, weights=amounts, minlength=self.size + 1)
+        flows = np.empty((GENERATIONS, self.size + 1))
+        for generation in range(GENERATIONS):
+            flows[generation] = np.bincount(self.ancestors[generation], weights=losses, minlength=self.size + 1)
+        return flows, losses.sum()
+
+
+def replay(flows, total, scenario):
+    """Split `total` lost amount over upline members and funds under `scenario`"""
+    size = flows.shape[1] - 1
+    earnings = scenario.generation_rates @ flows[:, :size]
+    generation_totals = scenario.generation_rates * flows[:, :size].sum(axis=1)
+    rolled_over = scenario.generation_rates @ flows[:, size]
+    return Result(
+        scenario,
+        earnings,
+        generation_totals,
+        total * scenario.salary_rate,
+        total * scenario.reserve_rate + rolled_over,
+    )
+
+
+def load_losses(forest, start=None, end=None):
+    """
+    Completed bet losses in [start, end), summed per user by the database.
+    Returns (positions, amounts) columns for Forest.flows().
+    """
+    queryset = Transaction.objects.filter(transaction_type='BET_LOSS', status='COMPLETED')
+    if start:
+        queryset = queryset.filter(created_at__gte=start)
+    if end:
+        queryset = queryset.filter(created_at__lt=end)
+    rows = fetch_array(
+        queryset.order_by().values('user_id').annotate(total=Sum('amount')).values_list('user_id', 'total'),
+        2, np.float64,
+    )
+    return forest.index(rows[:, 0].astype(np.int64)), rows[:, 1]
@@ -2,9 +2,10 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from .models import MLMLevel, UserLevel, Commission
-from wallet.models import Wallet, Transaction
-from django.db.models import Sum
+from django.contrib.auth import get_user_model
+from .services import ReferralTreeService
+
+User = get_user_model()
 
 class StatsViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
@@ -12,68 +13,64 @@ class StatsViewSet(viewsets.ViewSet):
     @action(detail=False, methods=['get'])
     def dashboard(self, request):
         user = request.user
-        wallet, _ = Wallet.objects.get_or_create(user=user)
-        
-        # Calculate stats
-        total_earnings = Commission.objects.filter(user=user).aggregate(Sum('amount'))['amount__sum'] or 0
-        
-        total_deposit = Transaction.objects.filter(
-            user=user, 
-            transaction_type='DEPOSIT', 
-            status='COMPLETED'
-        ).aggregate(Sum('amount'))['amount__sum'] or 0
         
-        total_withdrawal = Transaction.objects.filter(
-            user=user, 
-            transaction_type='WITHDRAWAL', 
-            status='COMPLETED'
-        ).aggregate(Sum('amount'))['amount__sum'] or 0
+        # Wallet, running totals and network counters in one primary-key lookup
+        stats = User.objects.filter(pk=user.pk).values(
+            'wallet__balance',
+            'financial_summary__total_earnings',
+            'financial_summary__total_deposit',
+            'financial_summary__total_withdrawal',
+            'financial_summary__total_investment',
+            'downline_stats__generation_1',
+            'downline_stats__total',
+        ).first()
         
-        total_investment = UserLevel.objects.filter(user=user).aggregate(Sum('current_level__price'))['current_level__price__sum'] or 0
-        
-        # Network stats (simplified for now, ideally recursive or pre-calculated)
-        direct_referrals = user.referrals.count()
-        # Indirect would need recursive query or MPTT
+        total_earnings = stats['financial_summary__total_earnings'] or 0
+        direct_referrals = stats['downline_stats__generation_1'] or 0
+        indirect_referrals = (stats['downline_stats__total'] or 0) - direct_referrals
         
         return Response({
-            'balance': wallet.balance,
+            'balance': stats['wallet__balance'] or 0,
             'totalEarnings': total_earnings,
-            'totalDeposit': total_deposit,
-            'totalWithdrawal': total_withdrawal,
-            'totalInvestment': total_investment,
+            'totalDeposit': stats['financial_summary__total_deposit'] or 0,
+            'totalWithdrawal': stats['financial_summary__total_withdrawal'] or 0,
+            'totalInvestment': stats['financial_summary__total_investment'] or 0,
             'directUsers': direct_referrals,
-            'indirectUsers': 0, # Placeholder for heavy query
+            'indirectUsers': indirect_referrals,
             'totalCommission': total_earnings
         })
 
     @action(detail=False, methods=['get'])
     def tree(self, request):
-        # Build hierarchy for the referral tree component
+        """
+        Build hierarchy for the referral tree component.
+
+        Query params: depth (generations, default 3), page_size (children per node),
+        parent (a node in your network to expand) and offset (skip that node's first children).
+        """
         user = request.user
-        
-        def build_tree(current_user, depth=1):
-            if depth > 3: # Limit depth for performance
-                return []
-            
-            children = []
-            for ref in current_user.referrals.all():
-                children.append({
-                    'id': ref.id,
-                    'username': ref.username,
-                    'level': ref.user_level.current_level.level if hasattr(ref, 'user_level') else 0,
-                    'investment': 0, # calculate if needed
-                    'active': ref.is_active,
-                    'children': build_tree(ref, depth + 1)
-                })
-            return children
 
-        tree_data = {
-            'id': user.id,
-            'username': 'You',
-            'level': user.user_level.current_level.level if hasattr(user, 'user_level') else 0,
-            'investment': 0,
-            'active': True,
-            'children': build_tree(user)
-        }
-        
+        try:
+            depth = int(request.query_params.get('depth', ReferralTreeService.DEFAULT_DEPTH))
+            page_size = int(request.query_params.get('page_size', ReferralTreeService.DEFAULT_PAGE_SIZE))
+            offset = int(request.query_params.get('offset', 0))
+            parent_id = int(request.query_params.get('parent', user.id))
+        except ValueError:
+            return Response({'error': 'Invalid tree parameters'}, status=status.HTTP_400_BAD_REQUEST)
+
+        depth = max(0, min(depth, ReferralTreeService.MAX_DEPTH))
+        page_size = max(1, min(page_size, ReferralTreeService.MAX_PAGE_SIZE))
+        offset = max(0, offset)
+
+        if not ReferralTreeService.is_in_subtree(user, parent_id):
+            return Response({'error': 'Node is not in your network'}, status=status.HTTP_404_NOT_FOUND)
+
+        tree_data = ReferralTreeService.build(
+            parent_id,
+            depth=depth,
+            page_size=page_size,
+            offset=offset,
+            root_username='You' if parent_id == user.id else None
+        )
+
         return Response(tree_data)
@@ -1,3 +1,343 @@
+import os
+import tempfile
+import unittest
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from mlm_backend import metrics
+from wallet.models import Wallet, Transaction, UserSummary
+from wallet.services import CommissionService
+from wallet.tests import create_chain
+from users.models import ReferralPath, DownlineStats
+from . import plan
+try:
+    import numpy
+except ImportError:
+    numpy = None
+from .models import MLMLevel, UserLevel, Commission, BetLossSplit
 
-# Create your tests here.
+User = get_user_model()
+
+
+class UpgradeCommissionTests(TestCase):
+    def setUp(self):
+        MLMLevel.objects.create(level=1, name='Starter', price=Decimal('100.00'), commission_percent=10)
+        plan.invalidate()
+        self.client = APIClient()
+
+    def upgrade(self, user):
+        self.client.force_authenticate(user)
+        return self.client.post('/api/mlm/program/upgrade/', {'level_id': 1}, format='json')
+
+    def test_upgrade_credits_upline(self):
+        users = create_chain(7)
+
+        response = self.upgrade(users[-1])
+
+        self.assertEqual(response.status_code, 200)
+        rates = {5: '10', 4: '8', 3: '5', 2: '3', 1: '2'}
+        for idx, credit in rates.items():
+            self.assertEqual(Wallet.objects.get(user=users[idx]).balance, Decimal('100.00') + Decimal(credit))
+        self.assertEqual(Wallet.objects.get(user=users[0]).balance, Decimal('100.00'))
+        self.assertEqual(Commission.objects.filter(source_user=users[-1]).count(), 5)
+
+    def test_constant_queries_per_upgrade(self):
+        # The first request compiles the commission plan
+        plan.get_plan()
+        counts = {}
+        for depth in (1, 3, 5, 8):
+            user = create_chain(depth + 1, prefix=f'd{depth}_')[-1]
+            user = User.objects.get(pk=user.pk)
+            with CaptureQueriesContext(connection) as ctx:
+                self.upgrade(user)
+            counts[depth] = len(ctx.captured_queries)
+
+        self.assertEqual(len(set(counts.values())), 1, counts)
+
+
+class ReferralTreeTests(TestCase):
+    def setUp(self):
+        self.level = MLMLevel.objects.create(level=2, name='Bronze', price=Decimal('200.00'), commission_percent=8)
+        plan.invalidate()
+        self.client = APIClient()
+
+    def add_referrals(self, referrer, count, prefix):
+        users = []
+        for i in range(count):
+            user = User.objects.create_user(username=f'{prefix}{i}', email=f'{prefix}{i}@test.local', referrer=referrer)
+            ReferralPath.objects.add_user(user)
+            users.append(user)
+        return users
+
+    def test_tree_levels_and_pagination(self):
+        root = User.objects.create_user(username='root', email='root@test.local')
+        children = self.add_referrals(root, 5, 'c')
+        grandchildren = self.add_referrals(children[0], 3, 'g')
+        self.add_referrals(grandchildren[0], 2, 'gg')
+        UserLevel.objects.create(user=children[0], current_level=self.level)
+
+        self.client.force_authenticate(root)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/mlm/stats/tree/', {'depth': 2, 'page_size': 2})
+        self.assertEqual(response.status_code, 200)
+
+        tree = response.data
+        self.assertEqual(tree['username'], 'You')
+        self.assertEqual(tree['childrenCount'], 5)
+        self.assertEqual([node['id'] for node in tree['children']], [children[0].id, children[1].id])
+
+        first = tree['children'][0]
+        self.assertEqual(first['level'], 2)
+        self.assertEqual(first['investment'], Decimal('200.00'))
+        self.assertEqual(first['childrenCount'], 3)
+        self.assertEqual(len(first['children']), 2)
+        # Beyond the requested depth only the count is reported
+        self.assertEqual(first['children'][0]['childrenCount'], 2)
+        self.assertEqual(first['children'][0]['children'], [])
+        # Root + one query per generation + leaf counts, regardless of width
+        self.assertLessEqual(len(ctx.captured_queries), 5)
+
+        response = self.client.get('/api/mlm/stats/tree/', {'depth': 1, 'page_size': 2, 'offset': 2})
+        self.assertEqual([node['id'] for node in response.data['children']], [children[2].id, children[3].id])
+        self.assertEqual(response.data['childrenCount'], 5)
+
+        response = self.client.get('/api/mlm/stats/tree/', {'depth': 1, 'page_size': 2, 'offset': 6})
+        self.assertEqual((response.data['children'], response.data['childrenCount']), ([], 5))
+
+        response = self.client.get('/api/mlm/stats/tree/', {'depth': 1, 'parent': children[0].id})
+        self.assertEqual(len(response.data['children']), 3)
+
+    def test_tree_rejects_nodes_outside_network(self):
+        root = User.objects.create_user(username='root', email='root@test.local')
+        other = User.objects.create_user(username='other', email='other@test.local')
+
+        self.client.force_authenticate(root)
+        response = self.client.get('/api/mlm/stats/tree/', {'parent': other.id})
+        self.assertEqual(response.status_code, 404)
+
+
+class DashboardTotalsTests(TestCase):
+    def setUp(self):
+        MLMLevel.objects.create(level=1, name='Starter', price=Decimal('100.00'), commission_percent=10)
+        plan.invalidate()
+        self.client = APIClient()
+
+    def test_totals_follow_money_movements(self):
+        referrer, user = create_chain(2)
+        admin = User.objects.create_user(username='admin', email='admin@test.local', is_staff=True)
+        deposit = Transaction.objects.create(user=user, amount=Decimal('50'), transaction_type='DEPOSIT')
+
+        self.client.force_authenticate(admin)
+        self.client.post(f'/api/wallet/transactions/{deposit.pk}/approve_deposit/')
+        user = User.objects.get(pk=user.pk)
+        self.client.force_authenticate(user)
+        self.client.post('/api/mlm/program/upgrade/', {'level_id': 1}, format='json')
+
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get('/api/mlm/stats/dashboard/').data
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(data['balance'], Decimal('50'))
+        self.assertEqual(data['totalDeposit'], Decimal('50'))
+        self.assertEqual(data['totalWithdrawal'], Decimal('100'))
+        self.assertEqual(data['totalInvestment'], Decimal('100'))
+
+        self.client.force_authenticate(referrer)
+        self.assertEqual(self.client.get('/api/mlm/stats/dashboard/').data['totalEarnings'], Decimal('10'))
+
+        out = StringIO()
+        call_command('rebuild_user_summaries', verify=True, stdout=out)
+        self.assertIn('match raw history', out.getvalue())
+
+    def test_migration_backfills_summaries_and_verify_ignores_extra_places(self):
+        from django.apps import apps
+        referrer, user = create_chain(2)
+        Transaction.objects.create(user=user, amount=Decimal('50'), transaction_type='DEPOSIT', status='COMPLETED')
+        Commission.objects.create(user=referrer, source_user=user, amount=Decimal('1.13'), level=1)
+        UserSummary.objects.all().delete()
+
+        import_module('wallet.migrations.0011_backfill_user_summaries').backfill(apps, None)
+        self.assertEqual(UserSummary.objects.get(user=user).total_deposit, Decimal('50'))
+        self.assertEqual(UserSummary.objects.get(user=referrer).total_earnings, Decimal('1.13'))
+
+        # The credit kept 8 places; the Commission row was rounded to 2
+        UserSummary.objects.filter(user=referrer).update(total_earnings=Decimal('1.12500001'))
+        out = StringIO()
+        call_command('rebuild_user_summaries', verify=True, stdout=out)
+        self.assertIn('match raw history', out.getvalue())
+
+
+class SyntheticForestTests(TestCase):
+    def test_generated_forest_matches_rebuilds(self):
+        call_command('init_mlm', stdout=StringIO())
+        call_command('generate_referral_forest', '--users', '300', '--roots', '1', '--branching', '2', '--batch-size', '50', stdout=StringIO())
+        self.assertEqual(User.objects.filter(username__startswith='synth_').count(), 300)
+        self.assertEqual(Wallet.objects.count(), 300)
+
+        paths = set(ReferralPath.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+        stats = set(DownlineStats.objects.values_list('user_id', 'generation_1', 'generation_5', 'total'))
+        call_command('build_referral_paths', stdout=StringIO())
+        call_command('rebuild_downline_stats', stdout=StringIO())
+        self.assertEqual(set(ReferralPath.objects.values_list('ancestor_id', 'descendant_id', 'depth')), paths)
+        self.assertEqual(set(DownlineStats.objects.values_list('user_id', 'generation_1', 'generation_5', 'total')), stats)
+
+        out = StringIO()
+        call_command('rebuild_user_summaries', '--verify', stdout=out)
+        self.assertNotIn('expected', out.getvalue())
+
+        # Won bets come as stake/win pairs and wallets hold what the history leaves
+        self.assertEqual(Transaction.objects.filter(transaction_type='BET_STAKE').count(),
+                         Transaction.objects.filter(transaction_type='BET_WIN').count())
+        report, summary = StringIO(), StringIO()
+        call_command('reconcile_wallets', '--workers', '1', stdout=report, stderr=summary)
+        self.assertIn(': 0 drifted', summary.getvalue())
+
+        call_command('bench_mlm', '--iterations', '5', '--warmup', '1', stdout=out)
+        self.assertIn('process_bet_loss', out.getvalue())
+        self.assertIn('dashboard', out.getvalue())
+        self.assertEqual(Commission.objects.count(), 0)
+
+        call_command('generate_referral_forest', '--delete', stdout=StringIO())
+        self.assertFalse(User.objects.exists())
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        self.client = APIClient()
+        self.user = create_chain(1, prefix='metrics')[0]
+
+    def test_records_latency_and_queries_per_view(self):
+        self.client.force_authenticate(self.user)
+        self.client.get('/api/mlm/stats/dashboard/')
+        self.client.get('/api/mlm/stats/dashboard/')
+        self.client.get('/api/nowhere/')
+
+        admin = User.objects.create_user(username='scraper', email='scraper@test.local', is_staff=True)
+        self.client.force_authenticate(admin)
+        response = self.client.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+
+        labels = 'view="stats-dashboard",method="GET"'
+        self.assertIn(f'http_request_duration_seconds_count{{{labels}}} 2', body)
+        self.assertIn(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2', body)
+        self.assertIn(f'http_requests_total{{{labels},status="200"}} 2', body)
+        self.assertIn(f'db_queries_per_request_sum{{{labels}}} 2', body)
+        self.assertIn(f'db_query_duration_seconds_total{{{labels}}}', body)
+        self.assertIn('http_requests_total{view="<unresolved>",method="GET",status="404"} 1', body)
+
+    def test_admin_only(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+
+
+class CommissionPlanTests(TestCase):
+    def setUp(self):
+        cache.delete(plan.VERSION_KEY)
+        plan.invalidate()
+
+    def test_defaults_without_rows(self):
+        compiled = plan.get_plan()
+        self.assertEqual(compiled.upgrade_rates, tuple(Decimal(p) for p in ('0.1', '0.08', '0.05', '0.03', '0.02')))
+        self.assertEqual(compiled.bet_loss_rates, tuple(Decimal(p) for p in ('0.11', '0.09', '0.02', '0.015', '0.015')))
+        self.assertEqual(compiled.salary_rate, Decimal('0.1'))
+        # Shares of missing generations roll over into the Reserve Fund
+        self.assertEqual(compiled.reserve_rates[5], Decimal('0.65'))
+        self.assertEqual(compiled.reserve_rates[2], Decimal('0.7'))
+        self.assertEqual(compiled.reserve_rates[0], Decimal('0.9'))
+
+    def test_plan_is_compiled_once(self):
+        plan.get_plan()
+        with self.assertNumQueries(0):
+            for _ in range(100):
+                plan.get_plan()
+
+    def test_init_mlm_seeds_the_plan_and_bumps_the_version(self):
+        first = plan.get_plan()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('init_mlm', stdout=StringIO())
+        self.assertEqual(BetLossSplit.objects.count(), len(plan.DEFAULT_BET_LOSS_SPLIT))
+        compiled = plan.get_plan()
+        self.assertGreater(compiled.version, first.version)
+        self.assertEqual(compiled.levels[5].price, Decimal('2000'))
+
+    def test_edits_take_effect_after_a_version_bump(self):
+        call_command('init_mlm', stdout=StringIO())
+        plan.invalidate()
+        self.assertEqual(plan.get_plan().salary_rate, Decimal('0.1'))
+
+        BetLossSplit.objects.filter(recipient='SALARY_FUND').update(percent=Decimal('20'))
+        BetLossSplit.objects.filter(recipient='RESERVE_FUND').update(percent=Decimal('55'))
+        self.assertEqual(plan.get_plan().salary_rate, Decimal('0.1'))
+        plan.bump_version()
+        self.assertEqual(plan.get_plan().salary_rate, Decimal('0.2'))
+        self.assertEqual(plan.get_plan().reserve_rates[5], Decimal('0.55'))
+
+    def test_split_not_adding_up_falls_back_to_default(self):
+        call_command('init_mlm', stdout=StringIO())
+        BetLossSplit.objects.filter(recipient='SALARY_FUND').update(percent=Decimal('30'))
+        plan.invalidate()
+        with self.assertLogs('mlm.plan', 'ERROR'):
+            self.assertEqual(plan.get_plan().salary_rate, Decimal('0.1'))
+
+
+@unittest.skipUnless(numpy, 'numpy is not installed')
+class CommissionSimulationTests(TestCase):
+    def setUp(self):
+        plan.invalidate()
+        self.users = create_chain(7)
+        self.loner = User.objects.create_user(username='loner', email='loner@test.local')
+        losses = [(self.users[-1], '10.00'), (self.users[-1], '2.50'), (self.users[2], '4.00'), (self.loner, '1.00')]
+        for user, amount in losses:
+            Transaction.objects.create(user=user, amount=Decimal(amount), transaction_type='BET_LOSS', status='COMPLETED')
+        Transaction.objects.create(user=self.loner, amount=Decimal('50'), transaction_type='BET_LOSS', status='PENDING')
+        self.losses = losses
+
+    def test_replay_matches_bet_loss_credits(self):
+        from . import simulation
+        system_users = {'salary_fund': 'salary_fund', 'reserve_fund': 'reserve_fund'}
+        uplines = CommissionService.get_uplines({user.pk for user, _ in self.losses})
+        expected = {}
+        for user, amount in self.losses:
+            for recipient, credit, _ in CommissionService.bet_loss_credits(user.username, Decimal(amount), uplines.get(user.pk, []), system_users):
+                expected[recipient] = expected.get(recipient, 0) + credit
+
+        forest = simulation.Forest.load()
+        flows, total = forest.flows(*simulation.load_losses(forest))
+        result = simulation.replay(flows, total, simulation.scenario_from_plan(plan.get_plan()))
+
+        self.assertAlmostEqual(total, 17.5)
+        self.assertAlmostEqual(result.salary_fund, float(expected.pop('salary_fund')))
+        self.assertAlmostEqual(result.reserve_fund, float(expected.pop('reserve_fund')))
+        earnings = dict(zip(forest.ids.tolist(), result.earnings.tolist()))
+        for user_id, credit in expected.items():
+            self.assertAlmostEqual(earnings.pop(user_id), float(credit))
+        self.assertFalse(any(earnings.values()))
+
+    def test_alternative_split(self):
+        from . import simulation
+        with self.assertRaises(ValueError):
+            simulation.parse_scenario('bad=10,10,10,10,10,10,10')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'totals.csv')
+            out = StringIO()
+            call_command('simulate_commissions', split=['flat=5,5,5,5,5,10,65'], output=path, stdout=out, stderr=StringIO())
+            with open(path) as f:
+                rows = [line.strip().split(',') for line in f]
+
+        self.assertIn('Salary Fund', out.getvalue())
+        self.assertEqual(rows[0], ['user_id', 'current', 'flat'])
+        by_user = {int(row[0]): (Decimal(row[1]), Decimal(row[2])) for row in rows[1:]}
+        # users[6] lost 12.50 and users[2] 4.00: users[5] is generation 1 of users[6] only,
+        # users[1] generation 5 of users[6] and generation 1 of users[2]
+        self.assertEqual(by_user[self.users[5].pk], (Decimal('1.375'), Decimal('0.625')))
+        self.assertEqual(by_user[self.users[1].pk], (Decimal('0.6275'), Decimal('0.825')))
+        self.assertNotIn(self.loner.pk, by_user)
@@ -3,18 +3,20 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.db import transaction
-from .models import MLMLevel, UserLevel, Commission
-from wallet.models import Wallet, Transaction
+from .models import UserLevel, Commission
+from .plan import get_plan
+from wallet.models import Transaction
+from wallet.services import CommissionService, SummaryService
 
 class MLMViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
 
     @action(detail=False, methods=['post'])
     def upgrade(self, request):
-        level_id = request.data.get('level_id')
+        plan = get_plan()
         try:
-            target_level = MLMLevel.objects.get(level=level_id)
-        except MLMLevel.DoesNotExist:
+            target_level = plan.levels[int(request.data.get('level_id'))]
+        except (KeyError, TypeError, ValueError):
             return Response({'error': 'Invalid level'}, status=status.HTTP_400_BAD_REQUEST)
 
         user = request.user
@@ -38,51 +40,34 @@ class MLMViewSet(viewsets.ViewSet):
             )
 
             # Update User Level
-            UserLevel.objects.update_or_create(user=user, defaults={'current_level': target_level})
+            UserLevel.objects.update_or_create(user=user, defaults={'current_level_id': target_level.id})
+
+            SummaryService.record_withdrawal(user.id, target_level.price)
+            SummaryService.set_investment(user.id, target_level.price)
 
             # Distribute Commissions
-            self.distribute_commissions(user, target_level.price)
+            self.distribute_commissions(user, target_level.price, plan)
 
         return Response({'status': 'Upgraded successfully'})
 
-    def distribute_commissions(self, source_user, amount):
-        current_upline = source_user.referrer
-        for i in range(1, 6): # 5 Levels
-            if not current_upline:
-                break
-            
-            # Get commission percent for this level (simplified: assuming fixed % per level from config)
-            # In real scenario, fetch from DB or config based on level 'i'
-            # Example: L1=10%, L2=8%, etc.
-            percent = self.get_commission_percent(i)
-            commission_amount = (amount * percent) / 100
+    def distribute_commissions(self, source_user, amount, plan):
+        upline = CommissionService.get_upline(source_user)
 
-            if commission_amount > 0:
-                # Add to upline wallet
-                upline_wallet, _ = Wallet.objects.get_or_create(user=current_upline)
-                upline_wallet.balance += commission_amount
-                upline_wallet.save()
+        commissions = []
+        credits = []
+        # Generation i earns the commission_percent of level i
+        for i, ((upline_id, _), rate) in enumerate(zip(upline, plan.upgrade_rates), 1):
+            commission_amount = amount * rate
 
-                # Record Commission
-                Commission.objects.create(
-                    user=current_upline,
+            if commission_amount > 0:
+                commissions.append(Commission(
+                    user_id=upline_id,
                     source_user=source_user,
                     amount=commission_amount,
                     level=i
-                )
-                
-                # Record Transaction for upline
-                Transaction.objects.create(
-                    user=current_upline,
-                    amount=commission_amount,
-                    transaction_type='COMMISSION',
-                    status='COMPLETED',
-                    description=f'Commission from {source_user.username} (Level {i})'
-                )
-
-            current_upline = current_upline.referrer
+                ))
+                credits.append((upline_id, commission_amount, f'Commission from {source_user.username} (Level {i})'))
 
-    def get_commission_percent(self, level):
-        # Hardcoded for now based on example, or fetch from DB
-        rates = {1: 10, 2: 8, 3: 5, 4: 3, 5: 2}
-        return rates.get(level, 0)
+        # Record Commissions, then credit upline wallets and record their transactions
+        Commission.objects.bulk_create(commissions)
+        CommissionService.apply_credits(credits, earnings=True)
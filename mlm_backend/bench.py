@@ -0,0 +1,10 @@
+"""Helpers shared by the bench_* management commands"""
+
+
+class Rollback(Exception):
+    """Raised at the end of a benchmark's transaction.atomic() block to discard what it wrote"""
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    return values[max(0, min(len(values) - 1, round(fraction * len(values)) - 1))]
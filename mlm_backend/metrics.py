@@ -0,0 +1,175 @@
+"""
+Per-view request metrics in Prometheus text format.
+
+MetricsMiddleware times every request and counts the SQL it runs through a
+connection execute wrapper, then adds the numbers to in-process aggregates
+keyed by the resolved URL name (e.g. `transaction-process-bet`). MetricsView
+renders them for an admin-only scrape endpoint.
+
+Aggregates live in each worker process, so with several workers a scrape
+shows the worker that served it; label the scrape targets per worker or run
+one target per process if exact totals are needed.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+from django.db import connections
+from django.http import HttpResponse
+from rest_framework import permissions
+from rest_framework.views import APIView
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+UNRESOLVED = '<unresolved>'
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'total', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # One slot per bound plus +Inf; made cumulative when rendered
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.bounds + ('+Inf',), self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_sum{{{labels}}} {self.total:.6f}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+
+class ViewStats:
+    __slots__ = ('latency', 'queries', 'sql_seconds', 'statuses')
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.sql_seconds = 0.0
+        self.statuses = {}
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def record(self, view, method, status, seconds, queries, sql_seconds):
+        key = (view, method)
+        with self.lock:
+            stats = self.views.get(key)
+            if stats is None:
+                stats = self.views[key] = ViewStats()
+            stats.latency.observe(seconds)
+            stats.queries.observe(queries)
+            stats.sql_seconds += sql_seconds
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+
+    def render(self):
+        with self.lock:
+            views = sorted(self.views.items())
+            lines = [
+                '# HELP http_request_duration_seconds Request latency by view.',
+                '# TYPE http_request_duration_seconds histogram',
+            ]
+            for (view, method), stats in views:
+                lines.extend(stats.latency.lines('http_request_duration_seconds', labels(view, method)))
+
+            lines += [
+                '# HELP http_requests_total Requests by view and response status.',
+                '# TYPE http_requests_total counter',
+            ]
+            for (view, method), stats in views:
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append(f'http_requests_total{{{labels(view, method)},status="{status}"}} {count}')
+
+            lines += [
+                '# HELP db_queries_per_request SQL queries issued per request by view.',
+                '# TYPE db_queries_per_request histogram',
+            ]
+            for (view, method), stats in views:
+                lines.extend(stats.queries.lines('db_queries_per_request', labels(view, method)))
+
+            lines += [
+                '# HELP db_query_duration_seconds_total Time spent in SQL by view.',
+                '# TYPE db_query_duration_seconds_total counter',
+            ]
+            for (view, method), stats in views:
+                lines.append(f'db_query_duration_seconds_total{{{labels(view, method)}}} {stats.sql_seconds:.6f}')
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def labels(view, method):
+    return f'view="{escape(view)}",method="{method}"'
+
+
+registry = Registry()
+
+
+class QueryTimer:
+    """Execute wrapper counting queries and their time for one request"""
+    __slots__ = ('count', 'seconds')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+
+class MetricsMiddleware:
+    """
+    Record latency and SQL per resolved view name; place it first in MIDDLEWARE.
+    Streaming responses are measured until the response object is returned.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = (match.view_name or match.route) if match else UNRESOLVED
+        method = request.method if request.method in METHODS else 'other'
+        registry.record(view, method, response.status_code, elapsed, timer.count, timer.seconds)
+        return response
+
+
+class MetricsView(APIView):
+    """Prometheus scrape endpoint (admins only)"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
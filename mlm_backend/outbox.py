@@ -0,0 +1,61 @@
+"""
+Shared queue handling for outbox tables (wallet.CommissionOutbox, users.EmailOutbox).
+
+Outbox rows have status PENDING/<done>/FAILED, attempts, last_error and
+available_at. Workers take due PENDING rows with SELECT ... FOR UPDATE SKIP
+LOCKED, so any number of them can drain one table; failures are retried with
+a linear backoff until max_attempts, then marked FAILED.
+"""
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+
+def lock_due(queryset, batch_size, now):
+    """Lock up to `batch_size` due PENDING rows that no other worker holds; call inside a transaction"""
+    return list(
+        queryset.select_for_update(skip_locked=True)
+        .filter(status='PENDING', available_at__lte=now)
+        .order_by('available_at', 'id')[:batch_size]
+    )
+
+
+def claim(queryset, batch_size, lease):
+    """
+    Take due rows for work done outside the database, e.g. network I/O.
+
+    The attempt is counted and the rows hidden from other workers for `lease`
+    in one short transaction that commits before returning, so no row lock is
+    held while the work runs. Rows of a worker that dies mid-batch become due
+    again once the lease ends. Returns the claimed rows.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        entries = lock_due(queryset, batch_size, now)
+        if entries:
+            queryset.filter(pk__in=[entry.pk for entry in entries]).update(
+                attempts=F('attempts') + 1, available_at=now + lease
+            )
+    for entry in entries:
+        entry.attempts += 1
+        entry.available_at = now + lease
+    return entries
+
+
+def record_failure(entry, error, max_attempts, retry_delay, now):
+    """Reschedule `entry` with a linear backoff, or mark it FAILED after `max_attempts`"""
+    entry.last_error = str(error)
+    if entry.attempts >= max_attempts:
+        entry.status = 'FAILED'
+    else:
+        entry.available_at = now + retry_delay * entry.attempts
+
+
+def purge(queryset, batch_size=1000):
+    """Delete the rows of `queryset` in batches of `batch_size` primary keys; returns the number deleted"""
+    deleted = 0
+    while True:
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += queryset.model.objects.filter(pk__in=ids).delete()[0]
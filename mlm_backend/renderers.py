@@ -0,0 +1,35 @@
+"""
+JSON renderer backed by orjson.
+
+Output matches DRF's compact JSONRenderer: values orjson does not handle the
+same way (datetimes, Decimals, lazy strings, ...) go through DRF's encoder.
+Falls back to the stock renderer when orjson is not installed, when indented,
+non-compact or ASCII-only output is configured or requested, or for data
+orjson rejects (e.g. integers beyond 64 bits).
+"""
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    if orjson is not None:
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or not self.compact or self.ensure_ascii
+                or self.get_indent(accepted_media_type, renderer_context or {})):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=self.options)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Escape the line separators JSON allows but JavaScript does not, as DRF does
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
@@ -65,6 +65,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'mlm_backend.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -162,7 +163,12 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
+    ),
+    # FastJSONRenderer uses orjson when installed; list rest_framework.renderers.JSONRenderer to opt out
+    'DEFAULT_RENDERER_CLASSES': (
+        'mlm_backend.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ),
 }
 
@@ -175,6 +181,24 @@ SIMPLE_JWT = {
 
 AUTH_USER_MODEL = 'users.User'
 
+# Shared by every worker when REDIS_URL is set (requires the redis package).
+# Without it each process has its own local-memory cache, and the version
+# keys of users.authentication, mlm.plan and wallet.system_settings stay
+# per process: other workers then see changes only when their copies expire.
+if config('REDIS_URL', default=None):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': config('REDIS_URL'),
+        }
+    }
+
+# Seconds an authenticated user's flags are reused without a query (users.authentication)
+AUTH_USER_CACHE_TTL = config('AUTH_USER_CACHE_TTL', default=30, cast=int)
+
+# Seconds a wallet login challenge may be signed and submitted (users.services.WalletLoginService)
+WALLET_LOGIN_CHALLENGE_TTL = config('WALLET_LOGIN_CHALLENGE_TTL', default=300, cast=int)
+
 CORS_ALLOW_ALL_ORIGINS = True
 
 # Email Configuration
@@ -186,6 +210,9 @@ EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='noreply@mlmsystem.com')
 
+# Number of sub-accounts the salary_fund and reserve_fund balances are spread over
+SYSTEM_FUND_STRIPES = config('SYSTEM_FUND_STRIPES', default=8, cast=int)
+
 # Admin Wallet Address
 ADMIN_USDT_WALLET_ADDRESS = config('ADMIN_USDT_WALLET_ADDRESS', default='0x742d35Cc6634C0532925a3b844Bc9e7595f0bEb')
 
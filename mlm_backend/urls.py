@@ -16,10 +16,12 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from .metrics import MetricsView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/users/', include('users.urls')),
     path('api/wallet/', include('wallet.urls')),
     path('api/mlm/', include('mlm.urls')),
+    path('api/metrics/', MetricsView.as_view(), name='metrics'),
 ]
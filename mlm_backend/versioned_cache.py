@@ -0,0 +1,61 @@
+"""
+Per-process caches invalidated through a version number.
+
+A VersionedCache keeps one value per process, built by load(version). The
+version lives in Django's cache framework and is checked at most once per
+check_interval seconds; bump_version() (usually via transaction.on_commit)
+makes every process rebuild on its next check. The bump only reaches other
+workers through a shared cache (settings.CACHES, see REDIS_URL): with the
+default local-memory cache each process still rebuilds after max_age
+seconds, or never if max_age is None.
+"""
+import threading
+import time
+from django.core.cache import cache
+
+DEFAULT_CHECK_INTERVAL = 1
+
+
+class VersionedCache:
+    def __init__(self, key, load, max_age=None, check_interval=DEFAULT_CHECK_INTERVAL):
+        self.key = key
+        self.load = load
+        self.max_age = max_age
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._state = {'value': None, 'version': None, 'loaded_at': 0.0, 'checked_at': 0.0}
+
+    def get_version(self):
+        return cache.get(self.key, 0)
+
+    def bump_version(self):
+        """Rebuild here now and in every process on their next check"""
+        try:
+            cache.incr(self.key)
+        except ValueError:
+            cache.add(self.key, 1, None)
+        self.invalidate()
+
+    def invalidate(self):
+        """Rebuild in this process on the next get()"""
+        with self._lock:
+            self._state['value'] = None
+
+    def get(self):
+        """Return the value for the current version, rebuilding it if outdated or older than max_age"""
+        state = self._state
+        now = time.monotonic()
+        value = state['value']
+        if value is not None and now - state['checked_at'] < self.check_interval:
+            return value
+
+        version = self.get_version()
+        expired = self.max_age is not None and now - state['loaded_at'] >= self.max_age
+        if value is not None and version == state['version'] and not expired:
+            state['checked_at'] = now
+            return value
+
+        value = self.load(version)
+        with self._lock:
+            state.update(value=value, version=version, loaded_at=now, checked_at=now)
+        return value
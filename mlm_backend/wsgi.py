@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mlm_backend.settings')
 
 application = get_wsgi_application()
+
+# Import and exercise eth_account in each worker before it takes requests
+from users.services import WalletLoginService  # noqa: E402
+
+WalletLoginService.preload()
@@ -10,6 +10,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mlm_backend.settings')
 django.setup()
 
 from django.contrib.auth import get_user_model
+from users.models import ReferralPath
 from wallet.models import Wallet, Transaction
 from wallet.services import CommissionService
 
@@ -37,6 +38,8 @@ def run_test():
             is_approved=True,  # Auto approve for test
             referrer=referrer
         )
+        # Upline lookups read the referral closure table, as registration fills it
+        ReferralPath.objects.add_user(user)
         # Create wallet
         Wallet.objects.create(user=user, balance=Decimal('100.00'))
         users.append(user)
@@ -67,8 +70,8 @@ def run_test():
     salary = User.objects.get(username='salary_fund').wallet
     reserve = User.objects.get(username='reserve_fund').wallet
     
-    print(f"Salary Fund: ${salary.balance} (Expected 1.00)")
-    print(f"Reserve Fund: ${reserve.balance} (Expected 6.50)")
+    print(f"Salary Fund: ${salary.get_total_balance()} (Expected 1.00)")
+    print(f"Reserve Fund: ${reserve.get_total_balance()} (Expected 6.50)")
     
     # Check Upline
     # UserBetter -> UserL5 -> UserL4 -> UserL3 -> UserL2 -> UserTop
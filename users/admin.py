@@ -1,14 +1,18 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.db import transaction
 from django.utils.html import format_html
 from django.utils import timezone
-from .models import User
+from .authentication import invalidate_on_commit
+from .models import User, DownlineStats
 
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
     list_display = ('email', 'username', 'phone_number', 'is_approved', 'email_verified', 'two_factor_enabled', 'action_buttons')
     search_fields = ('email', 'username', 'phone_number')
     list_filter = ('is_approved', 'email_verified', 'two_factor_enabled', 'is_staff')
+    # ReferralPath and DownlineStats follow the referrer set at registration
+    readonly_fields = ('referrer',)
     
     fieldsets = BaseUserAdmin.fieldsets + (
         ('MLM Info', {'fields': ('phone_number', 'wallet_address', 'referral_code', 'referrer')}),
@@ -16,6 +20,8 @@ class UserAdmin(BaseUserAdmin):
         ('2FA', {'fields': ('two_factor_enabled', 'otp_secret')}),
     )
     
+    actions = ['approve_selected']
+    
     add_fieldsets = BaseUserAdmin.add_fieldsets + (
         ('Additional Info', {'fields': ('email', 'phone_number', 'wallet_address')}),
     )
@@ -33,6 +39,43 @@ class UserAdmin(BaseUserAdmin):
             return format_html('<span style="color: orange;">Email not verified</span>')
     action_buttons.short_description = 'Actions'
     
+    def save_model(self, request, obj, form, change):
+        with transaction.atomic():
+            # Conditional update, as in toggle_status, so a concurrent toggle cannot double count
+            if change and User.objects.filter(pk=obj.pk, is_active=not obj.is_active).update(is_active=obj.is_active):
+                DownlineStats.objects.adjust(obj, 1 if obj.is_active else -1)
+            super().save_model(request, obj, form, change)
+        # is_active, is_staff or is_approved may have changed
+        invalidate_on_commit()
+    
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            # Before the delete cascades to the user's referral paths
+            if obj.is_active:
+                DownlineStats.objects.adjust(obj, -1)
+            super().delete_model(request, obj)
+        invalidate_on_commit()
+    
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            for user in queryset.filter(is_active=True).only('pk'):
+                DownlineStats.objects.adjust(user, -1)
+            super().delete_queryset(request, queryset)
+        invalidate_on_commit()
+    
+    @admin.action(description='Approve selected users and create their wallets')
+    def approve_selected(self, request, queryset):
+        from django.contrib import messages
+        from .services import UserApprovalService
+        
+        result = UserApprovalService.approve(queryset)
+        self.message_user(
+            request,
+            f"{result['approved']} users approved ({result['already_approved']} already approved), "
+            f"{result['wallets_created']} wallets created",
+            messages.SUCCESS
+        )
+    
     def get_urls(self):
         from django.urls import path
         urls = super().get_urls()
@@ -50,6 +93,7 @@ class UserAdmin(BaseUserAdmin):
         user = User.objects.get(pk=pk)
         user.is_approved = True
         user.save()
+        invalidate_on_commit()
         
         # Create wallet for user if doesn't exist
         Wallet.objects.get_or_create(user=user)
@@ -64,6 +108,7 @@ class UserAdmin(BaseUserAdmin):
         user = User.objects.get(pk=pk)
         user.is_approved = False
         user.save()
+        invalidate_on_commit()
         
         messages.success(request, f'User {user.email} rejected')
         return redirect('admin:users_user_changelist')
@@ -2,7 +2,11 @@ from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from .models import DownlineStats
 from .serializers import UserSerializer
+from .services import UserApprovalService
+from . import authentication
 
 User = get_user_model()
 
@@ -20,6 +24,7 @@ class AdminUserViewSet(viewsets.ModelViewSet):
         user = self.get_object()
         user.is_approved = True
         user.save()
+        authentication.invalidate_on_commit()
         
         # Ensure wallet exists
         from wallet.models import Wallet
@@ -27,17 +32,49 @@ class AdminUserViewSet(viewsets.ModelViewSet):
         
         return Response({'message': 'User approved successfully'})
     
+    @action(detail=False, methods=['post'])
+    def bulk_approve(self, request):
+        """Approve many users: {"ids": [...]} or {"all_pending": true} for every unapproved active user"""
+        if request.data.get('all_pending') is True:
+            queryset = UserApprovalService.pending()
+        else:
+            ids = request.data.get('ids')
+            if not isinstance(ids, list) or not ids or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+                return Response({'error': 'Provide a non-empty list of user ids or all_pending'}, status=status.HTTP_400_BAD_REQUEST)
+            if len(ids) > UserApprovalService.MAX_IDS:
+                return Response({
+                    'error': f'At most {UserApprovalService.MAX_IDS} ids per request; use all_pending for more'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            queryset = User.objects.filter(pk__in=ids)
+        
+        return Response(UserApprovalService.approve(queryset))
+    
     @action(detail=True, methods=['post'])
     def toggle_status(self, request, pk=None):
         user = self.get_object()
-        user.is_active = not user.is_active
-        user.save()
+        is_active = not user.is_active
+        with transaction.atomic():
+            # Conditional update so concurrent toggles cannot double count in the downline stats
+            if not User.objects.filter(pk=user.pk, is_active=user.is_active).update(is_active=is_active):
+                current = User.objects.filter(pk=user.pk).values_list('is_active', flat=True).first()
+                return Response({
+                    'error': 'User status was changed by another request',
+                    'is_active': current
+                }, status=status.HTTP_409_CONFLICT)
+            DownlineStats.objects.adjust(user, 1 if is_active else -1)
+            authentication.invalidate_on_commit()
+        user.is_active = is_active
         return Response({'message': f'User {"activated" if user.is_active else "deactivated"}'})
 
     # Override destroy to just deactivate
-    def perform_destroy(self, instance):
-        instance.is_active = False
-        instance.save()
+    def destroy(self, request, *args, **kwargs):
+        user = self.get_object()
+        with transaction.atomic():
+            if not User.objects.filter(pk=user.pk, is_active=True).update(is_active=False):
+                return Response({'error': 'User is already inactive'}, status=status.HTTP_409_CONFLICT)
+            DownlineStats.objects.adjust(user, -1)
+            authentication.invalidate_on_commit()
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 # Admin Password Verification
 from rest_framework import views
@@ -0,0 +1,99 @@
+"""
+JWT authentication that skips the user query on warm requests.
+
+The columns permission checks and views read without a relation
+(CACHED_FIELDS) are kept per process for AUTH_USER_CACHE_TTL seconds and
+turned into a fresh, partially loaded User on every request, so nothing
+mutable is shared between requests; other fields load on first access.
+The cached flags may be up to AUTH_USER_CACHE_TTL old, so code saving
+request.user must pass update_fields naming only the columns it changed.
+
+Flags are not read from token claims: access tokens live for days, and a
+deactivated user must lose access well before that. Instead, code that
+changes is_active/is_staff/is_approved calls invalidate(), which clears this
+process's cache and bumps a version in Django's cache that every worker
+checks at most once per VERSION_CHECK_INTERVAL seconds. That reaches other
+workers only through a shared cache (REDIS_URL); with the default
+local-memory cache they pick the change up within AUTH_USER_CACHE_TTL.
+"""
+import time
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from mlm_backend.versioned_cache import VersionedCache
+
+CACHED_FIELDS = ('id', 'username', 'email', 'is_active', 'is_staff', 'is_superuser', 'is_approved')
+VERSION_KEY = 'auth_user_cache:version'
+VERSION_CHECK_INTERVAL = 1
+MAX_USERS = 100000
+
+_fields = []
+
+
+def new_users(version):
+    return {}
+
+
+# {user_id: (loaded_at, values)}, replaced by an empty dict on every version change
+_cache = VersionedCache(VERSION_KEY, new_users, check_interval=VERSION_CHECK_INTERVAL)
+get_version = _cache.get_version
+
+
+def invalidate():
+    """Forget cached users here now and in every worker on their next version check"""
+    _cache.bump_version()
+
+
+def invalidate_on_commit():
+    transaction.on_commit(invalidate)
+
+
+def get_fields():
+    """CACHED_FIELDS in model order, as Model.from_db expects for partial rows"""
+    if not _fields:
+        cached = set(CACHED_FIELDS)
+        _fields.extend(f.attname for f in get_user_model()._meta.concrete_fields if f.attname in cached)
+    return _fields
+
+
+def get_values(user_id):
+    """Return get_fields() values for `user_id`, loading them at most once per TTL"""
+    users = _cache.get()
+    now = time.monotonic()
+    entry = users.get(user_id)
+    if entry is not None and now - entry[0] < settings.AUTH_USER_CACHE_TTL:
+        return entry[1]
+
+    User = get_user_model()
+    values = User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).values_list(*get_fields()).first()
+    if values is not None:
+        # A row read while an invalidation happened lands in the replaced dict and is dropped
+        if len(users) >= MAX_USERS:
+            users.clear()
+        users[user_id] = (now, values)
+    return values
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            # Needs the password hash, which is not cached
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        values = get_values(user_id)
+        if values is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+
+        user = self.user_model.from_db(DEFAULT_DB_ALIAS, get_fields(), values)
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return user
@@ -0,0 +1,80 @@
+"""
+Management command to benchmark registration against the current database
+Usage: python manage.py bench_registration [--registrations 500]
+
+Registers users through the API, each referred by a random existing user,
+and reports registrations per second, p50/p99 latency and queries per
+registration. For comparison it also times the lookups the serializer used
+to make for each registration: __iexact email and wallet probes and a
+referral code existence check. Populate the database first, e.g. with
+generate_referral_forest --users 1000000. Password hashing is switched to
+MD5 so it does not dominate the numbers. Everything is rolled back at the end.
+"""
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+from mlm_backend.bench import Rollback, percentile
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Measure registration throughput, latency and queries per registration'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--registrations', type=int, default=500, help='Users to register (default: 500)')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed for picking referrers (default: 1)')
+
+    def report(self, label, latencies):
+        latencies.sort()
+        self.stdout.write(
+            f'{label:<24} p50 {percentile(latencies, 0.50):>7.2f}ms  p99 {percentile(latencies, 0.99):>7.2f}ms'
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        count = options['registrations']
+        existing = User.objects.count()
+        codes = list(User.objects.exclude(referral_code=None).order_by('?').values_list('referral_code', flat=True)[:count])
+        if not codes:
+            raise CommandError('No users with referral codes; run generate_referral_forest first')
+        self.stdout.write(f'{existing:,} existing users')
+
+        client = APIClient()
+        latencies, queries, legacy = [], [], []
+        try:
+            with override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']), transaction.atomic():
+                started = time.perf_counter()
+                for i in range(count):
+                    email = f'Bench.Register.{i}@Bench.local'
+                    with CaptureQueriesContext(connection) as captured:
+                        call_started = time.perf_counter()
+                        response = client.post('/api/users/register/', {
+                            'username': f'bench_register_{i}', 'email': email, 'password': 'bench-Passw0rd',
+                            'referrer_code': rng.choice(codes),
+                        }, format='json')
+                        latencies.append((time.perf_counter() - call_started) * 1000)
+                    if response.status_code != 201:
+                        raise CommandError(f'Registration failed: {response.status_code} {response.data}')
+                    queries.append(len(captured))
+                elapsed = time.perf_counter() - started
+
+                for i in range(count):
+                    call_started = time.perf_counter()
+                    User.objects.filter(email__iexact=f'bench.legacy.{i}@bench.local').exists()
+                    User.objects.filter(wallet_address__iexact=f'0x{i:040x}').exists()
+                    User.objects.filter(referral_code=f'{i:08X}').exists()
+                    legacy.append((time.perf_counter() - call_started) * 1000)
+                raise Rollback
+        except Rollback:
+            pass
+
+        self.report('registration', latencies)
+        self.report('old lookups alone', legacy)
+        self.stdout.write(self.style.SUCCESS(
+            f'{count / elapsed:,.0f} registrations/s with {existing:,} existing users, '
+            f'{statistics.median(queries):g} queries each (max {max(queries)})'
+        ))
@@ -0,0 +1,65 @@
+"""
+Management command to benchmark bulk user approval
+Usage: python manage.py bench_user_approval [--users 100000] [--legacy-sample 2000]
+
+Creates --users unapproved users without wallets, approves a sample of them
+one at a time the way AdminUserViewSet.approve does (save + get_or_create)
+and the rest with UserApprovalService.approve. Everything happens inside a
+transaction that is rolled back at the end.
+"""
+import time
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from mlm_backend.bench import Rollback
+from users.models import User
+from users.services import UserApprovalService
+from wallet.models import Wallet
+
+
+class Command(BaseCommand):
+    help = 'Compare per-user approval with bulk approval'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000, help='Pending users to create (default: 100000)')
+        parser.add_argument('--legacy-sample', type=int, default=2000, help='Users approved one at a time (default: 2000)')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Users per bulk insert when creating them (default: 5000)')
+
+    def handle(self, *args, **options):
+        count = options['users']
+        sample = min(options['legacy_sample'], count)
+        password = make_password(None)
+
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create([
+                    User(username=f'bench_pending_{i}', email=f'bench_pending_{i}@bench.local', password=password)
+                    for i in range(count)
+                ], batch_size=options['batch_size'])
+                pending = User.objects.filter(username__startswith='bench_pending_')
+
+                started = time.perf_counter()
+                for user in pending.order_by('pk')[:sample]:
+                    user.is_approved = True
+                    user.save()
+                    Wallet.objects.get_or_create(user=user)
+                legacy_elapsed = time.perf_counter() - started
+
+                started = time.perf_counter()
+                result = UserApprovalService.approve(pending)
+                bulk_elapsed = time.perf_counter() - started
+
+                raise Rollback
+        except Rollback:
+            pass
+
+        legacy_rate = sample / legacy_elapsed if sample else 0
+        bulk_count = result['approved']
+        bulk_rate = bulk_count / bulk_elapsed
+        self.stdout.write(f'one at a time: {sample:,} users in {legacy_elapsed:.2f}s ({legacy_rate:,.0f} users/s)')
+        self.stdout.write(
+            f"bulk:          {bulk_count:,} users in {bulk_elapsed:.2f}s ({bulk_rate:,.0f} users/s), "
+            f"{result['wallets_created']:,} wallets created"
+        )
+        if legacy_rate:
+            self.stdout.write(self.style.SUCCESS(f'Bulk approval is {bulk_rate / legacy_rate:.0f}x faster'))
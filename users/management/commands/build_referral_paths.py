@@ -0,0 +1,33 @@
+"""
+Management command to backfill the referral closure table from User.referrer
+Usage: python manage.py build_referral_paths [--batch-size 5000]
+
+Migration 0008 runs the same backfill; use this to repair the table later.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from users import referrals
+from users.models import User, ReferralPath
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the referral closure table (ReferralPath) for all users'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Rows per bulk insert (default: 5000)',
+        )
+
+    def handle(self, *args, **options):
+        def on_cycle(user_id):
+            self.stderr.write(f'Referral cycle detected at user {user_id}, cutting it')
+
+        with transaction.atomic():
+            created, users = referrals.build_paths(User, ReferralPath, options['batch_size'], on_cycle)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully built {created} referral paths for {users} users')
+        )
@@ -0,0 +1,249 @@
+"""
+Management command to generate a synthetic referral network for load testing
+Usage: python manage.py generate_referral_forest [--users 100000] [--roots 50] [--branching 3] [--max-depth 12]
+       [--transactions 5] [--days 180] [--prefix synth] [--seed 42] [--batch-size 5000]
+       python manage.py generate_referral_forest --delete [--prefix synth]
+
+Trees are grown breadth-first from --roots top-level users; each user recruits
+an exponentially distributed number of referrals averaging --branching, so a
+few users end up with large downlines like in a real network. When every tree
+stops growing (no recruits or --max-depth reached) a new set of roots starts.
+
+Users get unusable passwords and preassigned ids, so users, wallets, closure
+rows, downline counters, summaries, levels and transaction history are all
+written with bulk_create and nothing is read back. Each user's history is
+replayed oldest first, skipping what the balance cannot cover, and the wallet
+holds what is left, so reconcile_wallets finds no drift.
+"""
+import random
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from mlm.models import MLMLevel, UserLevel
+from users.models import ReferralPath, DownlineStats
+from users.utils import generate_referral_code
+from wallet.models import Wallet, Transaction, UserSummary
+from wallet.reconciliation import BALANCE_EFFECTS
+
+User = get_user_model()
+
+# (transaction_type, status, weight); a BET_STAKE is a won bet and is followed by its BET_WIN
+TRANSACTION_MIX = (
+    ('DEPOSIT', 'COMPLETED', 30),
+    ('DEPOSIT', 'PENDING', 3),
+    ('WITHDRAWAL', 'COMPLETED', 10),
+    ('WITHDRAWAL', 'PENDING', 2),
+    ('BET_LOSS', 'COMPLETED', 35),
+    ('BET_STAKE', 'COMPLETED', 20),
+)
+
+# {(transaction_type, status): sign} of the change to the wallet balance
+BALANCE_SIGNS = {(transaction_type, status): sign for transaction_type, statuses, sign in BALANCE_EFFECTS for status in statuses}
+CENT = Decimal('0.01')
+
+
+@contextmanager
+def backdated(model, field_name):
+    """Let bulk_create keep explicit values for an auto_now_add field"""
+    field = model._meta.get_field(field_name)
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic referral forest with wallets and transaction history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000, help='Users to create (default: 100000)')
+        parser.add_argument('--roots', type=int, default=50, help='Top-level users per forest (default: 50)')
+        parser.add_argument('--branching', type=float, default=3.0, help='Mean referrals per user (default: 3)')
+        parser.add_argument('--max-depth', type=int, default=12, help='Deepest generation below a root (default: 12)')
+        parser.add_argument('--transactions', type=int, default=5, help='Mean transactions per user (default: 5)')
+        parser.add_argument('--days', type=int, default=180, help='Spread transaction history over this many days (default: 180)')
+        parser.add_argument('--level-ratio', type=float, default=0.3, help='Share of users on an MLM level (default: 0.3)')
+        parser.add_argument('--prefix', default='synth', help='Username/email prefix of generated users (default: synth)')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Users per bulk insert round (default: 5000)')
+        parser.add_argument('--delete', action='store_true', help='Delete previously generated users instead')
+
+    def handle(self, *args, **options):
+        if options['delete']:
+            return self.delete(options['prefix'], options['batch_size'])
+        if options['users'] < 1 or options['roots'] < 1 or options['max_depth'] < 1:
+            raise CommandError('--users, --roots and --max-depth must be positive')
+
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        self.password = make_password(None)
+        self.levels = list(MLMLevel.objects.order_by('level'))
+        self.now = timezone.now()
+        self.buffers = defaultdict(list)
+        self.created = defaultdict(int)
+        # downline[ancestor_id] = [generation_1..GENERATIONS, total]
+        self.empty_counters = [0] * (DownlineStats.GENERATIONS + 1)
+        self.downline = defaultdict(lambda: list(self.empty_counters))
+
+        if not self.levels:
+            self.stderr.write(self.style.WARNING('No MLM levels found (run init_mlm); users will have no level'))
+
+        first_id = next_id = (User.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+        remaining = options['users']
+        started = time.perf_counter()
+
+        with backdated(Transaction, 'created_at'):
+            while remaining:
+                # Start a new forest: {user_id: ancestors nearest first}
+                generation = {}
+                for _ in range(min(options['roots'], remaining)):
+                    self.add_user(next_id, ())
+                    generation[next_id] = ()
+                    next_id += 1
+                    remaining -= 1
+
+                for _ in range(options['max_depth']):
+                    if not remaining or not generation:
+                        break
+                    children = {}
+                    for parent_id, parent_ancestors in generation.items():
+                        recruits = min(round(self.rng.expovariate(1 / options['branching'])), remaining)
+                        ancestors = (parent_id,) + parent_ancestors
+                        for _ in range(recruits):
+                            self.add_user(next_id, ancestors)
+                            children[next_id] = ancestors
+                            next_id += 1
+                        remaining -= recruits
+
+                        if len(self.buffers[User]) >= options['batch_size']:
+                            self.flush()
+                            done = options['users'] - remaining
+                            self.stdout.write(f'{done:,} users ({done / (time.perf_counter() - started):,.0f} users/s)')
+                        if not remaining:
+                            break
+                    generation = children
+
+            self.flush()
+        self.write_downline_stats(first_id, next_id - 1)
+        self.reset_sequences()
+
+        elapsed = time.perf_counter() - started
+        counts = ', '.join(f'{count:,} {model.__name__}' for model, count in self.created.items())
+        self.stdout.write(self.style.SUCCESS(f'Generated {counts} in {elapsed:.1f}s'))
+
+    def add_user(self, user_id, ancestors):
+        prefix = self.options['prefix']
+        self.buffers[User].append(User(
+            id=user_id,
+            username=f'{prefix}_{user_id}',
+            email=f'{prefix}_{user_id}@{prefix}.local',
+            password=self.password,
+            referral_code=generate_referral_code(user_id),
+            referrer_id=ancestors[0] if ancestors else None,
+            is_approved=True,
+        ))
+        self.buffers[ReferralPath].extend(
+            ReferralPath(ancestor_id=ancestor_id, descendant_id=user_id, depth=depth)
+            for depth, ancestor_id in enumerate(ancestors, 1)
+        )
+        for depth, ancestor_id in enumerate(ancestors, 1):
+            counters = self.downline[ancestor_id]
+            if depth <= DownlineStats.GENERATIONS:
+                counters[depth - 1] += 1
+            counters[-1] += 1
+
+        balance = deposits = withdrawals = Decimal('0')
+        count = round(self.rng.expovariate(1 / self.options['transactions'])) if self.options['transactions'] else 0
+        kinds = self.rng.choices(TRANSACTION_MIX, weights=[weight for *_, weight in TRANSACTION_MIX], k=count)
+        ages = sorted((self.rng.randint(0, self.options['days'] * 86400) for _ in range(count)), reverse=True)
+        for (transaction_type, status, _), age in zip(kinds, ages):
+            amount = Decimal(self.rng.randint(100, 50000)) / 100
+            sign = BALANCE_SIGNS.get((transaction_type, status), 0)
+            if sign < 0 and amount > balance:
+                continue
+            rows = [(transaction_type, status, amount)]
+            if transaction_type == 'BET_STAKE':
+                rows.append(('BET_WIN', 'COMPLETED', (amount * self.rng.randint(150, 300) / 100).quantize(CENT)))
+
+            for transaction_type, status, amount in rows:
+                balance += BALANCE_SIGNS.get((transaction_type, status), 0) * amount
+                if status == 'COMPLETED' and transaction_type == 'DEPOSIT':
+                    deposits += amount
+                elif status == 'COMPLETED' and transaction_type == 'WITHDRAWAL':
+                    withdrawals += amount
+                self.buffers[Transaction].append(Transaction(
+                    user_id=user_id,
+                    amount=amount,
+                    transaction_type=transaction_type,
+                    status=status,
+                    created_at=self.now - timedelta(seconds=age),
+                ))
+
+        investment = Decimal('0')
+        if self.levels and self.rng.random() < self.options['level_ratio']:
+            level = self.rng.choice(self.levels)
+            investment = level.price
+            self.buffers[UserLevel].append(UserLevel(user_id=user_id, current_level=level))
+
+        self.buffers[Wallet].append(Wallet(user_id=user_id, balance=balance))
+        self.buffers[UserSummary].append(UserSummary(
+            user_id=user_id,
+            total_deposit=deposits,
+            total_withdrawal=withdrawals,
+            total_investment=investment,
+        ))
+
+    def flush(self):
+        # Users first so every other row's foreign keys resolve
+        with transaction.atomic():
+            for model in (User, Wallet, ReferralPath, UserSummary, UserLevel, Transaction):
+                rows = self.buffers.pop(model, [])
+                if rows:
+                    model.objects.bulk_create(rows, batch_size=self.options['batch_size'])
+                    self.created[model] += len(rows)
+
+    def write_downline_stats(self, first_id, last_id):
+        """One row per generated user, zeroed for those without a downline, as on registration"""
+        batch_size = self.options['batch_size']
+        for start in range(first_id, last_id + 1, batch_size):
+            with transaction.atomic():
+                DownlineStats.objects.bulk_create([
+                    DownlineStats(
+                        user_id=user_id,
+                        total=counters[-1],
+                        **{f'generation_{depth}': counters[depth - 1] for depth in range(1, DownlineStats.GENERATIONS + 1)}
+                    )
+                    for user_id in range(start, min(start + batch_size, last_id + 1))
+                    for counters in [self.downline.get(user_id, self.empty_counters)]
+                ])
+        self.created[DownlineStats] += last_id - first_id + 1
+
+    def reset_sequences(self):
+        # Ids were assigned here, so move PostgreSQL/Oracle sequences past them
+        statements = connection.ops.sequence_reset_sql(no_style(), [User])
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+    def delete(self, prefix, batch_size):
+        users = User.objects.filter(username__startswith=f'{prefix}_', email__endswith=f'@{prefix}.local')
+        deleted = 0
+        while True:
+            ids = list(users.order_by('-id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                User.objects.filter(pk__in=ids).delete()
+            deleted += len(ids)
+            self.stdout.write(f'Deleted {deleted:,} users')
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted:,} generated users'))
@@ -0,0 +1,31 @@
+"""
+Management command to recompute the per-generation downline counters
+Usage: python manage.py rebuild_downline_stats [--batch-size 5000]
+
+Counts come from the referral closure table, so run build_referral_paths first
+if it has not been backfilled.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from users import referrals
+from users.models import User, ReferralPath, DownlineStats
+
+
+class Command(BaseCommand):
+    help = 'Recompute DownlineStats for all users from the referral closure table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Rows per bulk insert (default: 5000)',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            created = referrals.build_downline_stats(User, ReferralPath, DownlineStats, options['batch_size'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully rebuilt downline stats for {created} users')
+        )
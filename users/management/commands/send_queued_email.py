@@ -0,0 +1,54 @@
+"""
+Management command to send queued emails
+Usage: python manage.py send_queued_email [--batch-size 100] [--once] [--sleep 1.0] [--retention-hours 24]
+
+Each batch is sent over one connection to EMAIL_BACKEND. Run as many workers
+as needed; each claims batches with SKIP LOCKED. Sent and failed emails
+(which contain OTPs in plain text) are deleted once older than
+--retention-hours, checked at start-up and then hourly.
+"""
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from users.services import EmailOutboxService
+
+PURGE_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    help = 'Drain the email outbox, sending queued verification and OTP emails'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Emails claimed per connection (default: 100)')
+        parser.add_argument('--max-attempts', type=int, default=EmailOutboxService.MAX_ATTEMPTS,
+                            help=f'Attempts before an email is marked FAILED (default: {EmailOutboxService.MAX_ATTEMPTS})')
+        parser.add_argument('--once', action='store_true', help='Exit when the outbox is empty instead of polling')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when the outbox is empty (default: 1.0)')
+        retention_hours = int(EmailOutboxService.RETENTION.total_seconds() // 3600)
+        parser.add_argument('--retention-hours', type=float, default=retention_hours,
+                            help=f'Delete sent and failed emails older than this (default: {retention_hours})')
+
+    def handle(self, *args, **options):
+        retention = timedelta(hours=options['retention_hours'])
+        processed = 0
+        purged_at = None
+        try:
+            while True:
+                if purged_at is None or time.monotonic() - purged_at >= PURGE_INTERVAL:
+                    purged = EmailOutboxService.purge(retention)
+                    purged_at = time.monotonic()
+                    if purged:
+                        self.stdout.write(f'Deleted {purged} old queued emails')
+
+                claimed = EmailOutboxService.drain(options['batch_size'], options['max_attempts'])
+                processed += claimed
+                if claimed:
+                    self.stdout.write(f'Processed {claimed} queued emails')
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} queued emails in total'))
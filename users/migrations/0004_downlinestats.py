@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_referralpath'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DownlineStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='downline_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('generation_1', models.IntegerField(default=0)),
+                ('generation_2', models.IntegerField(default=0)),
+                ('generation_3', models.IntegerField(default=0)),
+                ('generation_4', models.IntegerField(default=0)),
+                ('generation_5', models.IntegerField(default=0)),
+                ('total', models.IntegerField(default=0, help_text='Active users in all generations')),
+            ],
+            options={
+                'verbose_name_plural': 'Downline stats',
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_downlinestats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletLoginChallenge',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nonce', models.CharField(max_length=64, unique=True)),
+                ('message', models.TextField()),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='wallet_login_challenges', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
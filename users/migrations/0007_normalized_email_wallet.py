@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:33
+
+import django.db.models.functions.text
+import users.models
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+
+def lowercase_email_and_wallet(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    for field in ('email', 'wallet_address'):
+        clashes = list(
+            User.objects.exclude(**{f'{field}__isnull': True})
+            .values(normalized=Lower(field)).annotate(count=Count('id')).filter(count__gt=1)
+            .values_list('normalized', flat=True)[:20]
+        )
+        if clashes:
+            raise RuntimeError(f'Users share a {field} that differs only in case, merge them first: {", ".join(clashes)}')
+        User.objects.exclude(**{field: Lower(field)}).update(**{field: Lower(field)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0006_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.RunPython(lowercase_email_and_wallet, migrations.RunPython.noop),
+        migrations.AlterModelManagers(
+            name='user',
+            managers=[
+                ('objects', users.models.UserManager()),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.CheckConstraint(condition=models.Q(('email', django.db.models.functions.text.Lower('email'))), name='user_email_lowercase'),
+        ),
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.CheckConstraint(condition=models.Q(('wallet_address', django.db.models.functions.text.Lower('wallet_address'))), name='user_wallet_address_lowercase'),
+        ),
+    ]
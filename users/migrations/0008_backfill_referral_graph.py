@@ -0,0 +1,22 @@
+from django.db import migrations
+from users import referrals
+
+
+def backfill(apps, schema_editor):
+    """Fill ReferralPath and DownlineStats for users registered before they existed"""
+    User = apps.get_model('users', 'User')
+    ReferralPath = apps.get_model('users', 'ReferralPath')
+    DownlineStats = apps.get_model('users', 'DownlineStats')
+    referrals.build_paths(User, ReferralPath)
+    referrals.build_downline_stats(User, ReferralPath, DownlineStats)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_normalized_email_wallet'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,13 @@
 
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager as BaseUserManager
 from django.db import models
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+class UserManager(BaseUserManager):
+    def get_by_natural_key(self, username):
+        # Emails are stored lowercase
+        return super().get_by_natural_key(username.lower() if isinstance(username, str) else username)
 
 class User(AbstractUser):
     email = models.EmailField(unique=True)
@@ -23,6 +30,158 @@ class User(AbstractUser):
     
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'phone_number']
+    # Stored lowercase so case-insensitive lookups are exact matches on the unique indexes
+    NORMALIZED_FIELDS = ('email', 'wallet_address')
+
+    objects = UserManager()
+
+    class Meta(AbstractUser.Meta):
+        constraints = [
+            models.CheckConstraint(condition=models.Q(email=Lower('email')), name='user_email_lowercase'),
+            models.CheckConstraint(condition=models.Q(wallet_address=Lower('wallet_address')), name='user_wallet_address_lowercase'),
+        ]
+
+    def normalize(self):
+        deferred = self.get_deferred_fields()
+        for field in self.NORMALIZED_FIELDS:
+            value = getattr(self, field) if field not in deferred else None
+            if value:
+                setattr(self, field, value.lower())
+
+    def clean(self):
+        super().clean()
+        self.normalize()
+
+    def save(self, *args, **kwargs):
+        self.normalize()
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.email
+
+class ReferralPathManager(models.Manager):
+    def upline(self, user, depth):
+        """Ancestors of `user` up to `depth` generations, nearest first"""
+        return self.filter(descendant=user, depth__lte=depth).order_by('depth')
+
+    def downline(self, user, depth):
+        """Descendants of `user` exactly `depth` generations below"""
+        return self.filter(ancestor=user, depth=depth)
+
+    def add_user(self, user):
+        """Link a newly registered user below its referrer"""
+        if not user.referrer_id:
+            return []
+        paths = [ReferralPath(ancestor_id=user.referrer_id, descendant=user, depth=1)]
+        for ancestor_id, depth in self.filter(descendant_id=user.referrer_id).values_list('ancestor_id', 'depth'):
+            paths.append(ReferralPath(ancestor_id=ancestor_id, descendant=user, depth=depth + 1))
+        return self.bulk_create(paths)
+
+class ReferralPath(models.Model):
+    """Closure table of the referral graph: one row per (ancestor, descendant) pair"""
+    ancestor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='descendant_paths')
+    descendant = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ancestor_paths')
+    depth = models.PositiveIntegerField(help_text="Generations between ancestor and descendant (1 = direct referral)")
+
+    objects = ReferralPathManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='unique_referral_path'),
+        ]
+        indexes = [
+            models.Index(fields=['ancestor', 'depth'], name='referral_downline_idx'),
+            models.Index(fields=['descendant', 'depth'], name='referral_upline_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.depth})"
+
+class DownlineStatsManager(models.Manager):
+    def adjust(self, user, delta, ancestors=None):
+        """
+        Add `delta` to the counters of every ancestor of `user` in one UPDATE.
+        `ancestors` is an optional list of (ancestor_id, depth) if already known.
+        """
+        if ancestors is None:
+            ancestors = list(ReferralPath.objects.filter(descendant=user).values_list('ancestor_id', 'depth'))
+        if not ancestors:
+            return
+
+        ancestor_ids = [ancestor_id for ancestor_id, _ in ancestors]
+        changes = {'total': models.F('total') + delta}
+        for ancestor_id, depth in ancestors:
+            if depth <= DownlineStats.GENERATIONS:
+                field = f'generation_{depth}'
+                changes[field] = models.Case(
+                    models.When(user_id=ancestor_id, then=models.F(field) + delta),
+                    default=models.F(field)
+                )
+
+        updated = self.filter(user_id__in=ancestor_ids).update(**changes)
+        if updated < len(ancestor_ids):
+            # Ancestors registered before counters existed
+            existing = set(self.filter(user_id__in=ancestor_ids).values_list('user_id', flat=True))
+            missing = [ancestor_id for ancestor_id in ancestor_ids if ancestor_id not in existing]
+            self.bulk_create([DownlineStats(user_id=ancestor_id) for ancestor_id in missing], ignore_conflicts=True)
+            self.filter(user_id__in=missing).update(**changes)
+
+class DownlineStats(models.Model):
+    """Active downline counts per generation, maintained incrementally"""
+    GENERATIONS = 5
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='downline_stats')
+    generation_1 = models.IntegerField(default=0)
+    generation_2 = models.IntegerField(default=0)
+    generation_3 = models.IntegerField(default=0)
+    generation_4 = models.IntegerField(default=0)
+    generation_5 = models.IntegerField(default=0)
+    total = models.IntegerField(default=0, help_text="Active users in all generations")
+
+    objects = DownlineStatsManager()
+
+    class Meta:
+        verbose_name_plural = 'Downline stats'
+
+    def __str__(self):
+        return f"{self.user_id}: {self.generation_1} direct, {self.total} total"
+
+class WalletLoginChallenge(models.Model):
+    """Single-use nonce a wallet signs to log in, valid until expires_at"""
+    nonce = models.CharField(max_length=64, unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='wallet_login_challenges')
+    message = models.TextField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.user_id} - {self.nonce}"
+
+class EmailOutbox(models.Model):
+    """Emails waiting to be sent, drained by send_queued_email"""
+    STATUS_CHOICES = (
+        ('PENDING', 'Pending'),
+        ('SENT', 'Sent'),
+        ('FAILED', 'Failed'),
+    )
+
+    recipient = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(null=True, blank=True)
+    available_at = models.DateTimeField(default=timezone.now, help_text='Earliest time the next attempt may run')
+    expires_at = models.DateTimeField(null=True, blank=True, help_text='Give up instead of sending after this time')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = 'Email outbox'
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='email_outbox_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.recipient} - {self.subject} - {self.status}"
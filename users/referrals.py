@@ -0,0 +1,90 @@
+"""
+Full rebuilds of the referral closure table and downline counters from User.referrer.
+
+The models are passed in, so the data migration can run these with its
+historical models and the management commands with the real ones.
+"""
+from collections import defaultdict
+from django.db.models import Count
+
+# DownlineStats.GENERATIONS; historical models have no class attributes
+GENERATIONS = 5
+
+
+def ancestor_lists(parents, on_cycle=None):
+    """
+    Return {user_id: [referrer, referrer's referrer, ...]} for {user_id: referrer_id}.
+    A referral cycle is cut where it is found, after calling on_cycle(user_id).
+    """
+    ancestors = {}
+    for user_id in parents:
+        # Walk up until a user with known ancestors, then fill in the chain top-down
+        chain = []
+        seen = set()
+        current = user_id
+        while current is not None and current not in ancestors:
+            if current in seen:
+                if on_cycle:
+                    on_cycle(current)
+                break
+            seen.add(current)
+            chain.append(current)
+            current = parents.get(current)
+
+        above = ancestors.get(current, []) if current is not None else []
+        if current is not None and current not in seen:
+            above = [current] + above
+        for node in reversed(chain):
+            ancestors[node] = above
+            above = [node] + above
+    return ancestors
+
+
+def build_paths(User, ReferralPath, batch_size=5000, on_cycle=None):
+    """Replace every ReferralPath row; returns (paths created, users)"""
+    parents = dict(User.objects.values_list('id', 'referrer_id').iterator(chunk_size=batch_size))
+    created = 0
+    batch = []
+    ReferralPath.objects.all().delete()
+    for user_id, ancestors in ancestor_lists(parents, on_cycle).items():
+        for depth, ancestor_id in enumerate(ancestors, 1):
+            batch.append(ReferralPath(ancestor_id=ancestor_id, descendant_id=user_id, depth=depth))
+        if len(batch) >= batch_size:
+            ReferralPath.objects.bulk_create(batch)
+            created += len(batch)
+            batch = []
+    ReferralPath.objects.bulk_create(batch)
+    created += len(batch)
+    return created, len(parents)
+
+
+def build_downline_stats(User, ReferralPath, DownlineStats, batch_size=5000):
+    """Replace every DownlineStats row with counts from the closure table; returns the rows created"""
+    # One grouped scan: active descendants per (ancestor, depth)
+    counts = defaultdict(dict)
+    rows = (
+        ReferralPath.objects.filter(descendant__is_active=True)
+        .values('ancestor_id', 'depth')
+        .annotate(active=Count('descendant_id'))
+        .order_by()
+    )
+    for row in rows.iterator(chunk_size=batch_size):
+        counts[row['ancestor_id']][row['depth']] = row['active']
+
+    created = 0
+    batch = []
+    DownlineStats.objects.all().delete()
+    for user_id in User.objects.values_list('id', flat=True).iterator(chunk_size=batch_size):
+        by_depth = counts.get(user_id, {})
+        batch.append(DownlineStats(
+            user_id=user_id,
+            total=sum(by_depth.values()),
+            **{f'generation_{depth}': by_depth.get(depth, 0) for depth in range(1, GENERATIONS + 1)}
+        ))
+        if len(batch) >= batch_size:
+            DownlineStats.objects.bulk_create(batch)
+            created += len(batch)
+            batch = []
+    DownlineStats.objects.bulk_create(batch)
+    created += len(batch)
+    return created
@@ -1,13 +1,33 @@
 from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
 from django.contrib.auth import get_user_model
-from .utils import generate_verification_token, generate_otp_secret
+from django.db import transaction
+from .models import ReferralPath, DownlineStats
+from .utils import generate_verification_token, generate_otp_secret, generate_referral_code, is_plausible_referral_code
 
 User = get_user_model()
 
+class LowercaseMixin:
+    """Lowercase input before validators run, as User.NORMALIZED_FIELDS are stored"""
+    def to_internal_value(self, data):
+        return super().to_internal_value(data).lower()
+
+class LowercaseEmailField(LowercaseMixin, serializers.EmailField):
+    pass
+
+class LowercaseCharField(LowercaseMixin, serializers.CharField):
+    pass
+
 class UserRegistrationSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=False)
     referrer_code = serializers.CharField(write_only=True, required=False)
-    wallet_address = serializers.CharField(max_length=42, required=False, allow_blank=True)
+    # Exact matches on the unique indexes, instead of __iexact probes
+    email = LowercaseEmailField(required=False, allow_blank=True, validators=[
+        UniqueValidator(queryset=User.objects.all(), message='Email address already registered')
+    ])
+    wallet_address = LowercaseCharField(max_length=42, required=False, allow_blank=True, validators=[
+        UniqueValidator(queryset=User.objects.all(), message='Wallet address already registered')
+    ])
     registration_fee_tx_hash = serializers.CharField(write_only=True, required=False, allow_blank=True)
 
     class Meta:
@@ -15,24 +35,10 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         fields = ('id', 'email', 'username', 'phone_number', 'password', 'referral_code', 'referrer_code', 'wallet_address', 'registration_fee_tx_hash')
         read_only_fields = ('referral_code',)
         extra_kwargs = {
-            'email': {'required': False, 'allow_blank': True},
             'phone_number': {'required': False, 'allow_blank': True},
             'username': {'required': True},
         }
 
-    def validate_wallet_address(self, value):
-        if value:
-            # Check if address already exists
-            if User.objects.filter(wallet_address__iexact=value).exists():
-                raise serializers.ValidationError('Wallet address already registered')
-        return value
-
-    def validate_email(self, value):
-        if value:
-            if User.objects.filter(email__iexact=value).exists():
-                raise serializers.ValidationError('Email address already registered')
-        return value
-
     def validate(self, data):
         wallet_address = data.get('wallet_address')
         email = data.get('email')
@@ -42,7 +48,7 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         if wallet_address:
             # Auto-generate email if missing
             if not email:
-                data['email'] = f"{wallet_address.lower()}@wallet.local"
+                data['email'] = f"{wallet_address}@wallet.local"
         # Traditional Logic
         else:
             if not password:
@@ -58,50 +64,47 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         password = validated_data.pop('password', None)
         email = validated_data.get('email')
         
-        referrer = None
+        referrer_id = None
         if referrer_code:
-            try:
-                referrer = User.objects.get(referral_code=referrer_code)
-            except User.DoesNotExist:
-                pass # Ignore invalid referral code
-        
-        # Generate Referral Code
-        import random
-        import string
-        def generate_ref_code():
-            return ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
-            
-        referral_code = generate_ref_code()
-        while User.objects.filter(referral_code=referral_code).exists():
-            referral_code = generate_ref_code()
+            referrer_code = referrer_code.strip().upper()
+            # A mistyped code fails its check character without a query
+            if is_plausible_referral_code(referrer_code):
+                referrer_id = User.objects.filter(referral_code=referrer_code).values_list('pk', flat=True).first()
         
-        # Create User
-        if wallet_address:
-            # Wallet User
-            user = User(
-                username=validated_data['username'],
-                email=email,
-                phone_number=validated_data.get('phone_number'),
-                wallet_address=wallet_address.lower(),
-                referral_code=referral_code,
-                referrer=referrer,
-                verification_token=generate_verification_token(),
-                email_verified=True,
-                is_approved=True 
-            )
-            user.set_unusable_password()
-            user.save()
-        else:
-            # Traditional User
-            user = User.objects.create_user(
-                username=validated_data['username'],
-                email=email,
-                password=password,
-                phone_number=validated_data.get('phone_number'),
-                referral_code=referral_code,
-                referrer=referrer,
-                verification_token=generate_verification_token()
-            )
+        # Create User and link it into the referral graph
+        with transaction.atomic():
+            if wallet_address:
+                # Wallet User
+                user = User(
+                    username=validated_data['username'],
+                    email=email,
+                    phone_number=validated_data.get('phone_number') or None,
+                    wallet_address=wallet_address,
+                    referrer_id=referrer_id,
+                    verification_token=generate_verification_token(),
+                    email_verified=True,
+                    is_approved=True 
+                )
+                user.set_unusable_password()
+                user.save()
+            else:
+                # Traditional User
+                user = User.objects.create_user(
+                    username=validated_data['username'],
+                    email=email,
+                    password=password,
+                    phone_number=validated_data.get('phone_number') or None,
+                    referrer_id=referrer_id,
+                    verification_token=generate_verification_token()
+                )
+
+            # The code comes from the new id, so it is unique without probing for collisions
+            user.referral_code = generate_referral_code(user.pk)
+            User.objects.filter(pk=user.pk).update(referral_code=user.referral_code)
+
+            paths = ReferralPath.objects.add_user(user)
+            DownlineStats.objects.create(user=user)
+            DownlineStats.objects.adjust(user, 1, ancestors=[(path.ancestor_id, path.depth) for path in paths])
         
         return user
 
@@ -111,7 +114,8 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ('id', 'email', 'username', 'phone_number', 'wallet_address', 
                   'is_approved', 'email_verified', 'two_factor_enabled', 'referral_code',
                   'is_staff', 'is_superuser', 'date_joined', 'referrer')
-        read_only_fields = ('id', 'email_verified', 'is_approved', 'is_staff', 'is_superuser', 'date_joined')
+        # The referral closure table and downline counters follow `referrer`, so it is set once at registration
+        read_only_fields = ('id', 'email_verified', 'is_approved', 'is_staff', 'is_superuser', 'date_joined', 'referrer')
 
 class Enable2FASerializer(serializers.Serializer):
     otp_code = serializers.CharField(max_length=6)
@@ -123,3 +127,10 @@ class Verify2FASerializer(serializers.Serializer):
 
 class EmailVerificationSerializer(serializers.Serializer):
     token = serializers.CharField(max_length=100)
+
+class WalletLoginChallengeSerializer(serializers.Serializer):
+    wallet_address = LowercaseCharField(max_length=42)
+
+class WalletLoginSerializer(WalletLoginChallengeSerializer):
+    nonce = serializers.CharField(max_length=64)
+    signature = serializers.CharField(max_length=132)
@@ -0,0 +1,203 @@
+import contextlib
+import logging
+import re
+import secrets
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+from mlm_backend import outbox
+from wallet.models import Wallet
+from .models import User, WalletLoginChallenge, EmailOutbox
+from . import authentication
+
+logger = logging.getLogger(__name__)
+
+
+class UserApprovalService:
+    MAX_IDS = 10000
+    WALLET_BATCH_SIZE = 5000
+
+    @staticmethod
+    def pending():
+        return User.objects.filter(is_approved=False, is_active=True)
+
+    @staticmethod
+    def approve(queryset):
+        """
+        Approve every user in `queryset` with one UPDATE and give the ones
+        without a wallet an empty wallet, in batches of bulk inserts.
+        Returns {'approved', 'already_approved', 'wallets_created'}.
+        """
+        with transaction.atomic():
+            matched = queryset.count()
+
+            # Wallets first: `queryset` may select on is_approved=False.
+            # Page through users without a wallet by id; each page becomes one insert
+            missing = queryset.filter(wallet__isnull=True).order_by('pk').values_list('pk', flat=True)
+            wallets_created = 0
+            last = 0
+            while True:
+                user_ids = list(missing.filter(pk__gt=last)[:UserApprovalService.WALLET_BATCH_SIZE])
+                if not user_ids:
+                    break
+                Wallet.objects.bulk_create([Wallet(user_id=user_id) for user_id in user_ids], ignore_conflicts=True)
+                wallets_created += len(user_ids)
+                last = user_ids[-1]
+
+            approved = queryset.filter(is_approved=False).update(is_approved=True)
+            if approved:
+                authentication.invalidate_on_commit()
+
+        return {
+            'approved': approved,
+            'already_approved': matched - approved,
+            'wallets_created': wallets_created,
+        }
+
+
+class WalletLoginService:
+    """
+    Challenge-nonce wallet login.
+
+    A challenge is a random nonce stored for a registered wallet for
+    WALLET_LOGIN_CHALLENGE_TTL seconds, embedded in the message the wallet
+    signs. claim() deletes it before the signature is recovered, so replayed,
+    duplicate and expired submissions are turned away by two indexed queries
+    without reaching the elliptic-curve recovery. A failed recovery uses the
+    nonce up as well; the client asks for a new challenge.
+    """
+    MESSAGE = 'Sign in to the MLM platform\n\nWallet: {address}\nNonce: {nonce}\nExpires: {expires}'
+    SIGNATURE_RE = re.compile(r'^(0x)?[0-9a-fA-F]{130}$')
+
+    @staticmethod
+    def issue_challenge(user):
+        """Store a new nonce for `user` and return the challenge holding the message to sign"""
+        now = timezone.now()
+        WalletLoginService.purge_expired(now)
+        nonce = secrets.token_hex(16)
+        expires_at = now + timedelta(seconds=settings.WALLET_LOGIN_CHALLENGE_TTL)
+        return WalletLoginChallenge.objects.create(
+            nonce=nonce,
+            user=user,
+            message=WalletLoginService.MESSAGE.format(
+                address=user.wallet_address.lower(), nonce=nonce, expires=expires_at.isoformat()
+            ),
+            expires_at=expires_at,
+        )
+
+    @staticmethod
+    def purge_expired(now=None):
+        """Delete challenges that expired unclaimed; runs on every issue_challenge over the expires_at index"""
+        return WalletLoginChallenge.objects.filter(expires_at__lte=now or timezone.now()).delete()[0]
+
+    @staticmethod
+    def claim(wallet_address, nonce):
+        """
+        Use up the unexpired challenge `nonce` issued to `wallet_address`.
+        Returns it with its user, or None if it is unknown, expired, for another
+        wallet or was claimed first by a concurrent request.
+        """
+        challenge = (
+            WalletLoginChallenge.objects.select_related('user')
+            .filter(nonce=nonce, expires_at__gt=timezone.now()).first()
+        )
+        if challenge is None or (challenge.user.wallet_address or '').lower() != wallet_address.lower():
+            return None
+        if not WalletLoginChallenge.objects.filter(pk=challenge.pk).delete()[0]:
+            return None
+        return challenge
+
+    @staticmethod
+    def recover_signer(message, signature):
+        """Address that signed `message` (EIP-191 personal_sign), lowercased"""
+        from eth_account import Account
+        from eth_account.messages import encode_defunct
+        return Account.recover_message(encode_defunct(text=message), signature=signature).lower()
+
+    @staticmethod
+    def preload():
+        """
+        Import eth_account and run one sign/recover round trip so a worker
+        pays both costs at start instead of on its first wallet login.
+        """
+        try:
+            from eth_account import Account
+            from eth_account.messages import encode_defunct
+        except ImportError:
+            logger.warning('eth_account is not installed; wallet login is unavailable')
+            return
+        account = Account.create()
+        signed = Account.sign_message(encode_defunct(text='preload'), private_key=account.key)
+        WalletLoginService.recover_signer('preload', signed.signature.hex())
+
+
+class EmailOutboxService:
+    RETRY_DELAY = timedelta(seconds=30)
+    MAX_ATTEMPTS = 5
+    # Longer than any batch takes to send; claimed rows are retried after it if their worker died
+    CLAIM_LEASE = timedelta(minutes=10)
+    # Sent and failed emails hold OTPs and verification codes in plain text
+    RETENTION = timedelta(days=1)
+
+    @staticmethod
+    def enqueue(subject, body, recipient, expires_in=None):
+        """Queue an email for send_queued_email; `expires_in` drops it if still unsent after that timedelta"""
+        return EmailOutbox.objects.create(
+            recipient=recipient,
+            subject=subject,
+            body=body,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            expires_at=timezone.now() + expires_in if expires_in is not None else None,
+        )
+
+    @staticmethod
+    def drain(batch_size=100, max_attempts=MAX_ATTEMPTS):
+        """
+        Send one batch of due emails over a single connection to the email backend.
+
+        Entries are claimed and committed before connecting (see
+        mlm_backend.outbox.claim), so no row stays locked while the backend
+        talks to the mail server. A failed message closes the connection, so
+        the next one reconnects, and is rescheduled with a linear backoff
+        until `max_attempts` is reached. Expired entries are marked FAILED
+        without being sent. Returns the number of entries claimed.
+        """
+        entries = outbox.claim(EmailOutbox.objects.all(), batch_size, EmailOutboxService.CLAIM_LEASE)
+        if not entries:
+            return 0
+
+        now = timezone.now()
+        connection = get_connection(fail_silently=False)
+        try:
+            for entry in entries:
+                if entry.expires_at is not None and entry.expires_at <= now:
+                    entry.status = 'FAILED'
+                    entry.last_error = 'Expired before it could be sent'
+                    continue
+
+                try:
+                    connection.open()
+                    connection.send_messages([
+                        EmailMessage(entry.subject, entry.body, entry.from_email, [entry.recipient], connection=connection)
+                    ])
+                    entry.status = 'SENT'
+                    entry.sent_at = timezone.now()
+                except Exception as e:
+                    logger.warning('Sending queued email %s failed: %s', entry.pk, e)
+                    outbox.record_failure(entry, e, max_attempts, EmailOutboxService.RETRY_DELAY, now)
+                    with contextlib.suppress(Exception):
+                        connection.close()
+        finally:
+            # A failing QUIT must not lose the statuses of messages already sent
+            with contextlib.suppress(Exception):
+                connection.close()
+            EmailOutbox.objects.bulk_update(entries, ['status', 'last_error', 'available_at', 'sent_at'])
+        return len(entries)
+
+    @staticmethod
+    def purge(older_than=RETENTION):
+        """Delete sent and failed emails created more than `older_than` ago; returns the number deleted"""
+        cutoff = timezone.now() - older_than
+        return outbox.purge(EmailOutbox.objects.filter(status__in=('SENT', 'FAILED'), created_at__lt=cutoff))
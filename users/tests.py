@@ -0,0 +1,541 @@
+import socketserver
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+import pyotp
+from eth_account import Account
+from eth_account.messages import encode_defunct
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from mlm_backend import outbox
+from wallet.models import Wallet
+from wallet.tests import create_chain
+from . import authentication
+from .models import ReferralPath, DownlineStats, WalletLoginChallenge, EmailOutbox
+from .services import EmailOutboxService
+from .utils import generate_qr_code, qr_code_cache_key, generate_referral_code, is_plausible_referral_code
+
+User = get_user_model()
+
+
+class DashboardNetworkTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def register(self, name, referrer=None):
+        data = {'username': name, 'email': f'{name}@test.local', 'password': 'secret-pass-123'}
+        if referrer:
+            data['referrer_code'] = referrer.referral_code
+        response = self.client.post('/api/users/register/', data, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return User.objects.get(username=name)
+
+    def dashboard(self, user):
+        self.client.force_authenticate(user)
+        response = self.client.get('/api/mlm/stats/dashboard/')
+        self.client.force_authenticate(None)
+        return response.data
+
+    def test_direct_and_indirect_counts(self):
+        top = self.register('top')
+        middle = self.register('middle', top)
+        self.register('sibling', top)
+        leaf = self.register('leaf', middle)
+        self.register('leaf2', leaf)
+
+        data = self.dashboard(top)
+        self.assertEqual((data['directUsers'], data['indirectUsers']), (2, 2))
+
+        admin = User.objects.create_user(username='admin', email='admin@test.local', is_staff=True)
+        self.client.force_authenticate(admin)
+        self.client.post(f'/api/users/admin/users/{leaf.pk}/toggle_status/')
+        self.assertEqual(self.dashboard(top)['indirectUsers'], 1)
+        self.assertEqual(self.dashboard(middle)['directUsers'], 0)
+
+        self.client.force_authenticate(admin)
+        self.client.post(f'/api/users/admin/users/{leaf.pk}/toggle_status/')
+        self.assertEqual(self.dashboard(top)['indirectUsers'], 2)
+
+    def test_lost_status_races_are_reported(self):
+        from users.admin_views import AdminUserViewSet
+        top = self.register('top')
+        leaf = self.register('leaf', top)
+        admin = User.objects.create_user(username='admin', email='admin@test.local', is_staff=True)
+        stale = User.objects.get(pk=leaf.pk)
+        # Another request deactivated the user after this one loaded it
+        self.client.force_authenticate(admin)
+        self.client.post(f'/api/users/admin/users/{leaf.pk}/toggle_status/')
+
+        self.client.force_authenticate(admin)
+        with mock.patch.object(AdminUserViewSet, 'get_object', return_value=stale):
+            response = self.client.post(f'/api/users/admin/users/{leaf.pk}/toggle_status/')
+            self.assertEqual(response.status_code, 409)
+            self.assertIs(response.data['is_active'], False)
+            self.assertEqual(self.client.delete(f'/api/users/admin/users/{leaf.pk}/').status_code, 409)
+        self.assertEqual(self.dashboard(top)['directUsers'], 0)
+
+        self.client.force_authenticate(admin)
+        self.client.post(f'/api/users/admin/users/{leaf.pk}/toggle_status/')
+        self.assertEqual(self.client.delete(f'/api/users/admin/users/{leaf.pk}/').status_code, 204)
+        self.assertFalse(User.objects.get(pk=leaf.pk).is_active)
+        self.assertEqual(self.dashboard(top)['directUsers'], 0)
+
+    def test_django_admin_keeps_counters_in_step(self):
+        from django.contrib.admin.sites import site
+        top = self.register('top')
+        middle = self.register('middle', top)
+        leaf = self.register('leaf', middle)
+        self.register('leaf2', middle)
+        user_admin = site._registry[User]
+        request = mock.Mock(user=User.objects.create_superuser(username='root', email='root@test.local', password='x'))
+
+        leaf.is_active = False
+        user_admin.save_model(request, leaf, None, True)
+        # Saving again without a change must not count twice
+        user_admin.save_model(request, leaf, None, True)
+        self.assertEqual(self.dashboard(top)['indirectUsers'], 1)
+        self.assertEqual(self.dashboard(middle)['directUsers'], 1)
+
+        user_admin.delete_queryset(request, User.objects.filter(username__in=('leaf', 'leaf2')))
+        self.assertEqual(self.dashboard(top)['indirectUsers'], 0)
+        user_admin.delete_model(request, middle)
+        self.assertEqual(self.dashboard(top)['directUsers'], 0)
+
+    def test_rebuild_matches_incremental_counters(self):
+        top = self.register('top')
+        middle = self.register('middle', top)
+        self.register('leaf', middle)
+        expected = list(DownlineStats.objects.order_by('pk').values_list())
+
+        call_command('rebuild_downline_stats', stdout=StringIO())
+        self.assertEqual(list(DownlineStats.objects.order_by('pk').values_list()), expected)
+
+
+class BulkUserApprovalTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_user(username='approver', email='approver@test.local', is_staff=True)
+        self.pending = [
+            User.objects.create_user(username=f'pending{i}', email=f'pending{i}@test.local') for i in range(4)
+        ]
+        # One already has a wallet, one is already approved
+        Wallet.objects.create(user=self.pending[0], balance=Decimal('5'))
+        User.objects.filter(pk=self.pending[1].pk).update(is_approved=True)
+
+    def post(self, data):
+        self.client.force_authenticate(self.admin)
+        return self.client.post('/api/users/admin/users/bulk_approve/', data, format='json')
+
+    def test_approve_ids(self):
+        ids = [user.pk for user in self.pending[:3]]
+        response = self.post({'ids': ids})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'approved': 2, 'already_approved': 1, 'wallets_created': 2})
+        self.assertEqual(User.objects.filter(pk__in=ids, is_approved=True).count(), 3)
+        self.assertEqual(Wallet.objects.filter(user_id__in=ids).count(), 3)
+        self.assertEqual(Wallet.objects.get(user=self.pending[0]).balance, Decimal('5'))
+        self.assertFalse(User.objects.get(pk=self.pending[3].pk).is_approved)
+
+    def test_approve_all_pending(self):
+        with mock.patch('users.services.UserApprovalService.WALLET_BATCH_SIZE', 2):
+            response = self.post({'all_pending': True})
+        # The admin account is unapproved too
+        self.assertEqual(response.data['approved'], 4)
+        self.assertEqual(response.data['wallets_created'], 3)
+        self.assertFalse(User.objects.filter(is_approved=False).exists())
+        # The previously approved user is not touched
+        self.assertEqual(list(User.objects.filter(wallet__isnull=True)), [self.pending[1]])
+
+    def test_validation(self):
+        self.assertEqual(self.post({'ids': []}).status_code, 400)
+        self.assertEqual(self.post({'all_pending': 'yes'}).status_code, 400)
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        authentication.invalidate()
+        self.user = create_chain(1, prefix='jwt')[0]
+        self.admin = User.objects.create_user(username='jwtadmin', email='jwtadmin@test.local', is_staff=True)
+        self.client = APIClient()
+
+    def get_dashboard(self, user):
+        token = RefreshToken.for_user(user).access_token
+        return self.client.get('/api/mlm/stats/dashboard/', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_warm_requests_skip_the_user_query(self):
+        with CaptureQueriesContext(connection) as cold:
+            self.assertEqual(self.get_dashboard(self.user).status_code, 200)
+        with CaptureQueriesContext(connection) as warm:
+            self.assertEqual(self.get_dashboard(self.user).status_code, 200)
+        self.assertEqual(len(warm), len(cold) - 1)
+        self.assertFalse(any(query['sql'].startswith('SELECT "users_user"') for query in warm.captured_queries))
+
+    def test_deactivation_takes_effect_immediately(self):
+        self.assertEqual(self.get_dashboard(self.user).status_code, 200)
+
+        self.client.force_authenticate(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/users/admin/users/{self.user.pk}/toggle_status/')
+        self.client.force_authenticate(None)
+        self.assertEqual(self.get_dashboard(self.user).status_code, 401)
+
+    def test_approval_refreshes_flags(self):
+        self.assertEqual(self.get_dashboard(self.user).status_code, 200)
+        is_approved = authentication.get_fields().index('is_approved')
+        self.assertFalse(authentication.get_values(self.user.pk)[is_approved])
+
+        self.client.force_authenticate(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/users/admin/users/bulk_approve/', {'ids': [self.user.pk]}, format='json')
+        self.assertTrue(authentication.get_values(self.user.pk)[is_approved])
+
+    def test_profile_loads_the_user_row_once(self):
+        self.get_dashboard(self.user)
+        token = RefreshToken.for_user(self.user).access_token
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/users/profile/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['referral_code'], self.user.referral_code)
+        self.assertEqual(sum(query['sql'].startswith('SELECT "users_user"') for query in queries.captured_queries), 1)
+
+    def test_cached_flags_are_not_written_back(self):
+        secret = pyotp.random_base32()
+        User.objects.filter(pk=self.user.pk).update(otp_secret=secret)
+        self.assertEqual(self.get_dashboard(self.user).status_code, 200)
+        # Deactivated by a worker whose invalidation has not reached this one yet
+        User.objects.filter(pk=self.user.pk).update(is_active=False, is_approved=False)
+
+        token = RefreshToken.for_user(self.user).access_token
+        response = self.client.post('/api/users/2fa/enable/', {'otp_code': pyotp.TOTP(secret).now()},
+                                    format='json', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 200, response.data)
+        stored = User.objects.get(pk=self.user.pk)
+        self.assertTrue(stored.two_factor_enabled)
+        self.assertEqual((stored.is_active, stored.is_approved), (False, False))
+
+    def test_partial_user_saves_only_loaded_fields(self):
+        self.get_dashboard(self.user)
+        user = User.from_db('default', authentication.get_fields(), authentication.get_values(self.user.pk))
+        self.assertEqual(user.wallet.balance, Decimal('100.00'))
+        user.email_verified = True
+        user.save()
+        stored = User.objects.get(pk=self.user.pk)
+        self.assertTrue(stored.email_verified)
+        self.assertEqual(stored.referral_code, self.user.referral_code)
+        self.assertEqual(stored.password, self.user.password)
+
+
+class WalletLoginTests(TestCase):
+    def setUp(self):
+        self.account = Account.create()
+        self.user = User.objects.create_user(
+            username='walletuser', email='walletuser@wallet.local',
+            wallet_address=self.account.address, is_approved=True
+        )
+        self.client = APIClient()
+
+    def challenge(self):
+        response = self.client.post('/api/users/wallet-login/challenge/', {'wallet_address': self.account.address}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def sign(self, message, account=None):
+        return (account or self.account).sign_message(encode_defunct(text=message)).signature.hex()
+
+    def login(self, nonce, signature):
+        return self.client.post('/api/users/wallet-login/', {
+            'wallet_address': self.account.address.lower(), 'nonce': nonce, 'signature': signature
+        }, format='json')
+
+    def test_signed_challenge_logs_in_once(self):
+        challenge = self.challenge()
+        signature = self.sign(challenge['message'])
+        response = self.login(challenge['nonce'], signature)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['user']['id'], self.user.pk)
+
+        with mock.patch('users.services.WalletLoginService.recover_signer') as recover:
+            replay = self.login(challenge['nonce'], signature)
+        self.assertEqual(replay.status_code, 401)
+        recover.assert_not_called()
+
+    def test_wrong_signer_uses_up_the_nonce(self):
+        challenge = self.challenge()
+        response = self.login(challenge['nonce'], self.sign(challenge['message'], Account.create()))
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(WalletLoginChallenge.objects.filter(nonce=challenge['nonce']).exists())
+
+    def test_expired_challenge_is_rejected(self):
+        challenge = self.challenge()
+        WalletLoginChallenge.objects.filter(nonce=challenge['nonce']).update(expires_at=timezone.now())
+        self.assertEqual(self.login(challenge['nonce'], self.sign(challenge['message'])).status_code, 401)
+
+    def test_expired_challenges_are_purged(self):
+        stale = self.challenge()
+        WalletLoginChallenge.objects.filter(nonce=stale['nonce']).update(expires_at=timezone.now())
+        fresh = self.challenge()
+        self.assertEqual(list(WalletLoginChallenge.objects.values_list('nonce', flat=True)), [fresh['nonce']])
+
+    def test_malformed_input_is_rejected(self):
+        for data in ({'wallet_address': ['0xabc']}, {'wallet_address': {'a': 1}}, {}):
+            response = self.client.post('/api/users/wallet-login/challenge/', data, format='json')
+            self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/users/wallet-login/', {
+            'wallet_address': {'a': 1}, 'nonce': ['x'], 'signature': None
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {'wallet_address', 'nonce', 'signature'})
+
+    def test_unregistered_wallet_gets_no_challenge(self):
+        response = self.client.post('/api/users/wallet-login/challenge/', {'wallet_address': Account.create().address}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+
+class TwoFactorQRCodeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='qruser', email='qruser@test.local')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_qr_code(self, image='png'):
+        return self.client.get('/api/users/2fa/enable/', {'image': image})
+
+    def test_qr_code_is_generated_once_per_secret(self):
+        with mock.patch('users.utils.generate_qr_code', wraps=generate_qr_code) as generate:
+            first = self.get_qr_code()
+            second = self.get_qr_code()
+        self.assertEqual(generate.call_count, 1)
+        self.assertTrue(first.data['qr_code'].startswith('data:image/png;base64,'))
+        self.assertEqual(first.data, second.data)
+        self.user.refresh_from_db()
+        self.assertEqual(first.data['secret'], self.user.otp_secret)
+
+    def test_svg_option(self):
+        response = self.get_qr_code('svg')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['qr_code'].startswith('data:image/svg+xml,'))
+        self.assertIn('%3Cpath', response.data['qr_code'])
+        self.assertEqual(self.get_qr_code('gif').status_code, 400)
+
+    def test_disable_drops_the_cached_code(self):
+        first = self.get_qr_code()
+        self.user.refresh_from_db()
+        key = qr_code_cache_key(self.user, 'png')
+        self.assertIsNotNone(cache.get(key))
+
+        self.client.post('/api/users/2fa/disable/')
+        self.assertIsNone(cache.get(key))
+        second = self.get_qr_code()
+        self.assertNotEqual(first.data['secret'], second.data['secret'])
+        self.assertNotEqual(first.data['qr_code'], second.data['qr_code'])
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """Minimal local SMTP server recording connections and received messages"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        self.connections = 0
+        self.messages = []
+        self.reject = set()
+        super().__init__(('127.0.0.1', 0), SMTPStandInHandler)
+
+
+class SMTPStandInHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 localhost ESMTP')
+        recipients = []
+        while line := self.rfile.readline().decode().strip():
+            command = line[:4].upper()
+            if command in ('EHLO', 'HELO'):
+                self.reply('250 localhost')
+            elif command == 'RCPT':
+                recipient = line.split(':', 1)[1].strip('<> ')
+                if recipient in self.server.reject:
+                    self.reply('550 No such user')
+                else:
+                    recipients.append(recipient)
+                    self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                self.server.messages.extend(recipients)
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                recipients = [] if command in ('MAIL', 'RSET') else recipients
+                self.reply('250 OK')
+
+
+class EmailOutboxTests(TestCase):
+    def test_requests_only_queue_emails(self):
+        response = APIClient().post('/api/users/register/', {
+            'username': 'queued', 'email': 'queued@test.local', 'password': 'Str0ng-passw0rd!', 'password2': 'Str0ng-passw0rd!',
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(EmailOutbox.objects.get().recipient, 'queued@test.local')
+
+        call_command('send_queued_email', once=True, stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['queued@test.local'])
+        self.assertEqual(EmailOutbox.objects.get().status, 'SENT')
+
+    def test_expired_emails_are_not_sent(self):
+        EmailOutboxService.enqueue('Your 2FA Code', '123456', 'late@test.local', expires_in=timedelta(seconds=-1))
+        EmailOutboxService.drain()
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(EmailOutbox.objects.get().status, 'FAILED')
+
+    def test_batch_shares_one_smtp_connection_and_retries_failures(self):
+        server = SMTPStandIn()
+        server.reject.add('bounce@test.local')
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        for i in range(5):
+            EmailOutboxService.enqueue('Hello', 'Body', f'user{i}@test.local')
+        EmailOutboxService.enqueue('Hello', 'Body', 'bounce@test.local')
+
+        with self.settings(EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend', EMAIL_HOST='127.0.0.1',
+                           EMAIL_PORT=server.server_address[1], EMAIL_USE_TLS=False, EMAIL_HOST_USER=''):
+            self.assertEqual(EmailOutboxService.drain(max_attempts=2), 6)
+
+            self.assertEqual(server.connections, 1)
+            self.assertEqual(sorted(server.messages), [f'user{i}@test.local' for i in range(5)])
+            bounced = EmailOutbox.objects.get(recipient='bounce@test.local')
+            self.assertEqual((bounced.status, bounced.attempts), ('PENDING', 1))
+            self.assertGreater(bounced.available_at, timezone.now())
+
+            EmailOutbox.objects.filter(pk=bounced.pk).update(available_at=timezone.now())
+            EmailOutboxService.drain(max_attempts=2)
+            self.assertEqual(EmailOutbox.objects.get(pk=bounced.pk).status, 'FAILED')
+            self.assertEqual(EmailOutbox.objects.filter(status='SENT').count(), 5)
+
+    def test_claimed_rows_are_committed_before_sending(self):
+        EmailOutboxService.enqueue('Hello', 'Body', 'claimed@test.local')
+        claimed = outbox.claim(EmailOutbox.objects.all(), 10, EmailOutboxService.CLAIM_LEASE)
+        self.assertEqual(len(claimed), 1)
+        entry = EmailOutbox.objects.get()
+        self.assertEqual((entry.status, entry.attempts), ('PENDING', 1))
+        # Hidden from other workers until the lease ends
+        self.assertEqual(EmailOutboxService.drain(), 0)
+
+    def test_purge_deletes_old_sent_and_failed_emails(self):
+        for recipient in ('old@test.local', 'new@test.local', 'failed@test.local', 'pending@test.local'):
+            EmailOutboxService.enqueue('Your 2FA Code', '123456', recipient)
+        EmailOutbox.objects.filter(recipient='old@test.local').update(status='SENT')
+        EmailOutbox.objects.filter(recipient='failed@test.local').update(status='FAILED')
+        EmailOutbox.objects.exclude(recipient='new@test.local').update(created_at=timezone.now() - timedelta(days=2))
+        EmailOutbox.objects.filter(recipient='new@test.local').update(status='SENT')
+
+        self.assertEqual(EmailOutboxService.purge(), 2)
+        self.assertEqual(set(EmailOutbox.objects.values_list('recipient', flat=True)), {'new@test.local', 'pending@test.local'})
+
+
+class RegistrationTests(TestCase):
+    def setUp(self):
+        self.referrer = create_chain(1, prefix='reg')[0]
+        self.referrer.referral_code = generate_referral_code(self.referrer.pk)
+        self.referrer.save()
+        DownlineStats.objects.create(user=self.referrer)
+        self.client = APIClient()
+
+    def register(self, **data):
+        data = {'username': 'newuser', 'email': 'New.User@Test.local', 'password': 'Str0ng-passw0rd!', **data}
+        return self.client.post('/api/users/register/', {key: value for key, value in data.items() if value is not None}, format='json')
+
+    def test_registration_runs_a_fixed_number_of_queries(self):
+        self.assertEqual(self.register(username='warmup', email='warmup@test.local').status_code, 201)
+        # Uniqueness checks, referrer, insert, referral code, referral paths (2), downline stats (2),
+        # savepoint and release, email outbox
+        with self.assertNumQueries(12):
+            response = self.register(referrer_code=self.referrer.referral_code.lower())
+        self.assertEqual(response.status_code, 201, response.data)
+
+        user = User.objects.get(username='newuser')
+        self.assertEqual(user.email, 'new.user@test.local')
+        self.assertEqual(user.referrer, self.referrer)
+        self.assertEqual(user.referral_code, generate_referral_code(user.pk))
+        self.assertEqual(ReferralPath.objects.filter(descendant=user).count(), 1)
+
+    def test_email_and_wallet_are_unique_regardless_of_case(self):
+        self.assertEqual(self.register().status_code, 201)
+        response = self.register(username='other', email='NEW.USER@test.local')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('email', response.data)
+
+        address = '0x' + 'Ab' * 20
+        response = self.register(username='w1', email=None, password=None, wallet_address=address, registration_fee_tx_hash='0x1')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(User.objects.get(username='w1').wallet_address, address.lower())
+        response = self.register(username='w2', email=None, password=None, wallet_address=address.upper().replace('0X', '0x'),
+                                 registration_fee_tx_hash='0x2')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('wallet_address', response.data)
+
+    def test_login_is_case_insensitive(self):
+        self.register()
+        User.objects.filter(username='newuser').update(email_verified=True, is_approved=True)
+        response = self.client.post('/api/users/login/', {'email': 'NEW.user@test.local', 'password': 'Str0ng-passw0rd!'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_mistyped_referral_code_is_rejected_without_a_query(self):
+        code = self.referrer.referral_code
+        mistyped = code[1] + code[0] + code[2:] if code[0] != code[1] else code[:-1] + ('0' if code[-1] != '0' else '1')
+        self.assertFalse(is_plausible_referral_code(mistyped))
+        self.assertTrue(is_plausible_referral_code('ABCD1234'))
+        self.assertEqual(self.register(referrer_code=mistyped).status_code, 201)
+        self.assertIsNone(User.objects.get(username='newuser').referrer)
+
+
+class ReferralGraphBackfillTests(TestCase):
+    def setUp(self):
+        # Registered before the closure table: a referrer but no paths or counters
+        self.top = User.objects.create_user(username='top', email='top@test.local')
+        self.middle = User.objects.create_user(username='middle', email='middle@test.local', referrer=self.top)
+        self.leaf = User.objects.create_user(username='leaf', email='leaf@test.local', referrer=self.middle, is_active=False)
+
+    def test_migration_fills_paths_and_counters(self):
+        from django.apps import apps
+        migration = import_module('users.migrations.0008_backfill_referral_graph')
+        migration.backfill(apps, None)
+
+        self.assertEqual(
+            set(ReferralPath.objects.values_list('ancestor_id', 'descendant_id', 'depth')),
+            {(self.top.pk, self.middle.pk, 1), (self.top.pk, self.leaf.pk, 2), (self.middle.pk, self.leaf.pk, 1)},
+        )
+        # The inactive leaf is not counted
+        self.assertEqual(
+            list(DownlineStats.objects.order_by('pk').values_list('user_id', 'generation_1', 'generation_2', 'total')),
+            [(self.top.pk, 1, 0, 1), (self.middle.pk, 0, 0, 0), (self.leaf.pk, 0, 0, 0)],
+        )
+
+    def test_referrer_cannot_be_changed_by_admins(self):
+        admin = User.objects.create_user(username='admin', email='admin@test.local', is_staff=True)
+        client = APIClient()
+        client.force_authenticate(admin)
+        response = client.patch(f'/api/users/admin/users/{self.leaf.pk}/', {'referrer': self.top.pk}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(User.objects.get(pk=self.leaf.pk).referrer_id, self.middle.pk)
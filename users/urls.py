@@ -3,7 +3,7 @@ from rest_framework.routers import DefaultRouter
 from .admin_views import AdminUserViewSet, VerifyAdminPasswordView
 from .views import (
     RegisterView, VerifyEmailView, ResendVerificationView,
-    Enable2FAView, Disable2FAView, LoginView, WalletLoginView, SendOTPEmailView,
+    Enable2FAView, Disable2FAView, LoginView, WalletLoginChallengeView, WalletLoginView, SendOTPEmailView,
     UserProfileView
 )
 
@@ -14,6 +14,7 @@ urlpatterns = [
     path('', include(router.urls)),
     path('register/', RegisterView.as_view(), name='register'),
     path('login/', LoginView.as_view(), name='login'),
+    path('wallet-login/challenge/', WalletLoginChallengeView.as_view(), name='wallet-login-challenge'),
     path('wallet-login/', WalletLoginView.as_view(), name='wallet-login'),
     path('verify-email/', VerifyEmailView.as_view(), name='verify-email'),
     path('resend-verification/', ResendVerificationView.as_view(), name='resend-verification'),
@@ -1,15 +1,61 @@
+import hashlib
 import secrets
+from datetime import timedelta
+from urllib.parse import quote
 import pyotp
-from django.core.mail import send_mail
-from django.conf import settings
+from django.core.cache import cache
 from io import BytesIO
 import qrcode
 import base64
+from .services import EmailOutboxService
+
+QR_CODE_FORMATS = ('png', 'svg')
+QR_CODE_CACHE_TIMEOUT = 600
+OTP_EMAIL_TTL = timedelta(seconds=60)
+
+# Crockford base32: no I, L, O or U
+REFERRAL_CODE_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+REFERRAL_CODE_DIGITS = 8
+# Odd, so multiplying ids by it modulo 32**8 is a permutation and codes do not spell out the id
+REFERRAL_CODE_MULTIPLIER = 0x5DEECE66D
 
 def generate_verification_token():
     """Generate a random verification token"""
     return secrets.token_urlsafe(32)
 
+def referral_code_check_character(digits):
+    """Luhn mod 32 check character, catching any single wrong or two swapped adjacent characters"""
+    base = len(REFERRAL_CODE_ALPHABET)
+    total = 0
+    for position, char in enumerate(reversed(digits)):
+        addend = REFERRAL_CODE_ALPHABET.index(char) * (2 if position % 2 == 0 else 1)
+        total += addend // base + addend % base
+    return REFERRAL_CODE_ALPHABET[-total % base]
+
+def generate_referral_code(user_id):
+    """
+    Referral code derived from the user id: 8 base32 characters and a check
+    character. Distinct ids give distinct codes, so no existence check is needed,
+    and their length sets them apart from the 8-character random codes issued before.
+    """
+    space = len(REFERRAL_CODE_ALPHABET) ** REFERRAL_CODE_DIGITS
+    if not 0 < user_id < space:
+        raise ValueError(f'User id {user_id} is outside the referral code space')
+    value = user_id * REFERRAL_CODE_MULTIPLIER % space
+    digits = ''
+    for _ in range(REFERRAL_CODE_DIGITS):
+        value, remainder = divmod(value, len(REFERRAL_CODE_ALPHABET))
+        digits = REFERRAL_CODE_ALPHABET[remainder] + digits
+    return digits + referral_code_check_character(digits)
+
+def is_plausible_referral_code(code):
+    """False for codes in the generated format with a wrong check character; older formats always pass"""
+    if len(code) != REFERRAL_CODE_DIGITS + 1:
+        return True
+    if any(char not in REFERRAL_CODE_ALPHABET for char in code):
+        return False
+    return referral_code_check_character(code[:-1]) == code[-1]
+
 def generate_otp_secret():
     """Generate a random OTP secret for 2FA"""
     return pyotp.random_base32()
@@ -38,8 +84,64 @@ def generate_qr_code(uri):
     buffer.seek(0)
     return base64.b64encode(buffer.getvalue()).decode()
 
+def generate_qr_svg(uri):
+    """
+    Generate the same QR code as SVG markup, one stroked line per run of
+    dark modules, so nothing is rasterized or compressed
+    """
+    border = 5
+    qr = qrcode.QRCode(version=1, border=border)
+    qr.add_data(uri)
+    qr.make(fit=True)
+    
+    size = qr.modules_count + 2 * border
+    # Relative moves from the end of the previous run keep the path short
+    path = []
+    end = None
+    for y, row in enumerate(qr.modules):
+        x = 0
+        while x < len(row):
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < len(row) and row[x]:
+                x += 1
+            if end is None:
+                path.append(f'M{start + border} {y + border}.5h{x - start}')
+            else:
+                path.append(f'm{start - end[0]} {y - end[1]}h{x - start}')
+            end = (x, y)
+    return (
+        f"<svg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 {size} {size}' shape-rendering='crispEdges'>"
+        f"<rect width='{size}' height='{size}' fill='white'/><path stroke='black' d='{''.join(path)}'/></svg>"
+    )
+
+def qr_code_cache_key(user, image_format):
+    # The secret and email are part of the encoded URI; hash them rather than storing them in the key
+    digest = hashlib.sha256(f'{user.otp_secret}:{user.email}'.encode()).hexdigest()[:32]
+    return f'2fa_qr:{user.pk}:{digest}:{image_format}'
+
+def get_qr_code(user, image_format='png'):
+    """2FA QR code data URI for the user's current otp_secret, cached per user, secret and format"""
+    key = qr_code_cache_key(user, image_format)
+    data_uri = cache.get(key)
+    if data_uri is None:
+        uri = get_otp_uri(user, user.otp_secret)
+        if image_format == 'svg':
+            # Percent-encoded rather than base64: the markup only has a few characters to escape
+            data_uri = 'data:image/svg+xml,' + quote(generate_qr_svg(uri), safe=" '=/:.,")
+        else:
+            data_uri = f'data:image/png;base64,{generate_qr_code(uri)}'
+        cache.set(key, data_uri, QR_CODE_CACHE_TIMEOUT)
+    return data_uri
+
+def clear_qr_code(user):
+    """Drop the cached QR codes for the user's current otp_secret"""
+    cache.delete_many([qr_code_cache_key(user, image_format) for image_format in QR_CODE_FORMATS])
+
 def send_verification_email(user, token):
-    """Send email verification link"""
+    """Queue the email verification link"""
     verification_link = f"http://localhost:5173/verify-email?token={token}"
     subject = 'Verify your email address'
     message = f'''
@@ -53,16 +155,10 @@ def send_verification_email(user, token):
     Best regards,
     MLM System Team
     '''
-    send_mail(
-        subject,
-        message,
-        settings.DEFAULT_FROM_EMAIL,
-        [user.email],
-        fail_silently=False,
-    )
+    EmailOutboxService.enqueue(subject, message, user.email)
 
 def send_otp_email(user):
-    """Send OTP code via email"""
+    """Queue the current OTP code via email"""
     if not user.otp_secret:
         return False
     
@@ -82,11 +178,6 @@ def send_otp_email(user):
     Best regards,
     MLM System Team
     '''
-    send_mail(
-        subject,
-        message,
-        settings.DEFAULT_FROM_EMAIL,
-        [user.email],
-        fail_silently=False,
-    )
+    # verify_otp accepts a code for at most one step after its own; a later email is useless
+    EmailOutboxService.enqueue(subject, message, user.email, expires_in=OTP_EMAIL_TTL)
     return True
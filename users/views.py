@@ -5,12 +5,14 @@ from django.contrib.auth import authenticate, get_user_model
 from django.conf import settings
 from .serializers import (
     UserRegistrationSerializer, UserSerializer, 
-    Enable2FASerializer, Verify2FASerializer, EmailVerificationSerializer
+    Enable2FASerializer, Verify2FASerializer, EmailVerificationSerializer,
+    WalletLoginChallengeSerializer, WalletLoginSerializer
 )
 from .utils import (
     send_verification_email, send_otp_email, generate_otp_secret,
-    get_otp_uri, generate_qr_code, verify_otp
+    get_qr_code, clear_qr_code, verify_otp, QR_CODE_FORMATS
 )
+from .services import WalletLoginService
 
 User = get_user_model()
 
@@ -19,8 +21,8 @@ class RegisterView(generics.CreateAPIView):
     permission_classes = [AllowAny]
     
     def create(self, request, *args, **kwargs):
-        from wallet.models import Transaction, SystemSettings
-        from decimal import Decimal
+        from wallet.models import Transaction
+        from wallet import system_settings
         
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -30,11 +32,7 @@ class RegisterView(generics.CreateAPIView):
         wallet_address = serializer.validated_data.get('wallet_address')
         
         # Get registration fee amount
-        try:
-            fee_setting = SystemSettings.objects.get(key='registration_fee')
-            registration_fee = Decimal(fee_setting.value)
-        except (SystemSettings.DoesNotExist, Exception):
-            registration_fee = Decimal('10.00')  # Default fee
+        registration_fee = system_settings.get_decimal('registration_fee')
         
         # For wallet-based registration, registration fee is required IF fee > 0
         if wallet_address and registration_fee > 0 and not registration_fee_tx_hash:
@@ -96,7 +94,8 @@ class ResendVerificationView(views.APIView):
         
         from .utils import generate_verification_token
         user.verification_token = generate_verification_token()
-        user.save()
+        # request.user carries cached flags; writing them back could undo an admin's change
+        user.save(update_fields=['verification_token'])
         
         send_verification_email(user, user.verification_token)
         return Response({'message': 'Verification email sent'})
@@ -109,15 +108,20 @@ class Enable2FAView(views.APIView):
         if user.two_factor_enabled:
             return Response({'error': '2FA already enabled'}, status=status.HTTP_400_BAD_REQUEST)
         
-        if not user.otp_secret:
-            user.otp_secret = generate_otp_secret()
-            user.save()
+        image_format = request.query_params.get('image', 'png')
+        if image_format not in QR_CODE_FORMATS:
+            return Response({'error': f'image must be one of: {", ".join(QR_CODE_FORMATS)}'}, status=status.HTTP_400_BAD_REQUEST)
         
-        uri = get_otp_uri(user, user.otp_secret)
-        qr_code = generate_qr_code(uri)
+        if not user.otp_secret:
+            # Only set a secret if none was stored meanwhile, e.g. by a request from another tab
+            secret = generate_otp_secret()
+            if User.objects.filter(pk=user.pk, otp_secret=user.otp_secret).update(otp_secret=secret):
+                user.otp_secret = secret
+            else:
+                user.refresh_from_db(fields=['otp_secret'])
         
         return Response({
-            'qr_code': f'data:image/png;base64,{qr_code}',
+            'qr_code': get_qr_code(user, image_format),
             'secret': user.otp_secret
         })
     
@@ -132,7 +136,7 @@ class Enable2FAView(views.APIView):
         
         if verify_otp(user.otp_secret, otp_code):
             user.two_factor_enabled = True
-            user.save()
+            user.save(update_fields=['two_factor_enabled'])
             return Response({'message': '2FA enabled successfully'})
         else:
             return Response({'error': 'Invalid OTP code'}, status=status.HTTP_400_BAD_REQUEST)
@@ -142,9 +146,10 @@ class Disable2FAView(views.APIView):
     
     def post(self, request):
         user = request.user
+        clear_qr_code(user)
         user.two_factor_enabled = False
         user.otp_secret = None
-        user.save()
+        user.save(update_fields=['two_factor_enabled', 'otp_secret'])
         return Response({'message': '2FA disabled successfully'})
 
 class LoginView(views.APIView):
@@ -187,58 +192,75 @@ class LoginView(views.APIView):
             'user': UserSerializer(user).data
         })
 
+class WalletLoginChallengeView(views.APIView):
+    permission_classes = [AllowAny]
+    
+    def post(self, request):
+        serializer = WalletLoginChallengeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        wallet_address = serializer.validated_data['wallet_address']
+        
+        user = User.objects.filter(wallet_address=wallet_address).first()
+        if user is None:
+            return Response({'error': 'Wallet not registered'}, status=status.HTTP_404_NOT_FOUND)
+        
+        challenge = WalletLoginService.issue_challenge(user)
+        return Response({
+            'nonce': challenge.nonce,
+            'message': challenge.message,
+            'expires_at': challenge.expires_at,
+        })
+
 class WalletLoginView(views.APIView):
     permission_classes = [AllowAny]
     
     def post(self, request):
         from rest_framework_simplejwt.tokens import RefreshToken
-        from eth_account.messages import encode_defunct
-        from eth_account import Account
         
-        wallet_address = request.data.get('wallet_address', '').lower()
-        signature = request.data.get('signature')
-        message = request.data.get('message')
+        serializer = WalletLoginSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        wallet_address = serializer.validated_data['wallet_address']
+        signature = serializer.validated_data['signature']
+        nonce = serializer.validated_data['nonce']
+        
+        if not WalletLoginService.SIGNATURE_RE.match(signature):
+            return Response({'error': 'Invalid signature'}, status=status.HTTP_400_BAD_REQUEST)
         
-        if not wallet_address or not signature or not message:
-            return Response({'error': 'Missing credentials'}, status=status.HTTP_400_BAD_REQUEST)
+        # Replays and duplicates stop here, before the signature is recovered
+        challenge = WalletLoginService.claim(wallet_address, nonce)
+        if challenge is None:
+            return Response({'error': 'Login challenge expired or already used'}, status=status.HTTP_401_UNAUTHORIZED)
         
         try:
-            # Verify Signature
-            encoded_message = encode_defunct(text=message)
-            recovered_address = Account.recover_message(encoded_message, signature=signature)
-            
-            if recovered_address.lower() != wallet_address:
-                return Response({'error': 'Signature verification failed'}, status=status.HTTP_401_UNAUTHORIZED)
-            
-            # Get User
-            user = User.objects.get(wallet_address__iexact=wallet_address)
-            
-            if not user.is_approved:
-                return Response({'error': 'Account pending approval'}, status=status.HTTP_403_FORBIDDEN)
-            
-            refresh = RefreshToken.for_user(user)
-            
-            return Response({
-                'message': 'Login successful',
-                'access': str(refresh.access_token),
-                'refresh': str(refresh),
-                'user': UserSerializer(user).data
-            })
-            
-        except User.DoesNotExist:
-            return Response({'error': 'Wallet not registered'}, status=status.HTTP_404_NOT_FOUND)
+            recovered_address = WalletLoginService.recover_signer(challenge.message, signature)
         except Exception as e:
             import logging
             logging.getLogger(__name__).error(f"Wallet login error: {e}")
             return Response({'error': 'Login failed'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if recovered_address != wallet_address:
+            return Response({'error': 'Signature verification failed'}, status=status.HTTP_401_UNAUTHORIZED)
+        
+        user = challenge.user
+        if not user.is_approved:
+            return Response({'error': 'Account pending approval'}, status=status.HTTP_403_FORBIDDEN)
+        
+        refresh = RefreshToken.for_user(user)
+        
+        return Response({
+            'message': 'Login successful',
+            'access': str(refresh.access_token),
+            'refresh': str(refresh),
+            'user': UserSerializer(user).data
+        })
 
 class SendOTPEmailView(views.APIView):
     permission_classes = [AllowAny]
     
     def post(self, request):
-        email = request.data.get('email')
+        email = request.data.get('email') or ''
         try:
-            user = User.objects.get(email=email)
+            user = User.objects.get(email=email.lower())
             if user.two_factor_enabled:
                 send_otp_email(user)
                 return Response({'message': 'OTP sent'})
@@ -251,4 +273,5 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = UserSerializer
     def get_object(self):
-        return self.request.user
+        # request.user only has the authentication columns loaded; read the whole row at once
+        return User.objects.get(pk=self.request.user.pk)
@@ -1,13 +1,33 @@
+from decimal import Decimal
 from django.contrib import admin
+from django.db.models import DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.utils.html import format_html
-from django.utils import timezone
-from .models import Wallet, Transaction
+from django.db import transaction as db_transaction
+from .models import Wallet, WalletStripe, Transaction, SystemSettings
+from . import system_settings
 
 @admin.register(Wallet)
 class WalletAdmin(admin.ModelAdmin):
-    list_display = ('user', 'balance', 'address', 'created_at')
+    list_display = ('user', 'total_balance', 'address', 'created_at')
     search_fields = ('user__username', 'user__email', 'address')
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('created_at', 'updated_at', 'total_balance')
+
+    def get_queryset(self, request):
+        # Include credits still held in stripes so system funds show one logical balance
+        striped = (
+            WalletStripe.objects.filter(user_id=OuterRef('user_id'))
+            .values('user_id')
+            .annotate(total=Sum('balance'))
+            .values('total')
+        )
+        return super().get_queryset(request).annotate(
+            striped_balance=Coalesce(Subquery(striped), Value(Decimal('0')), output_field=DecimalField(max_digits=20, decimal_places=8))
+        )
+
+    def total_balance(self, obj):
+        return obj.balance + obj.striped_balance
+    total_balance.short_description = 'Balance'
 
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
@@ -15,6 +35,7 @@ class TransactionAdmin(admin.ModelAdmin):
     list_filter = ('transaction_type', 'status', 'created_at')
     search_fields = ('user__username', 'user__email', 'tx_hash')
     readonly_fields = ('created_at', 'processed_at', 'processed_by')
+    actions = ['approve_selected', 'reject_selected']
     
     fieldsets = (
         ('Transaction Info', {
@@ -38,6 +59,25 @@ class TransactionAdmin(admin.ModelAdmin):
         return format_html('<span style="color: green;">Processed</span>')
     action_buttons.short_description = 'Actions'
     
+    def review_selected(self, request, queryset, approve):
+        from django.contrib import messages
+        from .services import TransactionReviewService
+        
+        ids = list(queryset.filter(status='PENDING').values_list('pk', flat=True))
+        result = TransactionReviewService.review(ids, request.user, approve)
+        verb = 'approved' if approve else 'rejected'
+        self.message_user(request, f"{len(result['processed'])} transactions {verb}", messages.SUCCESS)
+        if result['skipped']:
+            self.message_user(request, f"{len(result['skipped'])} skipped (not a pending deposit/withdrawal, or being processed)", messages.WARNING)
+    
+    @admin.action(description='Approve selected pending deposits/withdrawals')
+    def approve_selected(self, request, queryset):
+        self.review_selected(request, queryset, approve=True)
+    
+    @admin.action(description='Reject selected pending deposits/withdrawals (refunds withdrawals)')
+    def reject_selected(self, request, queryset):
+        self.review_selected(request, queryset, approve=False)
+    
     def get_urls(self):
         from django.urls import path
         urls = super().get_urls()
@@ -47,41 +87,39 @@ class TransactionAdmin(admin.ModelAdmin):
         ]
         return custom_urls + urls
     
-    def approve_transaction(self, request, pk):
+    def review_transaction(self, request, pk, approve):
         from django.shortcuts import redirect
         from django.contrib import messages
+        from .services import TransactionReviewService
         
-        transaction = Transaction.objects.get(pk=pk)
-        wallet = transaction.user.wallet
-        
-        if transaction.transaction_type == 'DEPOSIT':
-            wallet.balance += transaction.amount
-            wallet.save()
-        elif transaction.transaction_type == 'WITHDRAWAL':
-            if wallet.balance >= transaction.amount:
-                wallet.balance -= transaction.amount
-                wallet.save()
-            else:
-                messages.error(request, 'Insufficient balance for withdrawal')
-                return redirect('admin:wallet_transaction_changelist')
-        
-        transaction.status = 'COMPLETED'
-        transaction.processed_by = request.user
-        transaction.processed_at = timezone.now()
-        transaction.save()
-        
-        messages.success(request, f'Transaction {pk} approved successfully')
+        result = TransactionReviewService.review([pk], request.user, approve)
+        if result['processed']:
+            messages.success(request, f"Transaction {pk} {'approved successfully' if approve else 'rejected'}")
+        else:
+            messages.error(request, f'Transaction {pk} is not a pending deposit/withdrawal, or is being processed')
         return redirect('admin:wallet_transaction_changelist')
     
+    def approve_transaction(self, request, pk):
+        return self.review_transaction(request, pk, approve=True)
+    
     def reject_transaction(self, request, pk):
-        from django.shortcuts import redirect
-        from django.contrib import messages
-        
-        transaction = Transaction.objects.get(pk=pk)
-        transaction.status = 'REJECTED'
-        transaction.processed_by = request.user
-        transaction.processed_at = timezone.now()
-        transaction.save()
-        
-        messages.success(request, f'Transaction {pk} rejected')
-        return redirect('admin:wallet_transaction_changelist')
+        return self.review_transaction(request, pk, approve=False)
+
+@admin.register(SystemSettings)
+class SystemSettingsAdmin(admin.ModelAdmin):
+    list_display = ('key', 'value', 'updated_by', 'updated_at')
+    search_fields = ('key', 'value')
+    readonly_fields = ('updated_at', 'updated_by')
+
+    def save_model(self, request, obj, form, change):
+        obj.updated_by = request.user
+        super().save_model(request, obj, form, change)
+        db_transaction.on_commit(system_settings.bump_version)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        db_transaction.on_commit(system_settings.bump_version)
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        db_transaction.on_commit(system_settings.bump_version)
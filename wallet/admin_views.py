@@ -1,9 +1,16 @@
+import logging
+import time
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.utils import timezone
+from django.http import StreamingHttpResponse
+from . import export as transaction_export
 from .models import Transaction
-from .serializers import TransactionSerializer
+from .pagination import TransactionPagination
+from .serializers import TransactionSerializer, TransactionRowSerializer
+from .services import TransactionReviewService
+
+logger = logging.getLogger(__name__)
 
 class IsAdminUser(permissions.BasePermission):
     def has_permission(self, request, view):
@@ -13,47 +20,96 @@ class AdminTransactionViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Transaction.objects.all().order_by('-created_at')
     serializer_class = TransactionSerializer
     permission_classes = [permissions.IsAuthenticated, IsAdminUser]
+    pagination_class = TransactionPagination
     filterset_fields = ['status', 'transaction_type']
     
-    @action(detail=True, methods=['post'])
-    def approve(self, request, pk=None):
+    def list(self, request, *args, **kwargs):
+        # Read-only fast path: .values() rows with precompiled converters instead of model instances
+        rows = TransactionRowSerializer.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        return self.get_paginated_response(TransactionRowSerializer.serialize(page))
+    
+    def review_one(self, request, approve):
         transaction = self.get_object()
         
-        if transaction.status != 'PENDING':
+        if transaction.transaction_type not in TransactionReviewService.REVIEWABLE_TYPES:
+            return Response({'error': 'Invalid transaction type for approval'}, status=status.HTTP_400_BAD_REQUEST)
+        # Same path as the bulk endpoints: withdrawals were held when requested, so
+        # approving only stamps them and rejecting refunds them
+        result = TransactionReviewService.review([transaction.pk], request.user, approve)
+        if not result['processed']:
             return Response({'error': 'Transaction already processed'}, status=status.HTTP_400_BAD_REQUEST)
         
-        wallet = transaction.user.wallet
-        
-        if transaction.transaction_type == 'DEPOSIT':
-            wallet.balance += transaction.amount
-            wallet.save()
-            transaction.status = 'COMPLETED'
-        elif transaction.transaction_type == 'WITHDRAWAL':
-            if wallet.balance >= transaction.amount:
-                wallet.balance -= transaction.amount
-                wallet.save()
-                transaction.status = 'COMPLETED'
-            else:
-                return Response({'error': 'Insufficient balance'}, status=status.HTTP_400_BAD_REQUEST)
-        else:
-             return Response({'error': 'Invalid transaction type for approval'}, status=status.HTTP_400_BAD_REQUEST)
-             
-        transaction.processed_by = request.user
-        transaction.processed_at = timezone.now()
-        transaction.save()
-        
-        return Response({'message': 'Transaction approved successfully'})
+        return Response({'message': 'Transaction approved successfully' if approve else 'Transaction rejected'})
+    
+    @action(detail=True, methods=['post'])
+    def approve(self, request, pk=None):
+        return self.review_one(request, approve=True)
     
     @action(detail=True, methods=['post'])
     def reject(self, request, pk=None):
-        transaction = self.get_object()
+        """Reject a pending deposit/withdrawal, refunding withdrawals"""
+        return self.review_one(request, approve=False)
+    
+    def bulk_review(self, request, approve):
+        ids = request.data.get('ids')
+        if not isinstance(ids, list) or not ids or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+            return Response({'error': 'A non-empty list of transaction ids is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > TransactionReviewService.MAX_BATCH_SIZE:
+            return Response({
+                'error': f'At most {TransactionReviewService.MAX_BATCH_SIZE} transactions per batch'
+            }, status=status.HTTP_400_BAD_REQUEST)
         
-        if transaction.status != 'PENDING':
-            return Response({'error': 'Transaction already processed'}, status=status.HTTP_400_BAD_REQUEST)
-            
-        transaction.status = 'REJECTED'
-        transaction.processed_by = request.user
-        transaction.processed_at = timezone.now()
-        transaction.save()
+        result = TransactionReviewService.review(ids, request.user, approve)
+        return Response({
+            'approved' if approve else 'rejected': len(result['processed']),
+            'skipped': len(result['skipped']),
+            'processed_ids': result['processed'],
+            'skipped_ids': result['skipped']
+        })
+    
+    @action(detail=False, methods=['post'])
+    def bulk_approve(self, request):
+        """Approve pending deposits/withdrawals: {"ids": [...]}"""
+        return self.bulk_review(request, approve=True)
+    
+    @action(detail=False, methods=['post'])
+    def bulk_reject(self, request):
+        """Reject pending deposits/withdrawals, refunding withdrawals: {"ids": [...]}"""
+        return self.bulk_review(request, approve=False)
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream transactions as CSV or NDJSON.
+        Query params: output (csv|ndjson), start, end (ISO date or datetime), transaction_type, status
+        """
+        params = request.query_params
+        output = params.get('output', 'csv')
+        if output not in transaction_export.FORMATS:
+            return Response({'error': f"output must be one of {', '.join(transaction_export.FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        if params.get('transaction_type') and params['transaction_type'] not in dict(Transaction.TRANSACTION_TYPES):
+            return Response({'error': 'Invalid transaction_type'}, status=status.HTTP_400_BAD_REQUEST)
+        if params.get('status') and params['status'] not in dict(Transaction.STATUS_CHOICES):
+            return Response({'error': 'Invalid status'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            start = transaction_export.parse_bound(params['start']) if params.get('start') else None
+            end = transaction_export.parse_bound(params['end'], end=True) if params.get('end') else None
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        queryset = transaction_export.filter_transactions(start, end, params.get('transaction_type'), params.get('status'))
+        
+        def stream():
+            stats = {'rows': 0}
+            started = time.perf_counter()
+            yield from transaction_export.iter_export(queryset, output, stats=stats)
+            elapsed = time.perf_counter() - started
+            logger.info(
+                'Transaction export by %s: %d rows in %.2fs (%.0f rows/s)',
+                request.user.username, stats['rows'], elapsed, stats['rows'] / elapsed if elapsed else 0
+            )
         
-        return Response({'message': 'Transaction rejected'})
+        response = StreamingHttpResponse(stream(), content_type=transaction_export.CONTENT_TYPES[output])
+        response['Content-Disposition'] = f'attachment; filename="transactions.{output}"'
+        return response
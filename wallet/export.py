@@ -0,0 +1,123 @@
+"""
+Streaming Transaction export in CSV and NDJSON.
+
+Rows are read as tuples in primary-key chunks and encoded one chunk at a time,
+so memory stays flat however many rows match. PostgreSQL and SQLite stream
+through `.iterator(chunk_size=...)`; MySQLdb buffers a whole result set
+client-side, so on MySQL each chunk is fetched with its own `id > last` query.
+"""
+import csv
+import io
+from datetime import datetime, time, timedelta
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .models import Transaction
+
+FORMATS = ('csv', 'ndjson')
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+DEFAULT_CHUNK_SIZE = 2000
+
+FIELDS = (
+    'id',
+    'user_id',
+    'user__username',
+    'transaction_type',
+    'status',
+    'amount',
+    'tx_hash',
+    'description',
+    'processed_by_id',
+    'processed_at',
+    'created_at',
+)
+COLUMNS = tuple(field.replace('user__username', 'username') for field in FIELDS)
+
+
+def parse_bound(value, end=False):
+    """
+    Parse an ISO date or datetime into an aware datetime. A bare date as the
+    end bound covers that whole day. Raises ValueError if malformed.
+    """
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Invalid date: {value}')
+        parsed = datetime.combine(day + timedelta(days=1) if end else day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def filter_transactions(start=None, end=None, transaction_type=None, status=None):
+    """Return the export queryset; `end` is exclusive"""
+    queryset = Transaction.objects.all()
+    if start:
+        queryset = queryset.filter(created_at__gte=start)
+    if end:
+        queryset = queryset.filter(created_at__lt=end)
+    if transaction_type:
+        queryset = queryset.filter(transaction_type=transaction_type)
+    if status:
+        queryset = queryset.filter(status=status)
+    return queryset.values_list(*FIELDS).order_by('pk')
+
+
+def iter_rows(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    if connection.vendor != 'mysql':
+        yield from queryset.iterator(chunk_size=chunk_size)
+        return
+
+    last = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last)[:chunk_size])
+        yield from chunk
+        if len(chunk) < chunk_size:
+            return
+        last = chunk[-1][0]
+
+
+def _chunks(rows, chunk_size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_csv(queryset, chunk_size=DEFAULT_CHUNK_SIZE, stats=None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    yield buffer.getvalue()
+
+    for chunk in _chunks(iter_rows(queryset, chunk_size), chunk_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(chunk)
+        if stats is not None:
+            stats['rows'] += len(chunk)
+        yield buffer.getvalue()
+
+
+def iter_ndjson(queryset, chunk_size=DEFAULT_CHUNK_SIZE, stats=None):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for chunk in _chunks(iter_rows(queryset, chunk_size), chunk_size):
+        if stats is not None:
+            stats['rows'] += len(chunk)
+        yield ''.join(encoder.encode(dict(zip(COLUMNS, row))) + '\n' for row in chunk)
+
+
+def iter_export(queryset, export_format, chunk_size=DEFAULT_CHUNK_SIZE, stats=None):
+    """Yield encoded text chunks; `stats['rows']` is incremented as rows are written"""
+    if export_format == 'ndjson':
+        return iter_ndjson(queryset, chunk_size, stats)
+    return iter_csv(queryset, chunk_size, stats)
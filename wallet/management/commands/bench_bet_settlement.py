@@ -0,0 +1,86 @@
+"""
+Management command to compare single-bet and batch bet settlement throughput
+Usage: python manage.py bench_bet_settlement [--bets 2000] [--batch-size 500] [--users 200]
+
+Synthetic users, wallets and results are created inside a transaction that is
+rolled back at the end, so the database is left untouched.
+"""
+import random
+import time
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIClient
+from mlm_backend.bench import Rollback
+from users.models import ReferralPath
+from wallet.models import Wallet
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Measure bets per second for process_bet against settle_bets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bets', type=int, default=2000, help='Bets per run (default: 2000)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Bets per settle_bets call (default: 500)')
+        parser.add_argument('--users', type=int, default=200, help='Synthetic bettors (default: 200)')
+        parser.add_argument('--loss-ratio', type=float, default=0.6, help='Share of losing bets (default: 0.6)')
+
+    def create_users(self, count):
+        """Create `count` users in referral chains of 6 so every loss has a full upline"""
+        users = []
+        referrer = None
+        for i in range(count):
+            if i % 6 == 0:
+                referrer = None
+            user = User.objects.create_user(username=f'bench_bet_{i}', email=f'bench_bet_{i}@bench.local', referrer=referrer)
+            ReferralPath.objects.add_user(user)
+            users.append(user)
+            referrer = user
+        Wallet.objects.bulk_create([Wallet(user=user, balance=Decimal('1000000')) for user in users])
+        return users
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        try:
+            with transaction.atomic():
+                users = self.create_users(options['users'])
+                admin = User.objects.create_user(username='bench_bet_admin', email='bench_bet_admin@bench.local', is_staff=True)
+                bets = [
+                    {
+                        'user': rng.choice(users).pk,
+                        'amount': '10.00',
+                        'is_win': rng.random() >= options['loss_ratio'],
+                        'win_amount': '18.00'
+                    }
+                    for _ in range(options['bets'])
+                ]
+                by_id = {user.pk: user for user in users}
+
+                client = APIClient()
+                started = time.perf_counter()
+                for bet in bets:
+                    client.force_authenticate(by_id[bet['user']])
+                    client.post('/api/wallet/transactions/process_bet/', bet, format='json')
+                single_elapsed = time.perf_counter() - started
+
+                client.force_authenticate(admin)
+                batch_size = options['batch_size']
+                started = time.perf_counter()
+                for start in range(0, len(bets), batch_size):
+                    response = client.post('/api/wallet/transactions/settle_bets/', {'bets': bets[start:start + batch_size]}, format='json')
+                    if response.status_code != 200:
+                        self.stderr.write(f'settle_bets failed: {response.data}')
+                batch_elapsed = time.perf_counter() - started
+
+                raise Rollback
+        except Rollback:
+            pass
+
+        single_rate = len(bets) / single_elapsed
+        batch_rate = len(bets) / batch_elapsed
+        self.stdout.write(f'process_bet:  {len(bets)} bets in {single_elapsed:.2f}s ({single_rate:,.0f} bets/s)')
+        self.stdout.write(f'settle_bets:  {len(bets)} bets in {batch_elapsed:.2f}s ({batch_rate:,.0f} bets/s, batches of {batch_size})')
+        self.stdout.write(self.style.SUCCESS(f'Batch settlement is {batch_rate / single_rate:.1f}x faster'))
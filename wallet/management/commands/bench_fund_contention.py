@@ -0,0 +1,96 @@
+"""
+Management command to measure lock waits on the system fund wallets
+Usage: python manage.py bench_fund_contention [--threads 16] [--iterations 200] [--stripes 8]
+
+Each thread credits two synthetic fund users in its own transaction and keeps
+the transaction open for --hold-ms, like a bet request does while it writes the
+rest of its rows. The run is repeated with a single stripe (one hot row per
+fund, as before striping) and with --stripes stripes. Run it against MySQL:
+SQLite locks the whole database per write, so it cannot show row-lock effects.
+"""
+import statistics
+import threading
+import time
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from wallet.models import Wallet, WalletStripe
+from wallet.services import WalletStripeService
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Compare fund credit latency with and without wallet striping under concurrency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help='Concurrent writers (default: 16)')
+        parser.add_argument('--iterations', type=int, default=200, help='Credits per thread (default: 200)')
+        parser.add_argument('--stripes', type=int, default=WalletStripeService.stripe_count(), help='Stripes for the striped run')
+        parser.add_argument('--hold-ms', type=float, default=2.0, help='Time each transaction stays open after crediting (default: 2ms)')
+
+    def run(self, fund_ids, stripes, threads, iterations, hold):
+        latencies = []
+        lock = threading.Lock()
+
+        def worker():
+            local = []
+            try:
+                for _ in range(iterations):
+                    with transaction.atomic():
+                        started = time.perf_counter()
+                        WalletStripeService.add({user_id: Decimal('1') for user_id in fund_ids}, stripes=stripes)
+                        local.append(time.perf_counter() - started)
+                        time.sleep(hold)
+            finally:
+                connection.close()
+                with lock:
+                    latencies.extend(local)
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        return {
+            'elapsed': elapsed,
+            'throughput': len(latencies) / elapsed,
+            'p50_ms': statistics.median(latencies) * 1000,
+            'p99_ms': latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        }
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            self.stderr.write(self.style.WARNING('SQLite serializes all writers; results will not reflect row-lock contention'))
+
+        funds = [
+            User.objects.create_user(username=f'bench_fund_{i}', email=f'bench_fund_{i}@bench.local', is_active=False)
+            for i in range(2)
+        ]
+        fund_ids = [user.pk for user in funds]
+        Wallet.objects.bulk_create([Wallet(user=user) for user in funds])
+        connection.close()
+
+        try:
+            hold = options['hold_ms'] / 1000
+            results = {}
+            for stripes in (1, options['stripes']):
+                results[stripes] = self.run(fund_ids, stripes, options['threads'], options['iterations'], hold)
+                result = results[stripes]
+                self.stdout.write(
+                    f"{stripes:>3} stripe(s): {result['throughput']:,.0f} credits/s, "
+                    f"update p50 {result['p50_ms']:.2f}ms, p99 {result['p99_ms']:.2f}ms"
+                )
+        finally:
+            WalletStripe.objects.filter(user_id__in=fund_ids).delete()
+            User.objects.filter(pk__in=fund_ids).delete()
+
+        baseline, striped = results[1], results[options['stripes']]
+        self.stdout.write(self.style.SUCCESS(
+            f"p99 lock wait reduced {baseline['p99_ms'] / max(striped['p99_ms'], 1e-9):.1f}x with {options['stripes']} stripes"
+        ))
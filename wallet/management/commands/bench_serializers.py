@@ -0,0 +1,87 @@
+"""
+Management command to compare transaction list serialization throughput
+Usage: python manage.py bench_serializers [--rows 500] [--repeat 20]
+
+Serializes and renders the same page of transactions three ways:
+ModelSerializer + DRF JSONRenderer (before), .values() rows with precompiled
+converters + DRF JSONRenderer, and the same rows + FastJSONRenderer (after),
+both including the query and on rows fetched beforehand.
+Rows are created inside a transaction that is rolled back at the end.
+"""
+import time
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from mlm_backend.bench import Rollback
+from mlm_backend.renderers import FastJSONRenderer
+from wallet.models import Transaction
+from wallet.serializers import TransactionSerializer, TransactionRowSerializer
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Measure rows per second for ModelSerializer against the values() fast path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=500, help='Rows per page (default: 500)')
+        parser.add_argument('--repeat', type=int, default=20, help='Pages serialized per variant (default: 20)')
+
+    def time(self, label, repeat, rows, render):
+        render()
+        started = time.perf_counter()
+        for _ in range(repeat):
+            render()
+        rate = rows * repeat / (time.perf_counter() - started)
+        self.stdout.write(f'{label:<34} {rate:>10,.0f} rows/s')
+        return rate
+
+    def handle(self, *args, **options):
+        count = options['rows']
+        repeat = options['repeat']
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(username='bench_serializer', email='bench_serializer@bench.local')
+                Transaction.objects.bulk_create([
+                    Transaction(
+                        user=user,
+                        amount=Decimal(i) / 100,
+                        transaction_type='DEPOSIT',
+                        status='COMPLETED',
+                        tx_hash=f'0x{i:064x}',
+                        description=f'Deposit request for {i} USDT',
+                        processed_by=user,
+                        processed_at=timezone.now(),
+                    )
+                    for i in range(count)
+                ])
+                queryset = Transaction.objects.filter(user=user).order_by('-created_at', '-pk')
+                drf, fast = JSONRenderer(), FastJSONRenderer()
+
+                self.stdout.write('Query + serialize + render:')
+                before = self.time('ModelSerializer + JSONRenderer', repeat, count,
+                                   lambda: drf.render(TransactionSerializer(list(queryset), many=True).data))
+                self.time('values() rows + JSONRenderer', repeat, count,
+                          lambda: drf.render(TransactionRowSerializer.serialize(TransactionRowSerializer.values(queryset))))
+                after = self.time('values() rows + FastJSONRenderer', repeat, count,
+                                  lambda: fast.render(TransactionRowSerializer.serialize(TransactionRowSerializer.values(queryset))))
+
+                instances = list(queryset)
+                rows = list(TransactionRowSerializer.values(queryset))
+                self.stdout.write('Serialize + render only (rows already fetched):')
+                cpu_before = self.time('ModelSerializer + JSONRenderer', repeat, count,
+                                       lambda: drf.render(TransactionSerializer(instances, many=True).data))
+                self.time('values() rows + JSONRenderer', repeat, count,
+                          lambda: drf.render(TransactionRowSerializer.serialize(rows)))
+                cpu_after = self.time('values() rows + FastJSONRenderer', repeat, count,
+                                      lambda: fast.render(TransactionRowSerializer.serialize(rows)))
+                raise Rollback
+        except Rollback:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Fast path is {after / before:.1f}x faster end to end, {cpu_after / cpu_before:.1f}x for serialization alone'
+        ))
@@ -0,0 +1,34 @@
+"""
+Management command to fold striped system fund balances back into their wallets
+Usage: python manage.py compact_wallet_stripes [--loop] [--interval 60]
+"""
+import time
+from django.core.management.base import BaseCommand
+from wallet.models import WalletStripe
+from wallet.services import WalletStripeService
+
+
+class Command(BaseCommand):
+    help = 'Move WalletStripe balances into Wallet.balance'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep compacting every --interval seconds')
+        parser.add_argument('--interval', type=float, default=60, help='Seconds between passes with --loop (default: 60)')
+
+    def compact(self):
+        user_ids = WalletStripe.objects.exclude(balance=0).values_list('user_id', flat=True).distinct()
+        for user_id in list(user_ids):
+            moved = WalletStripeService.compact(user_id)
+            self.stdout.write(f'User {user_id}: moved {moved} into wallet balance')
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                self.compact()
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS('Wallet stripes compacted'))
@@ -0,0 +1,59 @@
+"""
+Management command to export transactions as CSV or NDJSON
+Usage: python manage.py export_transactions [--format csv|ndjson] [--start 2025-01-01] [--end 2025-01-31]
+       [--type DEPOSIT] [--status COMPLETED] [--output transactions.csv] [--chunk-size 2000]
+
+Rows are streamed in chunks, so memory use does not grow with the export size.
+Writes to stdout unless --output is given; progress goes to stderr.
+"""
+import time
+from django.core.management.base import BaseCommand, CommandError
+from wallet import export
+from wallet.models import Transaction
+
+
+class Command(BaseCommand):
+    help = 'Stream transactions to CSV or NDJSON, filtered by date range, type and status'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=export.FORMATS, default='csv', help='Output format (default: csv)')
+        parser.add_argument('--start', help='Earliest created_at, ISO date or datetime (inclusive)')
+        parser.add_argument('--end', help='Latest created_at, ISO date or datetime (a bare date includes that day)')
+        parser.add_argument('--type', choices=dict(Transaction.TRANSACTION_TYPES), help='Transaction type')
+        parser.add_argument('--status', choices=dict(Transaction.STATUS_CHOICES), help='Transaction status')
+        parser.add_argument('--output', help='File to write (default: stdout)')
+        parser.add_argument('--chunk-size', type=int, default=export.DEFAULT_CHUNK_SIZE,
+                            help=f'Rows fetched per round trip (default: {export.DEFAULT_CHUNK_SIZE})')
+        parser.add_argument('--progress-every', type=int, default=100000, help='Report progress every N rows (default: 100000)')
+
+    def handle(self, *args, **options):
+        try:
+            start = export.parse_bound(options['start']) if options['start'] else None
+            end = export.parse_bound(options['end'], end=True) if options['end'] else None
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        queryset = export.filter_transactions(start, end, options['type'], options['status'])
+        stats = {'rows': 0}
+        out = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else None
+        reported = 0
+        started = time.perf_counter()
+        try:
+            for chunk in export.iter_export(queryset, options['format'], options['chunk_size'], stats):
+                if out:
+                    out.write(chunk)
+                else:
+                    self.stdout.write(chunk, ending='')
+                if stats['rows'] - reported >= options['progress_every']:
+                    reported = stats['rows']
+                    elapsed = time.perf_counter() - started
+                    self.stderr.write(f"{reported:,} rows ({reported / elapsed:,.0f} rows/s)")
+        finally:
+            if out:
+                out.close()
+
+        elapsed = time.perf_counter() - started
+        rate = stats['rows'] / elapsed if elapsed else 0
+        self.stderr.write(self.style.SUCCESS(
+            f"Exported {stats['rows']:,} transactions in {elapsed:.2f}s ({rate:,.0f} rows/s)"
+        ))
@@ -0,0 +1,51 @@
+"""
+Management command to distribute queued bet-loss commissions
+Usage: python manage.py process_commission_outbox [--batch-size 500] [--once] [--sleep 1.0] [--retention-days 7]
+
+Run as many workers as needed; each claims batches with SKIP LOCKED. DONE
+entries older than --retention-days are deleted at start-up and then hourly.
+"""
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from wallet.services import CommissionOutboxService
+
+PURGE_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    help = 'Drain the commission outbox, distributing commissions for queued bet losses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Entries claimed per transaction (default: 500)')
+        parser.add_argument('--max-attempts', type=int, default=CommissionOutboxService.MAX_ATTEMPTS,
+                            help=f'Attempts before an entry is marked FAILED (default: {CommissionOutboxService.MAX_ATTEMPTS})')
+        parser.add_argument('--once', action='store_true', help='Exit when the outbox is empty instead of polling')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when the outbox is empty (default: 1.0)')
+        parser.add_argument('--retention-days', type=float, default=CommissionOutboxService.RETENTION.days,
+                            help=f'Delete DONE entries processed longer ago than this (default: {CommissionOutboxService.RETENTION.days})')
+
+    def handle(self, *args, **options):
+        retention = timedelta(days=options['retention_days'])
+        processed = 0
+        purged_at = None
+        try:
+            while True:
+                if purged_at is None or time.monotonic() - purged_at >= PURGE_INTERVAL:
+                    purged = CommissionOutboxService.purge(retention)
+                    purged_at = time.monotonic()
+                    if purged:
+                        self.stdout.write(f'Deleted {purged} processed outbox entries')
+
+                claimed = CommissionOutboxService.drain(options['batch_size'], options['max_attempts'])
+                processed += claimed
+                if claimed:
+                    self.stdout.write(f'Processed {claimed} outbox entries')
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} outbox entries in total'))
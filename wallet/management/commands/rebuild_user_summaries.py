@@ -0,0 +1,66 @@
+"""
+Management command to verify or rebuild UserSummary rows from raw history
+Usage: python manage.py rebuild_user_summaries [--verify] [--batch-size 5000]
+
+Migration wallet 0011 runs the same rebuild once on deploy; run this again
+to repair summaries or, with --verify, to check them.
+"""
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from mlm.models import Commission, MLMLevel, UserLevel
+from wallet import summaries
+from wallet.models import Transaction, UserSummary
+
+
+class Command(BaseCommand):
+    help = 'Recompute per-user financial summaries from commissions, transactions and levels'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Only report rows that differ from raw history, do not write',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Rows per bulk insert (default: 5000)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        totals = summaries.compute_totals(Commission, Transaction, UserLevel, batch_size)
+
+        if options['verify']:
+            places = summaries.comparison_places(Commission, Transaction, MLMLevel)
+            mismatches = 0
+            checked = 0
+            empty = dict.fromkeys(summaries.FIELDS, Decimal('0'))
+            stored = UserSummary.objects.values_list('user_id', *summaries.FIELDS)
+            seen = set()
+            for user_id, *values in stored.iterator(chunk_size=batch_size):
+                seen.add(user_id)
+                checked += 1
+                expected = totals.get(user_id, empty)
+                for field, value in zip(summaries.FIELDS, values):
+                    if Decimal(value).quantize(places[field]) != Decimal(expected[field]).quantize(places[field]):
+                        mismatches += 1
+                        self.stdout.write(f'User {user_id}: {field} is {value}, expected {expected[field]}')
+            for user_id in totals.keys() - seen:
+                mismatches += 1
+                self.stdout.write(f'User {user_id}: summary row missing')
+
+            if mismatches:
+                self.stdout.write(self.style.ERROR(f'{mismatches} mismatches in {checked} summaries'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'All {checked} summaries match raw history'))
+            return
+
+        with transaction.atomic():
+            created = summaries.rebuild(UserSummary, totals, batch_size)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully rebuilt {created} user summaries')
+        )
@@ -0,0 +1,96 @@
+"""
+Management command to reconcile wallet balances with transaction history
+Usage: python manage.py reconcile_wallets [--workers 4] [--range-size 10000] [--tolerance 0.000000005]
+       [--output drift.csv] [--first-id 1] [--last-id 1000000]
+
+Recomputes every wallet's expected balance from its user's transactions (see
+wallet.reconciliation) and writes a CSV drift report of the wallets that
+differ: user_id, stored_balance (empty if the user has no wallet),
+expected_balance and drift (stored minus expected), in the order ranges
+finish. Users are checked in id ranges of --range-size spread over --workers
+processes, each with its own database connection; --workers 1 runs in this
+process. Read-only. Writes to stdout unless --output is given; progress and
+the summary go to stderr.
+"""
+import csv
+import multiprocessing
+import os
+import time
+from decimal import Decimal, InvalidOperation
+from functools import partial
+import django
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max, Min
+from wallet import reconciliation
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Compare every wallet balance with the sum of its transactions and report drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Worker processes (default: number of CPUs)')
+        parser.add_argument('--range-size', type=int, default=reconciliation.DEFAULT_RANGE_SIZE,
+                            help=f'User ids per unit of work (default: {reconciliation.DEFAULT_RANGE_SIZE})')
+        parser.add_argument('--tolerance', default=str(reconciliation.DEFAULT_TOLERANCE),
+                            help=f'Largest difference not reported (default: {reconciliation.DEFAULT_TOLERANCE})')
+        parser.add_argument('--first-id', type=int, help='Lowest user id to check (default: lowest existing)')
+        parser.add_argument('--last-id', type=int, help='Highest user id to check (default: highest existing)')
+        parser.add_argument('--output', help='File to write the drift report to (default: stdout)')
+
+    def handle(self, *args, **options):
+        try:
+            tolerance = Decimal(options['tolerance'])
+        except InvalidOperation:
+            raise CommandError(f"Invalid tolerance: {options['tolerance']}")
+        if options['range_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--range-size and --workers must be positive')
+
+        bounds = User.objects.aggregate(first=Min('pk'), last=Max('pk'))
+        first_id = options['first_id'] if options['first_id'] is not None else bounds['first']
+        last_id = options['last_id'] if options['last_id'] is not None else bounds['last']
+        if first_id is None:
+            raise CommandError('No users to reconcile')
+        ranges = reconciliation.id_ranges(first_id, last_id, options['range_size'])
+        check = partial(reconciliation.reconcile_range, tolerance=tolerance)
+
+        out = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else self.stdout
+        writer = csv.writer(out)
+        writer.writerow(('user_id', 'stored_balance', 'expected_balance', 'drift'))
+        pool = None
+        checked = drifted = done = 0
+        net = Decimal('0')
+        started = time.perf_counter()
+        try:
+            if options['workers'] > 1 and len(ranges) > 1:
+                # Workers must not share the parent's database connection
+                connections.close_all()
+                pool = multiprocessing.Pool(min(options['workers'], len(ranges)), initializer=django.setup)
+                results = pool.imap_unordered(check, ranges)
+            else:
+                results = map(check, ranges)
+
+            for range_checked, rows in results:
+                checked += range_checked
+                done += 1
+                for user_id, stored, expected in rows:
+                    drift = (stored or 0) - expected
+                    drifted += 1
+                    net += drift
+                    writer.writerow((user_id, '' if stored is None else f'{stored:f}', f'{expected:f}', f'{drift:f}'))
+                if done % max(1, len(ranges) // 10) == 0:
+                    self.stderr.write(f'{done:,}/{len(ranges):,} ranges, {checked:,} wallets, {drifted:,} drifted')
+        finally:
+            if pool is not None:
+                pool.terminate()
+            if options['output']:
+                out.close()
+
+        elapsed = time.perf_counter() - started
+        summary = (f'Checked {checked:,} wallets of users {first_id}-{last_id} in {elapsed:.2f}s: '
+                   f'{drifted:,} drifted, net drift {net:f}')
+        self.stderr.write(self.style.ERROR(summary) if drifted else self.style.SUCCESS(summary))
@@ -4,6 +4,7 @@ Usage: python manage.py setup_registration_fee
 """
 from django.core.management.base import BaseCommand
 from wallet.models import SystemSettings
+from wallet import system_settings
 
 
 class Command(BaseCommand):
@@ -27,6 +28,7 @@ class Command(BaseCommand):
                 'description': 'Registration fee amount in USDT (one-time payment required for account creation)'
             }
         )
+        system_settings.bump_version()
         
         self.stdout.write(
             self.style.SUCCESS(f'Successfully set registration fee to {fee_amount} USDT')
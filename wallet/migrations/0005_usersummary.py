@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_downlinestats'),
+        ('wallet', '0004_alter_transaction_transaction_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSummary',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='financial_summary', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total_earnings', models.DecimalField(decimal_places=8, default=0, help_text='Sum of MLM commissions received', max_digits=20)),
+                ('total_deposit', models.DecimalField(decimal_places=8, default=0, help_text='Sum of completed deposits', max_digits=20)),
+                ('total_withdrawal', models.DecimalField(decimal_places=8, default=0, help_text='Sum of completed withdrawals', max_digits=20)),
+                ('total_investment', models.DecimalField(decimal_places=8, default=0, help_text='Price of the current MLM level', max_digits=20)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'User summaries',
+            },
+        ),
+    ]
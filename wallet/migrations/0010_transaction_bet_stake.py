@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0009_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='transaction_type',
+            field=models.CharField(choices=[('DEPOSIT', 'Deposit'), ('WITHDRAWAL', 'Withdrawal'), ('COMMISSION', 'Commission'), ('BET_WIN', 'Bet Win'), ('BET_STAKE', 'Bet Stake'), ('BET_LOSS', 'Bet Loss'), ('REGISTRATION_FEE', 'Registration Fee')], max_length=20),
+        ),
+    ]
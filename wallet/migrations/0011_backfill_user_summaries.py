@@ -0,0 +1,23 @@
+from django.db import migrations
+from wallet import summaries
+
+
+def backfill(apps, schema_editor):
+    """Fill UserSummary for users whose history predates it"""
+    Commission = apps.get_model('mlm', 'Commission')
+    UserLevel = apps.get_model('mlm', 'UserLevel')
+    Transaction = apps.get_model('wallet', 'Transaction')
+    UserSummary = apps.get_model('wallet', 'UserSummary')
+    summaries.rebuild(UserSummary, summaries.compute_totals(Commission, Transaction, UserLevel))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0010_transaction_bet_stake'),
+        ('mlm', '0003_betlosssplit'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
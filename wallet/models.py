@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 class Wallet(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='wallet')
@@ -11,12 +12,36 @@ class Wallet(models.Model):
     def __str__(self):
         return f"{self.user.username}'s Wallet"
 
+    def get_total_balance(self):
+        """Balance including credits still held in stripes (system fund wallets)"""
+        striped = self.user.wallet_stripes.aggregate(total=models.Sum('balance'))['total']
+        return self.balance + (striped or 0)
+
+class WalletStripe(models.Model):
+    """
+    Sub-account of a hot wallet (salary_fund, reserve_fund). Concurrent credits
+    land on random stripes instead of one contended row; compact_wallet_stripes
+    folds them back into Wallet.balance.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='wallet_stripes')
+    stripe = models.PositiveSmallIntegerField()
+    balance = models.DecimalField(max_digits=20, decimal_places=8, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'stripe'], name='unique_wallet_stripe'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} stripe {self.stripe}: {self.balance}"
+
 class Transaction(models.Model):
     TRANSACTION_TYPES = (
         ('DEPOSIT', 'Deposit'),
         ('WITHDRAWAL', 'Withdrawal'),
         ('COMMISSION', 'Commission'),
         ('BET_WIN', 'Bet Win'),
+        ('BET_STAKE', 'Bet Stake'),
         ('BET_LOSS', 'Bet Loss'),
         ('REGISTRATION_FEE', 'Registration Fee'),
     )
@@ -41,6 +66,17 @@ class Transaction(models.Model):
     
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination over (created_at, id), for all and per-user listings
+            models.Index(fields=['created_at', 'id'], name='transaction_created_idx'),
+            models.Index(fields=['user', 'created_at', 'id'], name='transaction_user_created_idx'),
+            # Per-user totals by type and status (summaries, reconciliation)
+            models.Index(fields=['user', 'transaction_type', 'status'], name='transaction_user_type_idx'),
+            # Pending deposit/withdrawal queues, oldest first
+            models.Index(fields=['status', 'transaction_type', 'created_at'], name='transaction_queue_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.transaction_type} - ${self.amount}"
 
@@ -58,3 +94,44 @@ class SystemSettings(models.Model):
     
     def __str__(self):
         return f"{self.key}: {self.value[:50]}"
+
+class UserSummary(models.Model):
+    """Running financial totals per user, updated alongside every money movement"""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='financial_summary')
+    total_earnings = models.DecimalField(max_digits=20, decimal_places=8, default=0, help_text='Sum of MLM commissions received')
+    total_deposit = models.DecimalField(max_digits=20, decimal_places=8, default=0, help_text='Sum of completed deposits')
+    total_withdrawal = models.DecimalField(max_digits=20, decimal_places=8, default=0, help_text='Sum of completed withdrawals')
+    total_investment = models.DecimalField(max_digits=20, decimal_places=8, default=0, help_text='Price of the current MLM level')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'User summaries'
+
+    def __str__(self):
+        return f"{self.user_id} summary"
+
+class CommissionOutbox(models.Model):
+    """Bet losses whose commission fan-out is pending, drained by process_commission_outbox"""
+    STATUS_CHOICES = (
+        ('PENDING', 'Pending'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    )
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='commission_outbox')
+    amount = models.DecimalField(max_digits=20, decimal_places=8)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(null=True, blank=True)
+    available_at = models.DateTimeField(default=timezone.now, help_text='Earliest time the next attempt may run')
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = 'Commission outbox'
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='commission_outbox_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - ${self.amount} - {self.status}"
@@ -0,0 +1,101 @@
+"""
+Wallet balance reconciliation against Transaction history.
+
+A wallet's expected balance is the signed sum of its user's transactions
+(BALANCE_EFFECTS); the stored balance is Wallet.balance plus any credits
+still held in wallet stripes. Users are checked in contiguous id ranges.
+The database compares each range's wallets with their ledger sums (read over
+the (user, transaction_type, status) index) and returns only the wallets
+that drifted, so memory depends on the range size and the drift found, never
+on the size of the ledger. Ranges are independent, so they can be spread
+over a process pool.
+
+Expected and stored balances are read in the same statement, so each wallet
+is compared against one consistent snapshot even while bets and payouts keep
+running.
+"""
+from decimal import Decimal
+from django.db.models import Case, DecimalField, Exists, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from .models import Wallet, WalletStripe, Transaction
+
+# (transaction_type, statuses, sign): how each transaction moved the balance.
+# Withdrawals are held when requested, so pending ones already count; a
+# rejected withdrawal was refunded. Registration fees are paid on chain.
+BALANCE_EFFECTS = (
+    ('DEPOSIT', ('COMPLETED',), 1),
+    ('WITHDRAWAL', ('PENDING', 'COMPLETED'), -1),
+    ('COMMISSION', ('COMPLETED',), 1),
+    ('BET_WIN', ('COMPLETED',), 1),
+    ('BET_STAKE', ('COMPLETED',), -1),
+    ('BET_LOSS', ('COMPLETED',), -1),
+)
+
+# Half of the smallest stored unit: exact at the stored precision, but not
+# tripped by float rounding in backends that sum decimals as floats (SQLite)
+DEFAULT_TOLERANCE = Decimal('0.000000005')
+DEFAULT_RANGE_SIZE = 10000
+PLACES = Decimal('0.00000001')
+
+AMOUNT = DecimalField(max_digits=20, decimal_places=8)
+
+
+def signed_amount():
+    return Case(
+        *[When(transaction_type=transaction_type, status__in=statuses, then=F('amount') if sign > 0 else -F('amount'))
+          for transaction_type, statuses, sign in BALANCE_EFFECTS],
+        default=Value(Decimal('0')),
+        output_field=AMOUNT,
+    )
+
+
+def user_total(queryset, expression):
+    """Subquery: `expression` summed over the rows of `queryset` belonging to the outer row's user"""
+    return Coalesce(
+        Subquery(
+            queryset.filter(user_id=OuterRef('user_id')).order_by().values('user_id')
+            .annotate(total=Sum(expression)).values('total')
+        ),
+        Value(Decimal('0')),
+        output_field=AMOUNT,
+    )
+
+
+def id_ranges(first_id, last_id, range_size=DEFAULT_RANGE_SIZE):
+    """Split [first_id, last_id] into (start, end) ranges, end exclusive"""
+    return [(start, min(start + range_size, last_id + 1)) for start in range(first_id, last_id + 1, range_size)]
+
+
+def reconcile_range(bounds, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare wallets of users with start <= id < end against their ledger.
+    Returns (wallets checked, [(user_id, stored balance or None, expected balance), ...]);
+    None stands for a user whose transactions moved money but who has no wallet.
+    """
+    start, end = bounds
+    wallets = (
+        Wallet.objects.filter(user_id__gte=start, user_id__lt=end)
+        .annotate(
+            stored=F('balance') + user_total(WalletStripe.objects.all(), 'balance'),
+            expected=user_total(Transaction.objects.all(), signed_amount()),
+        )
+        .annotate(drift=F('stored') - F('expected'))
+        .filter(Q(drift__gt=tolerance) | Q(drift__lt=-tolerance))
+        .order_by('user_id')
+        .values_list('user_id', 'stored', 'expected')
+    )
+    drifted = [(user_id, stored.quantize(PLACES), expected.quantize(PLACES)) for user_id, stored, expected in wallets]
+
+    walletless = (
+        Transaction.objects.filter(user_id__gte=start, user_id__lt=end)
+        .filter(~Exists(Wallet.objects.filter(user_id=OuterRef('user_id'))))
+        .order_by().values('user_id')
+        .annotate(total=Sum(signed_amount()))
+        .filter(Q(total__gt=tolerance) | Q(total__lt=-tolerance))
+        .order_by('user_id')
+        .values_list('user_id', 'total')
+    )
+    drifted += [(user_id, None, total.quantize(PLACES)) for user_id, total in walletless]
+
+    checked = Wallet.objects.filter(user_id__gte=start, user_id__lt=end).count()
+    return checked, drifted
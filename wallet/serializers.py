@@ -1,3 +1,6 @@
+from decimal import Decimal
+from django.db import models
+from django.utils import timezone
 from rest_framework import serializers
 from .models import Wallet, Transaction
 
@@ -12,6 +15,64 @@ class TransactionSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ('user', 'processed_by', 'processed_at')
 
+class ValuesSerializer:
+    """
+    Read-only serializer for `.values()` rows, producing the same output as a
+    `fields = '__all__'` ModelSerializer without per-field DRF objects.
+
+    Converters are built once per call from the model fields, so serializing a
+    row is one dict comprehension. Use `values()` to build the matching
+    queryset.
+    """
+    model = None
+
+    _fields = None
+
+    @classmethod
+    def get_fields(cls):
+        if cls.__dict__.get('_fields') is None:
+            cls._fields = [(field.name, field.attname, field) for field in cls.model._meta.concrete_fields]
+        return cls._fields
+
+    @staticmethod
+    def converter(field, tz):
+        if isinstance(field, models.DecimalField):
+            # DRF quantizes to decimal_places and renders a plain string
+            exponent = Decimal(1).scaleb(-field.decimal_places)
+            return lambda value: format(value.quantize(exponent), 'f')
+        if isinstance(field, models.DateTimeField):
+            # Same as DRF: in the current time zone, with UTC written as Z
+            def convert(value):
+                value = value.astimezone(tz).isoformat()
+                return value[:-6] + 'Z' if value.endswith('+00:00') else value
+            return convert
+        if isinstance(field, models.DateField):
+            return lambda value: value.isoformat()
+        return None
+
+    @classmethod
+    def values(cls, queryset):
+        return queryset.values(*[column for _, column, _ in cls.get_fields()])
+
+    @classmethod
+    def serialize(cls, rows):
+        tz = timezone.get_current_timezone()
+        converters = [(name, column, cls.converter(field, tz)) for name, column, field in cls.get_fields()]
+        return [
+            {
+                name: value if convert is None or value is None else convert(value)
+                for name, column, convert in converters
+                for value in (row[column],)
+            }
+            for row in rows
+        ]
+
+class WalletRowSerializer(ValuesSerializer):
+    model = Wallet
+
+class TransactionRowSerializer(ValuesSerializer):
+    model = Transaction
+
 class DepositRequestSerializer(serializers.Serializer):
     amount = serializers.DecimalField(max_digits=20, decimal_places=8, min_value=0.01)
     deposit_proof = serializers.CharField(required=False, help_text='Transaction hash or proof URL')
@@ -21,6 +82,12 @@ class WithdrawalRequestSerializer(serializers.Serializer):
     amount = serializers.DecimalField(max_digits=20, decimal_places=8, min_value=0.01)
     wallet_address = serializers.CharField(max_length=42, required=False)
 
+class BetResultSerializer(serializers.Serializer):
+    user = serializers.IntegerField()
+    amount = serializers.DecimalField(max_digits=20, decimal_places=8, min_value=Decimal('0.00000001'))
+    is_win = serializers.BooleanField(default=False)
+    win_amount = serializers.DecimalField(max_digits=20, decimal_places=8, min_value=Decimal('0'), default=Decimal('0'))
+
 class SystemSettingsSerializer(serializers.Serializer):
     admin_wallet_address = serializers.CharField(required=False, allow_blank=True, source='admin_usdt_wallet')
     registration_fee = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
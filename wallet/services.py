@@ -1,10 +1,119 @@
+import logging
+import random
+from collections import defaultdict
+from datetime import timedelta
 from decimal import Decimal
 from django.db import transaction
+from django.db.models import Case, DecimalField, F, Q, Value, When
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from .models import Wallet, Transaction
+from django.utils import timezone
+from mlm.plan import get_plan
+from mlm_backend import outbox
+from users.models import ReferralPath
+from .models import Wallet, WalletStripe, Transaction, UserSummary, CommissionOutbox
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
+
+UPLINE_DEPTH = 5
+
+SYSTEM_WALLETS = {
+    'salary_fund': 'salary@system.local',
+    'reserve_fund': 'reserve@system.local',
+}
+
+def increment_by_user(model, field, totals):
+    """
+    Add {user_id: amount} to `field` on rows of `model` in a single UPDATE.
+    Users without a row get one (with the model's defaults) and a second UPDATE.
+    """
+    if not totals:
+        return
+    if add_to_rows(model, field, totals) < len(totals):
+        existing = set(model.objects.filter(user_id__in=totals).values_list('user_id', flat=True))
+        missing = {user_id: amount for user_id, amount in totals.items() if user_id not in existing}
+        model.objects.bulk_create([model(user_id=user_id) for user_id in missing], ignore_conflicts=True)
+        add_to_rows(model, field, missing)
+
+def add_to_rows(model, field, totals):
+    """The UPDATE behind increment_by_user; returns the number of existing rows changed"""
+    increment = Case(
+        *[When(user_id=user_id, then=Value(amount)) for user_id, amount in totals.items()],
+        default=Value(Decimal('0')),
+        output_field=DecimalField(max_digits=20, decimal_places=8)
+    )
+    return model.objects.filter(user_id__in=totals).update(**{field: F(field) + increment})
+
+class SummaryService:
+    @staticmethod
+    def add(field, totals):
+        """Add {user_id: amount} to a UserSummary total, creating missing rows"""
+        totals = {
+            user_id: amount if isinstance(amount, Decimal) else Decimal(str(amount))
+            for user_id, amount in totals.items() if amount
+        }
+        increment_by_user(UserSummary, field, totals)
+
+    @staticmethod
+    def record_deposit(user_id, amount):
+        SummaryService.add('total_deposit', {user_id: amount})
+
+    @staticmethod
+    def record_withdrawal(user_id, amount):
+        SummaryService.add('total_withdrawal', {user_id: amount})
+
+    @staticmethod
+    def set_investment(user_id, amount):
+        UserSummary.objects.update_or_create(user_id=user_id, defaults={'total_investment': amount})
+
+class WalletStripeService:
+    @staticmethod
+    def stripe_count():
+        return max(1, settings.SYSTEM_FUND_STRIPES)
+
+    @staticmethod
+    def add(totals, stripes=None):
+        """
+        Add {user_id: amount} to one randomly chosen stripe per user in a single UPDATE,
+        so concurrent credits to the same fund rarely wait on each other's row lock.
+        """
+        stripes = stripes or WalletStripeService.stripe_count()
+        chosen = {user_id: random.randrange(stripes) for user_id in totals}
+
+        condition = Q()
+        for user_id, stripe in chosen.items():
+            condition |= Q(user_id=user_id, stripe=stripe)
+        increment = Case(
+            *[When(user_id=user_id, then=Value(amount)) for user_id, amount in totals.items()],
+            default=Value(Decimal('0')),
+            output_field=DecimalField(max_digits=20, decimal_places=8)
+        )
+
+        try:
+            with transaction.atomic():
+                if WalletStripe.objects.filter(condition).update(balance=F('balance') + increment) < len(totals):
+                    raise WalletStripe.DoesNotExist
+        except WalletStripe.DoesNotExist:
+            # First credit since striping was enabled (or stripes were added): create them and retry
+            WalletStripe.objects.bulk_create(
+                [WalletStripe(user_id=user_id, stripe=stripe) for user_id in totals for stripe in range(stripes)],
+                ignore_conflicts=True
+            )
+            WalletStripe.objects.filter(condition).update(balance=F('balance') + increment)
+
+    @staticmethod
+    def compact(user_id):
+        """Fold a user's stripe balances into Wallet.balance, returning the amount moved"""
+        with transaction.atomic():
+            stripes = list(WalletStripe.objects.select_for_update().filter(user_id=user_id).exclude(balance=0))
+            total = sum((stripe.balance for stripe in stripes), Decimal('0'))
+            if not stripes:
+                return total
+            WalletStripe.objects.filter(pk__in=[stripe.pk for stripe in stripes]).update(balance=0)
+            if not Wallet.objects.filter(user_id=user_id).update(balance=F('balance') + total):
+                Wallet.objects.create(user_id=user_id, balance=total)
+        return total
 
 class CommissionService:
     @staticmethod
@@ -21,9 +130,83 @@ class CommissionService:
         return wallet
 
     @staticmethod
-    def process_bet_loss(user, amount):
+    def get_system_user_ids():
+        """Return {username: user_id} for the system fund users, creating any that are missing"""
+        user_ids = dict(User.objects.filter(username__in=SYSTEM_WALLETS).values_list('username', 'id'))
+        for username, email in SYSTEM_WALLETS.items():
+            if username not in user_ids:
+                user_ids[username] = CommissionService.get_or_create_system_wallet(username, email).user_id
+        return user_ids
+
+    @staticmethod
+    def get_upline(user, depth=UPLINE_DEPTH):
+        """
+        Return the referrers of `user` as [(id, username), ...], nearest first.
+        Read from the referral closure table in a single indexed query.
+        """
+        if not user.referrer_id:
+            return []
+        return list(ReferralPath.objects.upline(user, depth).values_list('ancestor_id', 'ancestor__username'))
+
+    @staticmethod
+    def apply_credits(credits, earnings=False, striped_user_ids=()):
+        """
+        Credit wallets and record COMPLETED commission transactions.
+
+        `credits` is a list of (user_id, amount, description). All transactions are
+        written with one bulk insert and balances with one grouped F() update,
+        independent of how many credits there are. Users in `striped_user_ids`
+        (the system funds) are credited on a wallet stripe instead. With
+        `earnings`, the credits are also added to each user's total_earnings summary.
         """
-        Distribute commission from a lost bet amount ($10 example):
+        credits = [credit for credit in credits if credit[1] > 0]
+        if not credits:
+            return
+
+        totals = defaultdict(Decimal)
+        for user_id, amount, _ in credits:
+            totals[user_id] += amount
+
+        with transaction.atomic():
+            Transaction.objects.bulk_create([
+                Transaction(
+                    user_id=user_id,
+                    amount=amount,
+                    transaction_type='COMMISSION',
+                    status='COMPLETED',
+                    description=description
+                )
+                for user_id, amount, description in credits
+            ])
+
+            striped = {user_id: amount for user_id, amount in totals.items() if user_id in striped_user_ids}
+            direct = {user_id: amount for user_id, amount in totals.items() if user_id not in striped_user_ids}
+            if striped:
+                WalletStripeService.add(striped)
+
+            # Upline members without a wallet yet get one
+            increment_by_user(Wallet, 'balance', direct)
+
+            if earnings:
+                SummaryService.add('total_earnings', totals)
+
+    @staticmethod
+    def get_uplines(user_ids, depth=UPLINE_DEPTH):
+        """Return {user_id: [ancestor_id, ...]} nearest first for many users in one query"""
+        uplines = defaultdict(list)
+        paths = (
+            ReferralPath.objects.filter(descendant_id__in=user_ids, depth__lte=depth)
+            .order_by('descendant_id', 'depth')
+            .values_list('descendant_id', 'ancestor_id')
+        )
+        for user_id, ancestor_id in paths:
+            uplines[user_id].append(ancestor_id)
+        return uplines
+
+    @staticmethod
+    def bet_loss_credits(username, amount, upline_ids, system_users, plan=None):
+        """
+        Split a lost bet amount by the commission plan's bet loss split (default, $10 example):
         - Level 1: 11% ($1.10)
         - Level 2: 9% ($0.90)
         - Level 3: 2% ($0.20)
@@ -32,65 +215,254 @@ class CommissionService:
         - Salary Fund: 10% ($1.00)
         - Reserve Fund: 65% ($6.50)
         Total: 100%
+
+        Levels without an upline member roll over into the Reserve Fund.
+        Returns a list of (user_id, amount, description) credits.
         """
-        amount = Decimal(str(amount))
-        
-        # 1. Distribute to Salary Fund (10%)
-        salary_wallet = CommissionService.get_or_create_system_wallet('salary_fund', 'salary@system.local')
-        salary_amount = amount * Decimal('0.10')
-        salary_wallet.balance = Decimal(str(salary_wallet.balance)) + salary_amount
-        salary_wallet.save()
-        
-        Transaction.objects.create(
-            user=salary_wallet.user,
-            amount=salary_amount,
-            transaction_type='COMMISSION',
-            status='COMPLETED',
-            description=f"Salary Fund commission from user {user.username}'s loss"
-        )
-        
-        # 2. Distribute to Reserve Fund (65%)
-        reserve_wallet = CommissionService.get_or_create_system_wallet('reserve_fund', 'reserve@system.local')
-        reserve_amount = amount * Decimal('0.65')
-        reserve_wallet.balance = Decimal(str(reserve_wallet.balance)) + reserve_amount
-        reserve_wallet.save()
-        
-        Transaction.objects.create(
-            user=reserve_wallet.user,
-            amount=reserve_amount,
-            transaction_type='COMMISSION',
-            status='COMPLETED',
-            description=f"Reserve Fund commission from user {user.username}'s loss"
-        )
-        
-        # 3. Distribute to Referral Levels (25% total)
-        current_user = user
-        percentages = [Decimal('0.11'), Decimal('0.09'), Decimal('0.02'), Decimal('0.015'), Decimal('0.015')]
-        
-        for level, percentage in enumerate(percentages, 1):
-            if not current_user.referrer:
-                # If no referrer, add to reserve fund
-                overflow_amount = amount * percentage
-                reserve_wallet.balance = Decimal(str(reserve_wallet.balance)) + overflow_amount
-                reserve_wallet.save()
-                break
-                
-            referrer = current_user.referrer
-            commission_amount = amount * percentage
-            
-            # Credit referrer wallet
-            referrer_wallet, _ = Wallet.objects.get_or_create(user=referrer)
-            referrer_wallet.balance = Decimal(str(referrer_wallet.balance)) + commission_amount
-            referrer_wallet.save()
-            
-            Transaction.objects.create(
-                user=referrer,
-                amount=commission_amount,
-                transaction_type='COMMISSION',
-                status='COMPLETED',
-                description=f"Level {level} commission from {user.username}'s loss"
-            )
-            
-            current_user = referrer
+        plan = plan or get_plan()
+        upline_ids = upline_ids[:len(plan.bet_loss_rates)]
+        credits = [
+            (system_users['salary_fund'], amount * plan.salary_rate, f"Salary Fund commission from user {username}'s loss"),
+            (system_users['reserve_fund'], amount * plan.reserve_rates[len(upline_ids)], f"Reserve Fund commission from user {username}'s loss"),
+        ]
+        for level, (upline_id, rate) in enumerate(zip(upline_ids, plan.bet_loss_rates), 1):
+            credits.append((upline_id, amount * rate, f"Level {level} commission from {username}'s loss"))
+        return credits
+
+    @staticmethod
+    def process_bet_loss(user, amount):
+        """Distribute commission from a lost bet amount (see bet_loss_credits)"""
+        if not isinstance(amount, Decimal):
+            amount = Decimal(str(amount))
+        upline_ids = [referrer_id for referrer_id, _ in CommissionService.get_upline(user)]
+        system_users = CommissionService.get_system_user_ids()
 
+        credits = CommissionService.bet_loss_credits(user.username, amount, upline_ids, system_users)
+        CommissionService.apply_credits(credits, striped_user_ids=set(system_users.values()))
         return True
+
+    @staticmethod
+    def process_bet_losses(losses, usernames):
+        """
+        Distribute commissions for many lost bets at once.
+
+        `losses` is a list of (user_id, amount). Credits are grouped per recipient
+        across the whole batch, so each upline member and system fund receives a
+        single transaction no matter how many bets it earned from.
+        """
+        uplines = CommissionService.get_uplines({user_id for user_id, _ in losses})
+        system_users = CommissionService.get_system_user_ids()
+        plan = get_plan()
+
+        grouped = {}
+        for user_id, amount in losses:
+            credits = CommissionService.bet_loss_credits(usernames[user_id], amount, uplines.get(user_id, []), system_users, plan)
+            for recipient_id, credit, description in credits:
+                if recipient_id in grouped:
+                    grouped[recipient_id][0] += credit
+                    grouped[recipient_id][1] += 1
+                else:
+                    grouped[recipient_id] = [credit, 1, description]
+
+        CommissionService.apply_credits([
+            (recipient_id, total, description if count == 1 else f"Commission from {count} bet losses")
+            for recipient_id, (total, count, description) in grouped.items()
+        ], striped_user_ids=set(system_users.values()))
+
+class CommissionOutboxService:
+    RETRY_DELAY = timedelta(seconds=30)
+    MAX_ATTEMPTS = 5
+    RETENTION = timedelta(days=7)
+
+    @staticmethod
+    def enqueue(user, amount):
+        """Record a bet loss for asynchronous commission distribution; call inside the bet's transaction"""
+        return CommissionOutbox.objects.create(user=user, amount=Decimal(str(amount)))
+
+    @staticmethod
+    def drain(batch_size=500, max_attempts=MAX_ATTEMPTS):
+        """
+        Distribute commissions for one batch of pending outbox entries.
+
+        Entries are claimed with SELECT ... FOR UPDATE SKIP LOCKED so several
+        workers can drain concurrently, and they are marked DONE in the same
+        transaction as their credits, so each loss is distributed exactly once.
+        If the batch fails, entries are retried one by one and failures are
+        rescheduled with a linear backoff until `max_attempts` is reached.
+        Returns the number of entries claimed.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            entries = outbox.lock_due(CommissionOutbox.objects.all(), batch_size, now)
+            if not entries:
+                return 0
+            usernames = dict(User.objects.filter(id__in={entry.user_id for entry in entries}).values_list('id', 'username'))
+
+            try:
+                with transaction.atomic():
+                    CommissionService.process_bet_losses([(entry.user_id, entry.amount) for entry in entries], usernames)
+                for entry in entries:
+                    entry.status = 'DONE'
+                    entry.processed_at = now
+            except Exception:
+                logger.exception('Commission outbox batch failed, retrying entries individually')
+                for entry in entries:
+                    entry.attempts += 1
+                    try:
+                        with transaction.atomic():
+                            CommissionService.process_bet_losses([(entry.user_id, entry.amount)], usernames)
+                        entry.status = 'DONE'
+                        entry.processed_at = now
+                    except Exception as e:
+                        outbox.record_failure(entry, e, max_attempts, CommissionOutboxService.RETRY_DELAY, now)
+
+            CommissionOutbox.objects.bulk_update(entries, ['status', 'attempts', 'last_error', 'available_at', 'processed_at'])
+        return len(entries)
+
+    @staticmethod
+    def purge(older_than=RETENTION):
+        """Delete DONE entries processed more than `older_than` ago; the credits themselves are Transactions"""
+        cutoff = timezone.now() - older_than
+        return outbox.purge(CommissionOutbox.objects.filter(status='DONE', processed_at__lt=cutoff))
+
+class BetSettlementService:
+    MAX_BATCH_SIZE = 5000
+
+    @staticmethod
+    def settle(bets):
+        """
+        Settle many bet results in one database transaction.
+
+        `bets` is a list of dicts with user_id, amount, is_win and win_amount.
+        Wallets are locked once, bet transactions are bulk inserted, balances
+        change with one grouped update and losses share one commission fan-out.
+        Returns one result dict per bet, in order.
+        """
+        user_ids = {bet['user_id'] for bet in bets}
+        results = []
+
+        with transaction.atomic():
+            wallets = dict(
+                Wallet.objects.select_for_update()
+                .filter(user_id__in=user_ids)
+                .order_by('pk')
+                .values_list('user_id', 'balance')
+            )
+            usernames = dict(User.objects.filter(id__in=user_ids).values_list('id', 'username'))
+            balances = dict(wallets)
+
+            bet_transactions = []
+            losses = []
+            for bet in bets:
+                user_id = bet['user_id']
+                amount = bet['amount']
+                if user_id not in balances:
+                    results.append({'user': user_id, 'status': 'error', 'error': 'Wallet not found'})
+                    continue
+                if balances[user_id] < amount:
+                    results.append({'user': user_id, 'status': 'error', 'error': 'Insufficient balance'})
+                    continue
+
+                # 1. Deduct Bet Amount
+                balances[user_id] -= amount
+                if bet['is_win']:
+                    # WIN: Credit win amount
+                    win_amount = bet['win_amount']
+                    balances[user_id] += win_amount
+                    bet_transactions.append(Transaction(
+                        user_id=user_id,
+                        amount=amount,
+                        transaction_type='BET_STAKE',
+                        status='COMPLETED',
+                        description=f"Bet Stake: {amount} USDT"
+                    ))
+                    bet_transactions.append(Transaction(
+                        user_id=user_id,
+                        amount=win_amount,
+                        transaction_type='BET_WIN',
+                        status='COMPLETED',
+                        description=f"Bet Win: {win_amount} USDT"
+                    ))
+                    result = 'WIN'
+                else:
+                    # LOSS: Distribute commissions
+                    bet_transactions.append(Transaction(
+                        user_id=user_id,
+                        amount=amount,
+                        transaction_type='BET_LOSS',
+                        status='COMPLETED',
+                        description=f"Bet Loss: {amount} USDT"
+                    ))
+                    losses.append((user_id, amount))
+                    result = 'LOSS'
+
+                results.append({'user': user_id, 'status': 'ok', 'result': result, 'new_balance': balances[user_id]})
+
+            Transaction.objects.bulk_create(bet_transactions)
+
+            deltas = {user_id: balances[user_id] - wallets[user_id] for user_id in balances if balances[user_id] != wallets[user_id]}
+            increment_by_user(Wallet, 'balance', deltas)
+
+            if losses:
+                CommissionService.process_bet_losses(losses, usernames)
+
+        return results
+
+class TransactionReviewService:
+    MAX_BATCH_SIZE = 5000
+    REVIEWABLE_TYPES = ('DEPOSIT', 'WITHDRAWAL')
+
+    @staticmethod
+    def review(transaction_ids, admin, approve):
+        """
+        Approve or reject many pending deposits/withdrawals in one database transaction.
+
+        Rows are claimed with SKIP LOCKED, so two admins clearing the same queue
+        never block each other or process a row twice. Approved deposits are
+        credited and rejected withdrawals refunded (the amount was held when the
+        withdrawal was requested) with one grouped wallet update, and every
+        claimed row is stamped with one UPDATE.
+        Returns {'processed': [ids], 'skipped': [ids]}; skipped ids were not
+        pending, not a deposit/withdrawal, missing or claimed by someone else.
+        """
+        transaction_ids = list(dict.fromkeys(transaction_ids))
+        with transaction.atomic():
+            rows = list(
+                Transaction.objects.select_for_update(skip_locked=True)
+                .filter(pk__in=transaction_ids, status='PENDING', transaction_type__in=TransactionReviewService.REVIEWABLE_TYPES)
+                .order_by('pk')
+                .values_list('pk', 'user_id', 'transaction_type', 'amount')
+            )
+
+            deposits = defaultdict(Decimal)
+            withdrawals = defaultdict(Decimal)
+            for _, user_id, transaction_type, amount in rows:
+                (deposits if transaction_type == 'DEPOSIT' else withdrawals)[user_id] += amount
+
+            credits = deposits if approve else withdrawals
+            increment_by_user(Wallet, 'balance', credits)
+
+            if approve:
+                SummaryService.add('total_deposit', deposits)
+                SummaryService.add('total_withdrawal', withdrawals)
+
+            processed = [pk for pk, *_ in rows]
+            Transaction.objects.filter(pk__in=processed).update(
+                status='COMPLETED' if approve else 'REJECTED',
+                processed_by=admin,
+                processed_at=timezone.now()
+            )
+
+        claimed = set(processed)
+        return {
+            'processed': processed,
+            'skipped': [pk for pk in transaction_ids if pk not in claimed],
+        }
+
+    @staticmethod
+    def approve(transaction_ids, admin):
+        return TransactionReviewService.review(transaction_ids, admin, approve=True)
+
+    @staticmethod
+    def reject(transaction_ids, admin):
+        return TransactionReviewService.review(transaction_ids, admin, approve=False)
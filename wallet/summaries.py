@@ -0,0 +1,67 @@
+"""
+Full rebuilds of UserSummary rows from raw history.
+
+The models are passed in, so the data migration can run these with its
+historical models and rebuild_user_summaries with the real ones.
+"""
+from collections import defaultdict
+from decimal import Decimal
+from django.db.models import Sum
+
+FIELDS = ('total_earnings', 'total_deposit', 'total_withdrawal', 'total_investment')
+
+
+def compute_totals(Commission, Transaction, UserLevel, batch_size=5000):
+    """Return {user_id: {field: Decimal}} using one grouped query per source"""
+    totals = defaultdict(lambda: dict.fromkeys(FIELDS, Decimal('0')))
+
+    earnings = Commission.objects.values('user_id').annotate(total=Sum('amount')).order_by()
+    for row in earnings.iterator(chunk_size=batch_size):
+        totals[row['user_id']]['total_earnings'] = row['total']
+
+    movements = (
+        Transaction.objects.filter(status='COMPLETED', transaction_type__in=['DEPOSIT', 'WITHDRAWAL'])
+        .values('user_id', 'transaction_type')
+        .annotate(total=Sum('amount'))
+        .order_by()
+    )
+    for row in movements.iterator(chunk_size=batch_size):
+        field = 'total_deposit' if row['transaction_type'] == 'DEPOSIT' else 'total_withdrawal'
+        totals[row['user_id']][field] = row['total']
+
+    investments = UserLevel.objects.filter(current_level__isnull=False).values_list('user_id', 'current_level__price')
+    for user_id, price in investments.iterator(chunk_size=batch_size):
+        totals[user_id]['total_investment'] = price
+
+    return totals
+
+
+def comparison_places(Commission, Transaction, MLMLevel):
+    """
+    {field: Decimal exponent} of the source column each total is summed from.
+    Summaries keep 8 places, but e.g. Commission.amount keeps 2, so both sides
+    of a comparison are quantized to the coarser source precision.
+    """
+    sources = {
+        'total_earnings': Commission._meta.get_field('amount'),
+        'total_deposit': Transaction._meta.get_field('amount'),
+        'total_withdrawal': Transaction._meta.get_field('amount'),
+        'total_investment': MLMLevel._meta.get_field('price'),
+    }
+    return {field: Decimal(1).scaleb(-source.decimal_places) for field, source in sources.items()}
+
+
+def rebuild(UserSummary, totals, batch_size=5000):
+    """Replace every UserSummary row with `totals`; returns the rows created. Call inside a transaction."""
+    created = 0
+    batch = []
+    UserSummary.objects.all().delete()
+    for user_id, values in totals.items():
+        batch.append(UserSummary(user_id=user_id, **values))
+        if len(batch) >= batch_size:
+            UserSummary.objects.bulk_create(batch)
+            created += len(batch)
+            batch = []
+    UserSummary.objects.bulk_create(batch)
+    created += len(batch)
+    return created
@@ -0,0 +1,68 @@
+"""
+Cached access to SystemSettings.
+
+All keys are loaded with one query into a per-process VersionedCache, and
+every write bumps its version so workers sharing the cache reload within
+VERSION_CHECK_INTERVAL seconds. With the default local-memory cache each
+worker still reloads after MAX_AGE seconds.
+"""
+from decimal import Decimal, InvalidOperation
+from django.conf import settings
+from django.db import transaction
+from mlm_backend.versioned_cache import VersionedCache
+from .models import SystemSettings
+
+VERSION_KEY = 'system_settings:version'
+VERSION_CHECK_INTERVAL = 1
+MAX_AGE = 60
+
+DEFAULTS = {
+    'admin_usdt_wallet': settings.ADMIN_USDT_WALLET_ADDRESS,
+    'usdt_network': 'BEP-20 (Binance Smart Chain)',
+    'min_deposit': '10.00',
+    'registration_fee': '10.00',
+    'deposit_instructions': 'Please send USDT to the address above and submit your transaction hash.',
+}
+
+
+def load(version):
+    values = dict(DEFAULTS)
+    values.update(SystemSettings.objects.values_list('key', 'value'))
+    return values
+
+
+_cache = VersionedCache(VERSION_KEY, load, MAX_AGE, VERSION_CHECK_INTERVAL)
+get_version = _cache.get_version
+bump_version = _cache.bump_version
+invalidate = _cache.invalidate
+
+
+def get_all():
+    """Return {key: value} for all settings with defaults applied"""
+    return _cache.get()
+
+
+def get(key, default=None):
+    return get_all().get(key, default)
+
+
+def get_decimal(key):
+    """Return a setting as Decimal, falling back to its default if unset or malformed"""
+    try:
+        return Decimal(get(key))
+    except (InvalidOperation, TypeError, ValueError):
+        return Decimal(DEFAULTS[key])
+
+
+def update(values, user=None):
+    """Write {key: value} pairs and bump the version once the transaction commits"""
+    with transaction.atomic():
+        for key, value in values.items():
+            SystemSettings.objects.update_or_create(
+                key=key,
+                defaults={
+                    'value': str(value),
+                    'updated_by': user
+                }
+            )
+        transaction.on_commit(bump_version)
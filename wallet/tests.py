@@ -1,3 +1,609 @@
+import csv
+import json
+import re
+import unittest
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from mlm.models import Commission
+from users.models import ReferralPath
+from .models import Wallet, Transaction, CommissionOutbox, UserSummary
+from .pagination import KeysetPagination
+from .services import CommissionService, CommissionOutboxService
+from . import system_settings
 
-# Create your tests here.
+User = get_user_model()
+
+
+def create_chain(length, prefix='chain'):
+    """Create a referral chain of `length` users, returning them top-down"""
+    users = []
+    referrer = None
+    for i in range(length):
+        user = User.objects.create_user(
+            username=f'{prefix}{i}',
+            email=f'{prefix}{i}@test.local',
+            referrer=referrer
+        )
+        ReferralPath.objects.add_user(user)
+        Wallet.objects.create(user=user, balance=Decimal('100.00'))
+        users.append(user)
+        referrer = user
+    return users
+
+
+class CommissionServiceTests(TestCase):
+    def test_bet_loss_distribution(self):
+        users = create_chain(7)
+        better = users[-1]
+
+        CommissionService.process_bet_loss(better, Decimal('10.00'))
+
+        expected = {5: '1.10', 4: '0.90', 3: '0.20', 2: '0.15', 1: '0.15', 0: '0'}
+        for idx, credit in expected.items():
+            wallet = Wallet.objects.get(user=users[idx])
+            self.assertEqual(wallet.balance, Decimal('100.00') + Decimal(credit))
+
+        self.assertEqual(Wallet.objects.get(user__username='salary_fund').get_total_balance(), Decimal('1.00'))
+        self.assertEqual(Wallet.objects.get(user__username='reserve_fund').get_total_balance(), Decimal('6.50'))
+        self.assertEqual(Transaction.objects.filter(transaction_type='COMMISSION').count(), 7)
+
+    def test_short_upline_rolls_over_to_reserve(self):
+        users = create_chain(3)
+
+        CommissionService.process_bet_loss(users[-1], Decimal('10.00'))
+
+        # Levels 3-5 (2% + 1.5% + 1.5%) have no upline member
+        self.assertEqual(Wallet.objects.get(user__username='reserve_fund').get_total_balance(), Decimal('7.00'))
+        total = sum(Transaction.objects.filter(transaction_type='COMMISSION').values_list('amount', flat=True))
+        self.assertEqual(total, Decimal('10.00'))
+
+    def test_creates_missing_upline_wallets(self):
+        top = User.objects.create_user(username='nowallet', email='nowallet@test.local')
+        better = User.objects.create_user(username='better', email='better@test.local', referrer=top)
+        ReferralPath.objects.add_user(better)
+
+        CommissionService.process_bet_loss(better, Decimal('10.00'))
+
+        self.assertEqual(Wallet.objects.get(user=top).balance, Decimal('1.10'))
+
+
+class CommissionQueryCountBenchmark(TestCase):
+    """The number of queries per bet loss must not depend on upline depth"""
+
+    def test_constant_queries_per_bet_loss(self):
+        # Warm up system fund users and their stripes so their creation is not counted
+        CommissionService.process_bet_loss(create_chain(1, prefix='warmup')[0], Decimal('1.00'))
+
+        counts = {}
+        for depth in (0, 1, 3, 5, 8):
+            better = create_chain(depth + 1, prefix=f'd{depth}_')[-1]
+            with CaptureQueriesContext(connection) as ctx:
+                CommissionService.process_bet_loss(better, Decimal('10.00'))
+            counts[depth] = len(ctx.captured_queries)
+
+        # A user without a referrer skips the upline query altogether
+        self.assertLessEqual(counts.pop(0), counts[1])
+        self.assertEqual(len(set(counts.values())), 1, counts)
+
+
+class SystemSettingsCacheTests(TestCase):
+    def setUp(self):
+        system_settings.invalidate()
+        self.client = APIClient()
+
+    def test_hot_reads_issue_no_queries(self):
+        self.client.get('/api/wallet/wallet/registration_fee_info/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/wallet/wallet/registration_fee_info/')
+        self.assertEqual(response.data['registration_fee'], '10.00')
+
+    def test_writes_bump_version(self):
+        admin = User.objects.create_user(username='admin', email='admin@test.local', is_staff=True)
+        self.client.force_authenticate(admin)
+        self.assertEqual(self.client.get('/api/wallet/settings/').data['registration_fee'], '10.00')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/wallet/settings/', {'registration_fee': '25.00'}, format='json')
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/wallet/settings/').data['registration_fee'], '25.00')
+
+
+class BetSettlementTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_user(username='admin', email='admin@test.local', is_staff=True)
+        self.client.force_authenticate(self.admin)
+
+    def test_batch_matches_single_bet_balances(self):
+        users = create_chain(3)
+        better = users[-1]
+        bets = [
+            {'user': better.pk, 'amount': '10.00'},
+            {'user': better.pk, 'amount': '10.00', 'is_win': True, 'win_amount': '15.00'},
+            {'user': better.pk, 'amount': '500.00'},
+            {'user': better.pk, 'amount': '-1'},
+            {'user': better.pk, 'amount': '10.00'},
+        ]
+
+        response = self.client.post('/api/wallet/transactions/settle_bets/', {'bets': bets}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['settled'], response.data['failed']), (3, 2))
+        results = response.data['results']
+        self.assertEqual(results[2]['error'], 'Insufficient balance')
+        self.assertIn('amount', results[3]['error'])
+        self.assertEqual(results[4]['new_balance'], Decimal('85.00'))
+
+        self.assertEqual(Wallet.objects.get(user=better).balance, Decimal('85.00'))
+        # Two losses of $10: level 1 gets 2 x 11%, grouped into one transaction
+        self.assertEqual(Wallet.objects.get(user=users[1]).balance, Decimal('102.20'))
+        self.assertEqual(Transaction.objects.filter(user=users[1], transaction_type='COMMISSION').count(), 1)
+        # Levels 3-5 roll over: 2 x (65% + 5%)
+        self.assertEqual(Wallet.objects.get(user__username='reserve_fund').get_total_balance(), Decimal('14.00'))
+
+    def test_requires_admin(self):
+        self.client.force_authenticate(create_chain(1)[0])
+        response = self.client.post('/api/wallet/transactions/settle_bets/', {'bets': []}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class CommissionOutboxTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_bet_loss_is_distributed_by_worker(self):
+        users = create_chain(2)
+        self.client.force_authenticate(users[1])
+
+        response = self.client.post('/api/wallet/transactions/process_bet/', {'amount': '10'}, format='json')
+
+        self.assertEqual(response.data['new_balance'], Decimal('90'))
+        self.assertEqual(CommissionOutbox.objects.filter(status='PENDING').count(), 1)
+        self.assertEqual(Wallet.objects.get(user=users[0]).balance, Decimal('100.00'))
+
+        call_command('process_commission_outbox', once=True, stdout=StringIO())
+        call_command('process_commission_outbox', once=True, stdout=StringIO())
+
+        self.assertEqual(Wallet.objects.get(user=users[0]).balance, Decimal('101.10'))
+        self.assertEqual(CommissionOutbox.objects.get().status, 'DONE')
+
+    def test_failed_entries_are_rescheduled(self):
+        users = create_chain(2)
+        CommissionOutboxService.enqueue(users[1], Decimal('10'))
+
+        with mock.patch.object(CommissionService, 'process_bet_losses', side_effect=RuntimeError('boom')):
+            self.assertEqual(CommissionOutboxService.drain(max_attempts=2), 1)
+        entry = CommissionOutbox.objects.get()
+        self.assertEqual((entry.status, entry.attempts, entry.last_error), ('PENDING', 1, 'boom'))
+        self.assertGreater(entry.available_at, timezone.now())
+
+        # Not yet due
+        self.assertEqual(CommissionOutboxService.drain(), 0)
+
+        CommissionOutbox.objects.update(available_at=timezone.now())
+        with mock.patch.object(CommissionService, 'process_bet_losses', side_effect=RuntimeError('boom')):
+            CommissionOutboxService.drain(max_attempts=2)
+        self.assertEqual(CommissionOutbox.objects.get().status, 'FAILED')
+        self.assertEqual(Wallet.objects.get(user=users[0]).balance, Decimal('100.00'))
+
+    def test_old_done_entries_are_purged(self):
+        users = create_chain(2)
+        for _ in range(3):
+            CommissionOutboxService.enqueue(users[1], Decimal('10'))
+        CommissionOutboxService.drain()
+        old, recent, _ = CommissionOutbox.objects.order_by('pk')
+        CommissionOutbox.objects.filter(pk=old.pk).update(processed_at=timezone.now() - timezone.timedelta(days=8))
+        CommissionOutbox.objects.filter(pk=recent.pk).update(status='PENDING', processed_at=None)
+
+        call_command('process_commission_outbox', once=True, stdout=StringIO())
+        self.assertFalse(CommissionOutbox.objects.filter(pk=old.pk).exists())
+        self.assertEqual(CommissionOutbox.objects.filter(status='DONE').count(), 2)
+
+
+class WalletStripeTests(TestCase):
+    def test_compaction_preserves_logical_balance(self):
+        users = create_chain(2)
+        for _ in range(5):
+            CommissionService.process_bet_loss(users[1], Decimal('10.00'))
+
+        reserve = Wallet.objects.get(user__username='reserve_fund')
+        self.assertEqual(reserve.balance, Decimal('0'))
+        self.assertEqual(reserve.get_total_balance(), Decimal('39.50'))
+
+        call_command('compact_wallet_stripes', stdout=StringIO())
+
+        reserve.refresh_from_db()
+        self.assertEqual(reserve.balance, Decimal('39.50'))
+        self.assertEqual(reserve.get_total_balance(), Decimal('39.50'))
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_chain(1)[0]
+        Transaction.objects.bulk_create([
+            Transaction(user=self.user, amount=Decimal(i), transaction_type='DEPOSIT') for i in range(7)
+        ])
+        # Ties on created_at must be broken by id
+        first = Transaction.objects.order_by('pk').first()
+        Transaction.objects.filter(pk__lt=first.pk + 4).update(created_at=first.created_at)
+
+    def test_pages_cover_every_row_once_in_order(self):
+        self.client.force_authenticate(self.user)
+        seen = []
+        url = '/api/wallet/transactions/?page_size=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+
+        expected = list(Transaction.objects.order_by('-created_at', '-pk').values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/wallet/transactions/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+class TransactionExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_user(username='exporter', email='exporter@test.local', is_staff=True)
+        self.user = create_chain(1, prefix='export')[0]
+        Transaction.objects.bulk_create([
+            Transaction(user=self.user, amount=Decimal(i + 1), transaction_type=kind, status='COMPLETED')
+            for i, kind in enumerate(['DEPOSIT', 'DEPOSIT', 'WITHDRAWAL', 'BET_LOSS', 'DEPOSIT'])
+        ])
+        old = Transaction.objects.order_by('pk').first()
+        Transaction.objects.filter(pk=old.pk).update(created_at=timezone.now() - timezone.timedelta(days=10))
+
+    def get(self, **params):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get('/api/wallet/admin/transactions/export/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_with_filters(self):
+        start = (timezone.now() - timezone.timedelta(days=1)).date().isoformat()
+        lines = self.get(transaction_type='DEPOSIT', start=start).splitlines()
+        self.assertEqual(lines[0].split(',')[:5], ['id', 'user_id', 'username', 'transaction_type', 'status'])
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(all(',DEPOSIT,' in line for line in lines[1:]))
+
+    def test_ndjson(self):
+        rows = [json.loads(line) for line in self.get(output='ndjson').splitlines()]
+        self.assertEqual([row['id'] for row in rows], list(Transaction.objects.order_by('pk').values_list('pk', flat=True)))
+        self.assertEqual(rows[0]['username'], self.user.username)
+        self.assertEqual(Decimal(rows[0]['amount']), Decimal('1'))
+
+    def test_rejects_bad_params_and_non_admins(self):
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.get('/api/wallet/admin/transactions/export/', {'end': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/wallet/admin/transactions/export/', {'output': 'xml'}).status_code, 400)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/wallet/admin/transactions/export/').status_code, 403)
+
+    def test_management_command(self):
+        out, err = StringIO(), StringIO()
+        call_command('export_transactions', '--format', 'ndjson', '--status', 'COMPLETED', '--chunk-size', '2', stdout=out, stderr=err)
+        self.assertEqual(len(out.getvalue().splitlines()), 5)
+        self.assertIn('rows/s', err.getvalue())
+
+
+class BulkReviewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_user(username='reviewer', email='reviewer@test.local', is_staff=True)
+        self.alice, self.bob = create_chain(2, prefix='review')
+        make = lambda user, kind, amount, state='PENDING': Transaction.objects.create(
+            user=user, amount=Decimal(amount), transaction_type=kind, status=state)
+        self.deposits = [make(self.alice, 'DEPOSIT', '10'), make(self.alice, 'DEPOSIT', '5'), make(self.bob, 'DEPOSIT', '7')]
+        # Withdrawal amounts were already deducted from the wallet when requested
+        self.withdrawal = make(self.bob, 'WITHDRAWAL', '20')
+        self.done = make(self.bob, 'DEPOSIT', '99', state='COMPLETED')
+        self.bet = make(self.bob, 'BET_LOSS', '1')
+        self.ids = [t.pk for t in self.deposits] + [self.withdrawal.pk, self.done.pk, self.bet.pk]
+
+    def post(self, action, ids):
+        self.client.force_authenticate(self.admin)
+        return self.client.post(f'/api/wallet/admin/transactions/{action}/', {'ids': ids}, format='json')
+
+    def test_bulk_approve(self):
+        response = self.post('bulk_approve', self.ids)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['approved'], 4)
+        self.assertEqual(response.data['skipped_ids'], [self.done.pk, self.bet.pk])
+
+        self.assertEqual(Wallet.objects.get(user=self.alice).balance, Decimal('115'))
+        self.assertEqual(Wallet.objects.get(user=self.bob).balance, Decimal('107'))
+        self.assertEqual(UserSummary.objects.get(user=self.alice).total_deposit, Decimal('15'))
+        self.assertEqual(UserSummary.objects.get(user=self.bob).total_withdrawal, Decimal('20'))
+
+        approved = Transaction.objects.filter(pk__in=response.data['processed_ids'])
+        self.assertTrue(all(t.status == 'COMPLETED' and t.processed_by == self.admin and t.processed_at for t in approved))
+
+        # Already processed rows are skipped on a second pass
+        self.assertEqual(self.post('bulk_approve', self.ids).data['approved'], 0)
+
+    def test_bulk_reject_refunds_withdrawals(self):
+        response = self.post('bulk_reject', self.ids)
+        self.assertEqual(response.data['rejected'], 4)
+        self.assertEqual(Wallet.objects.get(user=self.alice).balance, Decimal('100'))
+        self.assertEqual(Wallet.objects.get(user=self.bob).balance, Decimal('120'))
+        self.assertEqual(Transaction.objects.filter(status='REJECTED').count(), 4)
+        self.assertFalse(UserSummary.objects.filter(total_deposit__gt=0).exists())
+
+    def test_query_count_is_constant(self):
+        with CaptureQueriesContext(connection) as small:
+            self.post('bulk_approve', [self.deposits[0].pk])
+        with CaptureQueriesContext(connection) as large:
+            self.post('bulk_approve', self.ids)
+        self.assertLessEqual(len(large), len(small) + 2)
+
+    def test_admin_action(self):
+        superuser = User.objects.create_superuser(username='root', email='root@test.local', password='x')
+        self.client.force_login(superuser)
+        response = self.client.post('/admin/wallet/transaction/', {
+            'action': 'approve_selected',
+            '_selected_action': [t.pk for t in self.deposits],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Transaction.objects.filter(pk__in=[t.pk for t in self.deposits], status='COMPLETED').count(), 3)
+        self.assertEqual(Wallet.objects.get(user=self.alice).balance, Decimal('115'))
+
+    def test_single_row_review_matches_bulk(self):
+        self.client.force_authenticate(self.admin)
+        url = '/api/wallet/admin/transactions/{}/{}/'
+        # The held withdrawal is not deducted a second time
+        self.assertEqual(self.client.post(url.format(self.withdrawal.pk, 'approve')).status_code, 200)
+        self.assertEqual(Wallet.objects.get(user=self.bob).balance, Decimal('100'))
+        self.assertEqual(self.client.post(url.format(self.withdrawal.pk, 'reject')).status_code, 400)
+
+        self.assertEqual(self.client.post(url.format(self.deposits[0].pk, 'reject')).status_code, 200)
+        self.assertEqual(Wallet.objects.get(user=self.alice).balance, Decimal('100'))
+        self.assertEqual(self.client.post(url.format(self.bet.pk, 'approve')).status_code, 400)
+
+    def test_transaction_viewset_review_endpoints_use_the_service(self):
+        self.client.force_authenticate(self.admin)
+        url = '/api/wallet/transactions/{}/{}/'
+        deposit = self.deposits[0]
+        response = self.client.post(url.format(deposit.pk, 'approve_deposit'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['new_balance'], Decimal('110'))
+        self.assertEqual(self.client.post(url.format(deposit.pk, 'approve_deposit')).status_code, 400)
+        deposit.refresh_from_db()
+        self.assertEqual((deposit.status, deposit.processed_by), ('COMPLETED', self.admin))
+        self.assertIsNotNone(deposit.processed_at)
+
+        self.assertEqual(self.client.post(url.format(self.withdrawal.pk, 'approve_deposit')).status_code, 400)
+        response = self.client.post(url.format(self.withdrawal.pk, 'reject_withdrawal'))
+        self.assertEqual(response.data['new_balance'], Decimal('120'))
+        self.assertEqual(self.client.post(url.format(self.withdrawal.pk, 'reject_withdrawal')).status_code, 400)
+        self.assertEqual(Wallet.objects.get(user=self.bob).balance, Decimal('120'))
+
+    def test_admin_reject_link_refunds_withdrawal(self):
+        superuser = User.objects.create_superuser(username='root', email='root@test.local', password='x')
+        self.client.force_login(superuser)
+        response = self.client.get(f'/admin/wallet/transaction/{self.withdrawal.pk}/reject/')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Transaction.objects.get(pk=self.withdrawal.pk).status, 'REJECTED')
+        self.assertEqual(Wallet.objects.get(user=self.bob).balance, Decimal('120'))
+
+    def test_validation_and_permissions(self):
+        self.assertEqual(self.post('bulk_approve', []).status_code, 400)
+        self.assertEqual(self.post('bulk_approve', ['1']).status_code, 400)
+        self.client.force_authenticate(self.alice)
+        response = self.client.post('/api/wallet/admin/transactions/bulk_approve/', {'ids': self.ids}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class LeanListTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_user(username='lister', email='lister@test.local', is_staff=True)
+        self.user = create_chain(1, prefix='lean')[0]
+        Transaction.objects.create(user=self.user, amount=Decimal('12.5'), transaction_type='DEPOSIT', tx_hash='0xabc')
+        Transaction.objects.create(
+            user=self.user, amount=Decimal('3'), transaction_type='WITHDRAWAL', status='COMPLETED',
+            description='caf\u00e9 \u2028', processed_by=self.admin, processed_at=timezone.now()
+        )
+
+    def test_rows_match_model_serializers(self):
+        from rest_framework.renderers import JSONRenderer
+        from .serializers import TransactionSerializer, WalletSerializer
+        as_json = lambda data: json.loads(JSONRenderer().render(data))
+
+        for url, user in (('/api/wallet/transactions/', self.user), ('/api/wallet/admin/transactions/', self.admin)):
+            self.client.force_authenticate(user)
+            response = self.client.get(url)
+            expected = TransactionSerializer(Transaction.objects.order_by('-created_at', '-pk'), many=True).data
+            self.assertEqual(response.json()['results'], as_json(expected))
+
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/wallet/wallet/')
+        self.assertEqual(response.json(), [as_json(WalletSerializer(self.user.wallet).data)])
+
+    def test_fast_renderer_matches_drf(self):
+        from rest_framework.renderers import JSONRenderer
+        from mlm_backend.renderers import FastJSONRenderer
+
+        data = {
+            'balance': Decimal('1.50'),
+            'when': timezone.now(),
+            'day': timezone.now().date(),
+            'text': 'caf\u00e9 \u2028',
+            1: [None, True, 2.5],
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+
+def plan_problems(queryset, allow_sort=False):
+    """
+    Return the parts of the query plan that read a whole table or sort rows
+    outside an index: `SCAN <table>` without an index and temp b-trees on
+    SQLite, access_type ALL and filesorts on MySQL.
+    """
+    if connection.vendor == 'sqlite':
+        problems = []
+        for line in queryset.explain().splitlines():
+            if re.search(r'\bSCAN\b', line) and 'INDEX' not in line:
+                problems.append(line.strip())
+            elif 'USE TEMP B-TREE' in line and not allow_sort:
+                problems.append(line.strip())
+        return problems
+
+    if connection.vendor == 'mysql':
+        problems = []
+
+        def walk(node):
+            if isinstance(node, dict):
+                if node.get('access_type') == 'ALL':
+                    problems.append(f"full scan of {node.get('table_name')}")
+                if node.get('using_filesort') and not allow_sort:
+                    problems.append('filesort')
+                for value in node.values():
+                    walk(value)
+            elif isinstance(node, list):
+                for value in node:
+                    walk(value)
+
+        walk(json.loads(queryset.explain(format='json')))
+        return problems
+
+    raise unittest.SkipTest(f'No plan checks for {connection.vendor}')
+
+
+class QueryPlanTests(TestCase):
+    """
+    EXPLAIN the hot read queries and fail when one stops using an index.
+    On MySQL run this against a database with realistic data: with near-empty
+    tables the optimizer is free to prefer a full scan.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = create_chain(3, prefix='plan')
+        cls.user = cls.users[-1]
+        Transaction.objects.bulk_create([
+            Transaction(user=user, amount=Decimal('1.00'), transaction_type=kind, status=state)
+            for user in cls.users
+            for kind in ('DEPOSIT', 'WITHDRAWAL', 'BET_LOSS')
+            for state in ('PENDING', 'COMPLETED')
+        ])
+
+    def assertIndexed(self, queryset, index=None, allow_sort=False):
+        problems = plan_problems(queryset, allow_sort=allow_sort)
+        self.assertEqual(problems, [], f'Query plan regressed for:\n{queryset.query}')
+        if index:
+            self.assertIn(index, queryset.explain())
+
+    def test_transaction_lists(self):
+        newest = Transaction.objects.order_by('-created_at', '-pk')
+        last = newest.first()
+        after = KeysetPagination.seek_filter(last.created_at, last.pk)
+
+        self.assertIndexed(newest[:51], index='transaction_created_idx')
+        self.assertIndexed(newest.filter(after)[:51], index='transaction_created_idx')
+        self.assertIndexed(newest.filter(user=self.user)[:51], index='transaction_user_created_idx')
+        self.assertIndexed(newest.filter(after, user=self.user)[:51], index='transaction_user_created_idx')
+
+    def test_pending_queues(self):
+        for kind in ('DEPOSIT', 'WITHDRAWAL'):
+            queue = Transaction.objects.filter(status='PENDING', transaction_type=kind)
+            self.assertIndexed(queue.order_by('created_at', 'pk')[:100], index='transaction_queue_idx')
+            self.assertIndexed(queue.order_by('-created_at', '-pk')[:51], index='transaction_queue_idx')
+
+        outbox = CommissionOutbox.objects.filter(status='PENDING', available_at__lte=timezone.now())
+        self.assertIndexed(outbox.order_by('available_at', 'id')[:500], index='commission_outbox_queue_idx')
+
+    def test_dashboard_aggregates(self):
+        totals = (
+            Transaction.objects
+            .filter(user=self.user, transaction_type='DEPOSIT', status='COMPLETED')
+            .values('user')
+            .annotate(total=Sum('amount'))
+        )
+        self.assertIndexed(totals, index='transaction_user_type_idx')
+        commissions = Commission.objects.filter(user=self.user).values('user').annotate(total=Sum('amount'))
+        self.assertIndexed(commissions, index='commission_user_amount_idx')
+
+        dashboard = User.objects.filter(pk=self.user.pk).values(
+            'wallet__balance',
+            'financial_summary__total_earnings',
+            'downline_stats__total',
+        )
+        self.assertIndexed(dashboard)
+
+    def test_referral_paths(self):
+        upline = ReferralPath.objects.filter(descendant=self.user, depth__gte=1).order_by('depth')
+        self.assertIndexed(upline, index='referral_upline_idx')
+        downline = ReferralPath.objects.filter(ancestor=self.users[0], depth__range=(1, 5))
+        self.assertIndexed(downline, index='referral_downline_idx')
+
+
+class ReconciliationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_user(username='admin', email='admin@test.local', is_staff=True)
+        self.users = create_chain(3)
+        Wallet.objects.update(balance=0)
+
+    def reconcile(self, **options):
+        out, err = StringIO(), StringIO()
+        call_command('reconcile_wallets', workers=1, range_size=2, stdout=out, stderr=err, **options)
+        return list(csv.DictReader(StringIO(out.getvalue()))), err.getvalue()
+
+    def test_balances_moved_through_the_api_match_the_ledger(self):
+        better = self.users[-1]
+        deposit = Transaction.objects.create(user=better, amount=Decimal('100'), transaction_type='DEPOSIT')
+        self.client.force_authenticate(self.admin)
+        self.client.post(f'/api/wallet/transactions/{deposit.pk}/approve_deposit/')
+        bets = [
+            {'user': better.pk, 'amount': '10.00'},
+            {'user': better.pk, 'amount': '10.00', 'is_win': True, 'win_amount': '15.00'},
+        ]
+        self.client.post('/api/wallet/transactions/settle_bets/', {'bets': bets}, format='json')
+
+        # A fresh user per request, as in production, so request.user.wallet is never stale
+        self.client.force_authenticate(User.objects.get(pk=better.pk))
+        self.client.post('/api/wallet/transactions/process_bet/', {'amount': '5', 'is_win': True, 'win_amount': '7.5'}, format='json')
+        self.client.post('/api/wallet/transactions/withdrawal_request/', {'amount': '20', 'wallet_address': '0x1'}, format='json')
+        withdrawal = Transaction.objects.get(user=better, transaction_type='WITHDRAWAL')
+        self.client.force_authenticate(self.admin)
+        self.client.post(f'/api/wallet/transactions/{withdrawal.pk}/reject_withdrawal/')
+        self.client.force_authenticate(User.objects.get(pk=better.pk))
+        self.client.post('/api/wallet/transactions/withdrawal_request/', {'amount': '30', 'wallet_address': '0x1'}, format='json')
+
+        self.assertEqual(Wallet.objects.get(user=better).balance, Decimal('67.50'))
+        rows, summary = self.reconcile()
+        self.assertEqual(rows, [])
+        self.assertIn('0 drifted', summary)
+
+    def test_drift_is_reported(self):
+        Wallet.objects.filter(user=self.users[1]).update(balance=Decimal('3.5'))
+        walletless = User.objects.create_user(username='walletless', email='walletless@test.local')
+        Transaction.objects.create(user=walletless, amount=Decimal('2'), transaction_type='COMMISSION', status='COMPLETED')
+        Transaction.objects.create(user=self.users[0], amount=Decimal('9'), transaction_type='DEPOSIT', status='REJECTED')
+
+        rows, summary = self.reconcile()
+
+        self.assertEqual(
+            sorted((int(row['user_id']), row['stored_balance'], row['expected_balance'], row['drift']) for row in rows),
+            [(self.users[1].pk, '3.50000000', '0.00000000', '3.50000000'),
+             (walletless.pk, '', '2.00000000', '-2.00000000')],
+        )
+        self.assertIn('2 drifted', summary)
+        rows, _ = self.reconcile(tolerance='3')
+        self.assertEqual(len(rows), 1)
@@ -2,10 +2,15 @@ from decimal import Decimal
 from rest_framework import viewsets, permissions, status, views
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.conf import settings
-from .models import Wallet, Transaction, SystemSettings
-from .serializers import WalletSerializer, TransactionSerializer, DepositRequestSerializer, WithdrawalRequestSerializer, SystemSettingsSerializer
-from .services import CommissionService
+from django.db import transaction as db_transaction
+from .models import Wallet, Transaction
+from .serializers import (
+    WalletSerializer, TransactionSerializer, DepositRequestSerializer, WithdrawalRequestSerializer,
+    SystemSettingsSerializer, BetResultSerializer, WalletRowSerializer, TransactionRowSerializer
+)
+from .services import BetSettlementService, CommissionOutboxService, TransactionReviewService
+from .pagination import TransactionPagination
+from . import system_settings
 
 class WalletViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
@@ -13,15 +18,15 @@ class WalletViewSet(viewsets.ReadOnlyModelViewSet):
 
     def get_queryset(self):
         return Wallet.objects.filter(user=self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        rows = WalletRowSerializer.values(self.filter_queryset(self.get_queryset()))
+        return Response(WalletRowSerializer.serialize(rows))
     
     @action(detail=False, methods=['get'])
     def admin_wallet_address(self, request):
         """Get admin wallet address for deposits"""
-        try:
-            setting = SystemSettings.objects.get(key='admin_usdt_wallet')
-            address = setting.value
-        except SystemSettings.DoesNotExist:
-            address = settings.ADMIN_USDT_WALLET_ADDRESS
+        address = system_settings.get('admin_usdt_wallet')
             
         return Response({
             'wallet_address': address,
@@ -32,23 +37,8 @@ class WalletViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=False, methods=['get'], permission_classes=[permissions.AllowAny])
     def registration_fee_info(self, request):
         """Get registration fee information"""
-        from decimal import Decimal
-        from .models import SystemSettings
-        
-        # Get registration fee from SystemSettings or use default
-        try:
-            fee_setting = SystemSettings.objects.get(key='registration_fee')
-            registration_fee = Decimal(fee_setting.value)
-        except SystemSettings.DoesNotExist:
-            # Default registration fee
-            registration_fee = Decimal('10.00')
-            
-        # Get admin wallet from SystemSettings or use settings default
-        try:
-            wallet_setting = SystemSettings.objects.get(key='admin_usdt_wallet')
-            admin_wallet = wallet_setting.value
-        except SystemSettings.DoesNotExist:
-            admin_wallet = settings.ADMIN_USDT_WALLET_ADDRESS
+        registration_fee = system_settings.get_decimal('registration_fee')
+        admin_wallet = system_settings.get('admin_usdt_wallet')
         
         return Response({
             'registration_fee': str(registration_fee),
@@ -60,6 +50,7 @@ class WalletViewSet(viewsets.ReadOnlyModelViewSet):
 class TransactionViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = TransactionSerializer
+    pagination_class = TransactionPagination
 
     def get_queryset(self):
         # Admin sees all transactions, users see only their own
@@ -69,6 +60,12 @@ class TransactionViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        # Read-only fast path: .values() rows with precompiled converters instead of model instances
+        rows = TransactionRowSerializer.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        return self.get_paginated_response(TransactionRowSerializer.serialize(page))
     
     @action(detail=False, methods=['post'])
     def deposit_request(self, request):
@@ -140,125 +137,137 @@ class TransactionViewSet(viewsets.ModelViewSet):
         except ValueError:
             return Response({'error': 'Invalid amount'}, status=status.HTTP_400_BAD_REQUEST)
             
-        wallet = request.user.wallet
-        if wallet.balance < Decimal(str(amount)):
-            return Response({'error': 'Insufficient balance'}, status=status.HTTP_400_BAD_REQUEST)
-            
-        # 1. Deduct Bet Amount
-        wallet.balance -= Decimal(str(amount))
-        wallet.save()
-        
-        if not is_win:
-            # LOSS: Distribute commissions
-            Transaction.objects.create(
-                user=request.user,
-                amount=amount,
-                transaction_type='BET_LOSS',
-                status='COMPLETED',
-                description=f"Bet Loss: {amount} USDT"
-            )
-            
-            CommissionService.process_bet_loss(request.user, amount)
-            
-            return Response({
-                'message': 'Bet processed (Loss)',
-                'new_balance': wallet.balance,
-                'result': 'LOSS'
-            })
-        else:
-            # WIN: Credit win amount
-            wallet.balance += Decimal(str(win_amount))
+        with db_transaction.atomic():
+            wallet = Wallet.objects.select_for_update().get(user=request.user)
+            if wallet.balance < Decimal(str(amount)):
+                return Response({'error': 'Insufficient balance'}, status=status.HTTP_400_BAD_REQUEST)
+                
+            # 1. Deduct Bet Amount
+            wallet.balance -= Decimal(str(amount))
             wallet.save()
             
-            Transaction.objects.create(
-                user=request.user,
-                amount=win_amount,
-                transaction_type='BET_WIN',
-                status='COMPLETED',
-                description=f"Bet Win: {win_amount} USDT"
-            )
-            
+            if not is_win:
+                # LOSS: Queue commission distribution for the outbox worker
+                Transaction.objects.create(
+                    user=request.user,
+                    amount=amount,
+                    transaction_type='BET_LOSS',
+                    status='COMPLETED',
+                    description=f"Bet Loss: {amount} USDT"
+                )
+                
+                CommissionOutboxService.enqueue(request.user, amount)
+                
+                return Response({
+                    'message': 'Bet processed (Loss)',
+                    'new_balance': wallet.balance,
+                    'result': 'LOSS'
+                })
+            else:
+                # WIN: Credit win amount
+                wallet.balance += Decimal(str(win_amount))
+                wallet.save()
+                
+                # Record the stake too, so the ledger adds up to the balance
+                Transaction.objects.bulk_create([
+                    Transaction(
+                        user=request.user,
+                        amount=amount,
+                        transaction_type='BET_STAKE',
+                        status='COMPLETED',
+                        description=f"Bet Stake: {amount} USDT"
+                    ),
+                    Transaction(
+                        user=request.user,
+                        amount=win_amount,
+                        transaction_type='BET_WIN',
+                        status='COMPLETED',
+                        description=f"Bet Win: {win_amount} USDT"
+                    ),
+                ])
+                
+                return Response({
+                    'message': 'Bet processed (Win)',
+                    'new_balance': wallet.balance,
+                    'result': 'WIN'
+                })
+    
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAdminUser])
+    def settle_bets(self, request):
+        """Settle a batch of bet results (game backend): {"bets": [{"user", "amount", "is_win", "win_amount"}, ...]}"""
+        bets = request.data.get('bets')
+        if not isinstance(bets, list) or not bets:
+            return Response({'error': 'A non-empty list of bets is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(bets) > BetSettlementService.MAX_BATCH_SIZE:
             return Response({
-                'message': 'Bet processed (Win)',
-                'new_balance': wallet.balance,
-                'result': 'WIN'
-            })
+                'error': f'At most {BetSettlementService.MAX_BATCH_SIZE} bets per batch'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        results = [None] * len(bets)
+        valid = []
+        positions = []
+        for index, item in enumerate(bets):
+            serializer = BetResultSerializer(data=item)
+            if serializer.is_valid():
+                data = serializer.validated_data
+                valid.append({
+                    'user_id': data['user'],
+                    'amount': data['amount'],
+                    'is_win': data['is_win'],
+                    'win_amount': data['win_amount']
+                })
+                positions.append(index)
+            else:
+                results[index] = {'index': index, 'status': 'error', 'error': serializer.errors}
+        
+        if valid:
+            for index, result in zip(positions, BetSettlementService.settle(valid)):
+                results[index] = {'index': index, **result}
+        
+        return Response({
+            'settled': sum(1 for result in results if result['status'] == 'ok'),
+            'failed': sum(1 for result in results if result['status'] == 'error'),
+            'results': results
+        })
     
-    @action(detail=True, methods=['post'], permission_classes=[permissions.IsAdminUser])
-    def approve_deposit(self, request, pk=None):
-        """Admin approves deposit and credits wallet"""
+    def review_one(self, request, transaction_type, approve):
+        """Approve or reject one pending transaction of `transaction_type` through TransactionReviewService"""
         transaction = self.get_object()
         
-        if transaction.transaction_type != 'DEPOSIT':
-            return Response({'error': 'Not a deposit'}, status=status.HTTP_400_BAD_REQUEST)
+        if transaction.transaction_type != transaction_type:
+            return Response({'error': f'Not a {transaction_type.lower()}'}, status=status.HTTP_400_BAD_REQUEST)
         
-        if transaction.status != 'PENDING':
+        # Same locked path as the admin endpoints, so concurrent reviews cannot credit twice
+        result = TransactionReviewService.review([transaction.pk], request.user, approve)
+        if not result['processed']:
             return Response({'error': 'Already processed'}, status=status.HTTP_400_BAD_REQUEST)
         
-        transaction.status = 'COMPLETED'
-        transaction.save()
-        
-        wallet, _ = Wallet.objects.get_or_create(user=transaction.user)
-        wallet.balance += transaction.amount
-        wallet.save()
-        
-        return Response({'message': 'Deposit approved', 'new_balance': wallet.balance})
+        verb = 'approved' if approve else 'rejected'
+        return Response({
+            'message': f'{transaction_type.capitalize()} {verb}',
+            'processed_ids': result['processed'],
+            'new_balance': Wallet.objects.filter(user_id=transaction.user_id).values_list('balance', flat=True).first()
+        })
+    
+    @action(detail=True, methods=['post'], permission_classes=[permissions.IsAdminUser])
+    def approve_deposit(self, request, pk=None):
+        """Admin approves deposit and credits wallet"""
+        return self.review_one(request, 'DEPOSIT', approve=True)
     
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAdminUser])
     def reject_deposit(self, request, pk=None):
         """Admin rejects deposit"""
-        transaction = self.get_object()
-        
-        if transaction.transaction_type != 'DEPOSIT':
-            return Response({'error': 'Not a deposit'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        if transaction.status != 'PENDING':
-            return Response({'error': 'Already processed'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        transaction.status = 'REJECTED'
-        transaction.save()
-        
-        return Response({'message': 'Deposit rejected'})
+        return self.review_one(request, 'DEPOSIT', approve=False)
     
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAdminUser])
     def approve_withdrawal(self, request, pk=None):
         """Admin approves withdrawal - balance already deducted"""
-        transaction = self.get_object()
-        
-        if transaction.transaction_type != 'WITHDRAWAL':
-            return Response({'error': 'Not a withdrawal'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        if transaction.status != 'PENDING':
-            return Response({'error': 'Already processed'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        transaction.status = 'COMPLETED'
-        transaction.save()
-        
-        return Response({'message': 'Withdrawal approved'})
+        return self.review_one(request, 'WITHDRAWAL', approve=True)
     
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAdminUser])
     def reject_withdrawal(self, request, pk=None):
         """Admin rejects withdrawal and refunds balance"""
-        transaction = self.get_object()
-        
-        if transaction.transaction_type != 'WITHDRAWAL':
-            return Response({'error': 'Not a withdrawal'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        if transaction.status != 'PENDING':
-            return Response({'error': 'Already processed'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        transaction.status = 'REJECTED'
-        transaction.save()
-        
-        # Refund the amount back to user's wallet
-        wallet = Wallet.objects.get(user=transaction.user)
-        wallet.balance += transaction.amount
-        wallet.save()
-        
-        return Response({
-            'message': 'Withdrawal rejected and refunded',
-            'new_balance': wallet.balance
-        }, status=status.HTTP_200_OK)
+        return self.review_one(request, 'WITHDRAWAL', approve=False)
 
 class SystemSettingsView(views.APIView):
     """Get and update system settings"""
@@ -273,31 +282,15 @@ class SystemSettingsView(views.APIView):
             'deposit_instructions',
             'registration_fee'
         ]
+        values = system_settings.get_all()
         settings_data = {}
         
         for key in settings_keys:
-            try:
-                setting = SystemSettings.objects.get(key=key)
-                # Map admin_usdt_wallet to admin_wallet_address for frontend consistency
-                if key == 'admin_usdt_wallet':
-                     settings_data['admin_wallet_address'] = setting.value
-                else:
-                     settings_data[key] = setting.value
-            except SystemSettings.DoesNotExist:
-                # Default values
-                defaults = {
-                    'admin_usdt_wallet': 'TXYZabc123...',
-                    'usdt_network': 'BEP-20 (Binance Smart Chain)',
-                    'min_deposit': '10.00',
-                    'registration_fee': '10.00',
-                    'deposit_instructions': 'Please send USDT to the address above and submit your transaction hash.'
-                }
-                
-                val = defaults.get(key, '')
-                if key == 'admin_usdt_wallet':
-                    settings_data['admin_wallet_address'] = val
-                else:
-                    settings_data[key] = val
+            # Map admin_usdt_wallet to admin_wallet_address for frontend consistency
+            if key == 'admin_usdt_wallet':
+                settings_data['admin_wallet_address'] = values[key]
+            else:
+                settings_data[key] = values[key]
         
         return Response(settings_data, status=status.HTTP_200_OK)
     
@@ -310,22 +303,18 @@ class SystemSettingsView(views.APIView):
         serializer.is_valid(raise_exception=True)
         
         updated_settings = []
-        updated_settings = []
+        values = {}
         for key, value in serializer.validated_data.items():
             db_key = key
             if key == 'admin_wallet_address':
                 db_key = 'admin_usdt_wallet'
                 
             if value is not None:
-                setting, created = SystemSettings.objects.update_or_create(
-                    key=db_key,
-                    defaults={
-                        'value': str(value),
-                        'updated_by': request.user
-                    }
-                )
+                values[db_key] = value
                 updated_settings.append(key)
         
+        system_settings.update(values, user=request.user)
+        
         return Response({
             'message': 'Settings updated successfully',
             'updated': updated_settings